@@ -0,0 +1,252 @@
+"""
+Builds the per-session behavior feature table (feature_store 'behavior_features') from raw
+behavior_log_*.csv files.
+
+Every step is a grouped NumPy/pandas operation over the whole event table, so there
+is no per-row or per-session Python loop. Sessions come from the crawler's session_id
+column. Older logs without it are split on page_visit events, one session per visit.
+
+session_id_group is '<run name>:<session id>' (e.g. '20250516_003222:7'), so the same crawl
+session gets the same id here and in network_features.py.
+
+Usage:
+    python behavior_features.py [behavior_log.csv | folder ...] [-o features.csv]
+    python behavior_features.py --benchmark [num_rows]
+"""
+import argparse
+import glob
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+import feature_store
+LOG_FOLDER = "behavior_data"
+FEATURE_TABLE = "behavior_features" # feature_store table
+SESSIONS_PER_RUN = 100000 # Session ids are positions in a site list, far below this
+
+BEHAVIOR_FEATURE_COLUMNS = [
+    'session_id_group', 'session_start_url', 'num_total_events', 'num_page_visits', 'num_clicks',
+    'num_mouse_moves', 'num_mouse_moves_to_element', 'num_errors', 'session_duration_seconds',
+    'avg_time_between_clicks', 'total_mouse_dist_approx', 'avg_mouse_speed_approx',
+    'num_unique_element_tags', 'entropy_element_tags', 'num_a_tags_interacted',
+    'num_button_tags_interacted', 'num_input_tags_interacted', 'num_unique_urls_in_session',
+    'navigated_away_from_start_url', 'num_error_click_intercepted', 'num_error_no_clickables_found',
+    'num_error_http_read_timeout'
+]
+
+# Substrings of the error 'details' column counted as specific error types
+ERROR_PATTERNS = {
+    'num_error_click_intercepted': 'click intercepted',
+    'num_error_no_clickables_found': 'Could not find clickables',
+    'num_error_http_read_timeout': 'Read timed out',
+}
+NO_TAG_VALUES = ['N/A', 'Error retrieving tag']
+
+
+def log_run_name(path, prefix):
+    """'behavior_data/behavior_log_20250516_003222.csv' -> '20250516_003222' (shard suffix included)."""
+    name = os.path.basename(path)
+    if name.startswith(prefix):
+        name = name[len(prefix):]
+    return os.path.splitext(name)[0]
+
+
+def session_keys_for(run_index, session_ids):
+    """Integer session keys used while grouping: run_index * SESSIONS_PER_RUN + session id."""
+    return run_index * SESSIONS_PER_RUN + np.asarray(session_ids, dtype=np.int64)
+
+
+def session_group_labels(session_keys, run_names):
+    """Turns integer session keys back into '<run name>:<session id>' labels."""
+    session_keys = np.asarray(session_keys, dtype=np.int64)
+    runs = np.asarray(run_names, dtype=object)[session_keys // SESSIONS_PER_RUN]
+    return runs + ':' + (session_keys % SESSIONS_PER_RUN).astype(str).astype(object)
+
+
+def find_logs(inputs, prefix):
+    """Expands folders to their <prefix>*.csv files; keeps explicit file paths as given."""
+    paths = []
+    for item in inputs:
+        if os.path.isdir(item):
+            paths.extend(sorted(glob.glob(os.path.join(item, f"{prefix}*.csv"))))
+        else:
+            paths.append(item)
+    return paths
+
+
+def load_behavior_log(path, run_index=0):
+    """Reads one behavior log and adds an integer 'session_key' column (see session_keys_for)."""
+    df = pd.read_csv(path, dtype={'url': 'category', 'event_type': 'category', 'element_tag': 'category', 'details': str},
+                     na_values=['N/A'], keep_default_na=False)
+    df['timestamp'] = pd.to_datetime(df['timestamp'], format='ISO8601', errors='coerce')
+    if 'session_id' in df.columns:
+        session_ids = pd.to_numeric(df['session_id'], errors='coerce')
+    else:
+        # Pre-pool logs: a session starts at every page_visit
+        session_ids = (df['event_type'] == 'page_visit').cumsum()
+        session_ids = session_ids.where(session_ids > 0)
+    df = df[session_ids.notna().to_numpy()]
+    df['session_key'] = session_keys_for(run_index, session_ids.dropna().to_numpy())
+    return df
+
+
+def extract_behavior_features(events, run_names):
+    """
+    Computes one row of BEHAVIOR_FEATURE_COLUMNS per session from a behavior event table
+    with columns session_key, timestamp, url, event_type, pos_x, pos_y, element_tag, details.
+    `run_names[i]` is the run whose logs were loaded with run_index i.
+    """
+    timestamps = pd.to_datetime(events['timestamp'], format='ISO8601', errors='coerce') # no-op if already parsed
+    # Batched mouse events are logged after the rows around them, so order by time within each session
+    order = np.lexsort((timestamps.to_numpy(), events['session_key'].to_numpy()))
+    events = events.iloc[order].reset_index(drop=True)
+    t = timestamps.to_numpy()[order].astype('datetime64[ns]')
+    t = np.where(np.isnat(t), np.nan, t.astype(np.int64) / 1e9)
+
+    session_keys, g = np.unique(events['session_key'].to_numpy(), return_inverse=True)
+    n = len(session_keys)
+    first_row = np.r_[0, np.flatnonzero(np.diff(g)) + 1] # rows are sorted by session
+
+    def count(mask):
+        return np.bincount(g, weights=mask, minlength=n).astype(np.int64)
+
+    type_codes, type_names = pd.factorize(events['event_type'])
+    type_names = list(type_names)
+
+    def is_type(name):
+        return type_codes == (type_names.index(name) if name in type_names else -2)
+
+    is_click = is_type('click')
+    is_error = is_type('error')
+
+    features = pd.DataFrame({'session_id_group': session_group_labels(session_keys, run_names)})
+    features['session_start_url'] = events['url'].to_numpy()[first_row]
+    features['num_total_events'] = np.bincount(g, minlength=n)
+    features['num_page_visits'] = count(is_type('page_visit'))
+    features['num_clicks'] = count(is_click)
+    features['num_mouse_moves'] = count(is_type('mouse_move'))
+    features['num_mouse_moves_to_element'] = count(is_type('mouse_move_to_element'))
+    features['num_errors'] = count(is_error)
+
+    # fmin/fmax skip NaN, i.e. rows with unparseable timestamps
+    duration = np.nan_to_num(np.fmax.reduceat(t, first_row) - np.fmin.reduceat(t, first_row))
+    features['session_duration_seconds'] = np.round(duration, 3)
+
+    # Mean gap between consecutive clicks == (last click - first click) / (clicks - 1)
+    click_t = np.where(is_click, t, np.nan)
+    click_min = np.fmin.reduceat(click_t, first_row)
+    click_max = np.fmax.reduceat(click_t, first_row)
+    num_clicks = features['num_clicks'].to_numpy()
+    with np.errstate(invalid='ignore', divide='ignore'):
+        features['avg_time_between_clicks'] = np.nan_to_num(np.where(num_clicks > 1, (click_max - click_min) / (num_clicks - 1), 0.0))
+
+    # Distance between consecutive positioned events (mouse moves, hovers, clicks)
+    pos_x = pd.to_numeric(events['pos_x'], errors='coerce').to_numpy(dtype=float)
+    pos_y = pd.to_numeric(events['pos_y'], errors='coerce').to_numpy(dtype=float)
+    has_pos = ~(np.isnan(pos_x) | np.isnan(pos_y))
+    pg, px, py = g[has_pos], pos_x[has_pos], pos_y[has_pos]
+    step = np.hypot(np.diff(px), np.diff(py))
+    same_session = pg[1:] == pg[:-1]
+    total_dist = np.bincount(pg[1:][same_session], weights=step[same_session], minlength=n)
+    features['total_mouse_dist_approx'] = total_dist
+    with np.errstate(invalid='ignore', divide='ignore'):
+        features['avg_mouse_speed_approx'] = np.where(duration > 0, total_dist / duration, 0.0)
+
+    # Element tags: factorize once, then counts per (session, tag) and Shannon entropy (natural log)
+    raw_codes, raw_names = pd.factorize(events['element_tag'])
+    lower_codes, tag_names = pd.factorize(pd.Index(raw_names).str.lower())
+    lower_codes[pd.Index(raw_names).isin(NO_TAG_VALUES)] = -1
+    tag_codes = np.where(raw_codes >= 0, lower_codes[raw_codes], -1)
+    has_tag = tag_codes >= 0
+    pair_keys, pair_counts = np.unique(g[has_tag].astype(np.int64) * len(tag_names) + tag_codes[has_tag], return_counts=True)
+    pair_session = pair_keys // max(len(tag_names), 1)
+    tagged_events = np.bincount(pair_session, weights=pair_counts, minlength=n)
+    p = pair_counts / tagged_events[pair_session]
+    features['num_unique_element_tags'] = np.bincount(pair_session, minlength=n)
+    features['entropy_element_tags'] = np.abs(np.bincount(pair_session, weights=-p * np.log(p), minlength=n))
+    for tag in ('a', 'button', 'input'):
+        features[f'num_{tag}_tags_interacted'] = count(np.isin(tag_codes, np.flatnonzero(tag_names == tag)))
+
+    url_codes = pd.factorize(events['url'])[0]
+    has_url = url_codes >= 0
+    unique_pairs = np.unique(g[has_url].astype(np.int64) * (url_codes.max() + 1) + url_codes[has_url])
+    features['num_unique_urls_in_session'] = np.bincount(unique_pairs // (url_codes.max() + 1), minlength=n)
+    features['navigated_away_from_start_url'] = count(has_url & (url_codes != url_codes[first_row][g])).clip(max=1)
+
+    # Only error rows carry error details worth matching
+    error_rows = np.flatnonzero(is_error)
+    error_details = events['details'].iloc[error_rows].fillna('')
+    for column, pattern in ERROR_PATTERNS.items():
+        matches = error_rows[error_details.str.contains(pattern, regex=False).to_numpy()]
+        features[column] = np.bincount(g[matches], minlength=n).astype(float)
+
+    return features[BEHAVIOR_FEATURE_COLUMNS]
+
+
+def build_behavior_features(paths):
+    """Loads the given behavior logs and returns their session features."""
+    run_names = [log_run_name(path, 'behavior_log_') for path in paths]
+    logs = [load_behavior_log(path, run_index) for run_index, path in enumerate(paths)]
+    logs = [df for df in logs if not df.empty]
+    if not logs:
+        return pd.DataFrame(columns=BEHAVIOR_FEATURE_COLUMNS)
+    return extract_behavior_features(pd.concat(logs, ignore_index=True), run_names)
+
+
+def synthetic_behavior_log(num_rows, events_per_session=40, seed=0):
+    """A behavior event table shaped like load_behavior_log() output, for benchmarking."""
+    rng = np.random.default_rng(seed)
+    num_sessions = max(1, num_rows // events_per_session)
+    session = np.sort(rng.integers(1, num_sessions + 1, num_rows))
+    event_types = ['mouse_move', 'mouse_move_to_element', 'click', 'error', 'page_visit']
+    type_codes = rng.choice(len(event_types), num_rows, p=[0.7, 0.12, 0.1, 0.03, 0.05])
+    start = np.datetime64('2025-05-16T00:00:00', 'ms') + session * 60000
+    positioned = type_codes != 4
+    tagged = (type_codes == 1) | (type_codes == 2)
+    is_error = type_codes == 3
+    details = pd.Series(np.nan, index=range(num_rows), dtype=object)
+    details[is_error] = rng.choice(['element click intercepted', 'Read timed out', 'other'], is_error.sum())
+    return pd.DataFrame({
+        'session_key': session_keys_for(0, session),
+        'timestamp': start + rng.integers(0, 60000, num_rows),
+        'url': pd.Categorical.from_codes(session % 500, [f'https://example.com/page/{i}' for i in range(500)]),
+        'event_type': pd.Categorical.from_codes(type_codes, event_types),
+        'pos_x': np.where(positioned, rng.integers(0, 1366, num_rows), np.nan),
+        'pos_y': np.where(positioned, rng.integers(0, 900, num_rows), np.nan),
+        'element_tag': pd.Categorical.from_codes(np.where(tagged, rng.integers(0, 4, num_rows), -1),
+                                                 ['a', 'button', 'input', 'div']),
+        'details': details,
+    })
+
+
+def benchmark(num_rows=10_000_000):
+    """Times extract_behavior_features on synthetic events (timestamps pre-parsed, as the loader returns them)."""
+    events = synthetic_behavior_log(num_rows)
+    start = time.perf_counter()
+    features = extract_behavior_features(events, ['20250516_000000'])
+    elapsed = time.perf_counter() - start
+    print(f"{num_rows:,} events -> {len(features):,} sessions in {elapsed:.2f}s "
+          f"({num_rows / elapsed:,.0f} events/s)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build per-session behavior features from behavior logs.")
+    parser.add_argument('inputs', nargs='*', default=[LOG_FOLDER], help="Behavior log files or folders.")
+    parser.add_argument('-o', '--output', help="Write a CSV file instead of the feature store table.")
+    parser.add_argument('--benchmark', nargs='?', type=int, const=10_000_000, metavar='NUM_ROWS',
+                        help="Time the extractor on synthetic events instead.")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        benchmark(args.benchmark)
+    else:
+        log_paths = find_logs(args.inputs, 'behavior_log_')
+        df_features = build_behavior_features(log_paths)
+        if args.output:
+            df_features.to_csv(args.output, index=False)
+        else:
+            feature_store.write_table(df_features, FEATURE_TABLE)
+        print(f"Built features for {len(df_features)} sessions from {len(log_paths)} log files.")
+        print(f"Behavior features saved to: {args.output or feature_store.table_folder(FEATURE_TABLE)}")
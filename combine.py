@@ -1,75 +1,73 @@
+import argparse
+
 import pandas as pd
 
-# Load the datasets
-df_network = pd.read_csv('session_network_features.csv')
-df_behavior = pd.read_csv('session_behavior_features.csv')
+import feature_store
+from feature_merge import merge_features, merge_features_partitioned
+
+# Rows of behavior features probed against the network hash index at a time.
+# The merged output is written chunk by chunk, so memory stays bounded by this.
+CHUNK_SIZE = 500_000
 
-print("--- Initial Shapes ---")
-print(f"Network features shape: {df_network.shape}")
-print(f"Behavior features shape: {df_behavior.shape}")
+parser = argparse.ArgumentParser(description="Merge the behavior and network feature tables.")
+parser.add_argument('--partitions', type=int, default=0,
+                    help="Hash-partition both tables to disk into this many partitions and merge one at a time, "
+                         "for tables that do not fit in memory (0 = merge in memory; output keeps behavior order).")
+parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help="Rows read/probed at a time.")
+args = parser.parse_args()
 
-# Before merging, it's good to check for potential issues:
-# 1. Are there duplicate 'session_start_url's in df_network?
-#    If yes, merging might create more rows than in df_behavior if one behavioral
-#    session's URL matches multiple network entries (this would be unusual if
-#    df_network is already summarized per URL).
-print(f"\nNumber of unique session_start_url in df_network: {df_network['session_start_url'].nunique()}")
-if df_network['session_start_url'].duplicated().any():
-    print("Warning: df_network contains duplicate 'session_start_url's. Review how network data is summarized.")
-    # Example: df_network[df_network['session_start_url'].duplicated(keep=False)].sort_values('session_start_url')
+# Left join: keep every behavioral session and add its network features.
+# Sessions are matched on 'session_id_group' when the network features carry it (logs with
+# session ids), otherwise on a normalized 'session_start_url' key, so trailing slashes,
+# 'www.' or query-string differences no longer leave the network columns empty.
+# Duplicate network rows for the same key are aggregated first, so the join never fans out
+# (see feature_merge.py for the normalization and aggregation rules).
+written_parts = []
 
-# 2. Are there duplicate 'session_start_url's in df_behavior associated with *different* session_id_group?
-#    This is fine, as session_id_group is the unique session identifier.
-#    If 'session_start_url' itself was the unique key in df_behavior, duplicates would be an issue.
-print(f"Number of unique session_start_url in df_behavior: {df_behavior['session_start_url'].nunique()}")
-print(f"Number of unique session_id_group in df_behavior: {df_behavior['session_id_group'].nunique()}")
+def write_chunk(chunk):
+    if not written_parts:
+        written_parts.append(feature_store.write_table(chunk, 'merged'))
+    else:
+        written_parts.append(feature_store.append_table(chunk, 'merged'))
 
+if args.partitions > 0:
+    # Out of core: both tables are streamed from the store, so neither is loaded whole
+    print(f"--- Partitioned merge ({args.partitions} partitions, chunks of {args.chunk_size} rows) ---")
+    report = merge_features_partitioned(feature_store.iter_table('behavior_features', chunk_size=args.chunk_size),
+                                        feature_store.iter_table('network_features', chunk_size=args.chunk_size),
+                                        write_chunk, partitions=args.partitions, chunk_size=args.chunk_size)
+    merged_columns = feature_store.IDENTIFIER_COLUMNS + list(feature_store.BEHAVIOR_SCHEMA) + list(feature_store.NETWORK_SCHEMA)
+else:
+    # Load the datasets (typed tables from the feature store; see feature_store.py). The storage
+    # dtypes are kept: the merged table is stored again, so it must not go through the float32
+    # model-input dtypes of load_features()
+    df_network = feature_store.read_table('network_features')
+    df_behavior = feature_store.read_table('behavior_features')
 
-# Perform a left merge:
-# Keep all rows from df_behavior (left)
-# Add columns from df_network (right) where 'session_start_url' matches.
-# If a 'session_start_url' in df_behavior doesn't exist in df_network,
-# the new columns from df_network will have NaN (Not a Number) values for that row.
-df_merged = pd.merge(
-    df_behavior,
-    df_network,
-    on='session_start_url',  # The column to merge on
-    how='left'               # Type of merge
-)
+    print("--- Initial Shapes ---")
+    print(f"Network features shape: {df_network.shape}")
+    print(f"Behavior features shape: {df_behavior.shape}")
 
-print("\n--- Shape After Merge ---")
-print(f"Merged dataframe shape: {df_merged.shape}")
+    _, report = merge_features(df_behavior, df_network, write_chunk=write_chunk, chunk_size=args.chunk_size)
+    merged_columns = list(df_behavior.columns) + [
+        c for c in df_network.columns if c not in ('session_id_group', 'session_start_url')]
+if not written_parts: # No behavior sessions at all; still replace the old table
+    write_chunk(pd.DataFrame(columns=merged_columns))
 
-# Check the result
-print("\n--- First 5 rows of merged data ---")
-print(df_merged.head())
+print("\n--- Merge Report ---")
+print(report.summary())
 
 # Check for NaNs in columns that came from df_network.
 # This will tell you if any behavioral sessions didn't have a matching network entry.
 print("\n--- NaN counts in merged data (especially network columns) ---")
-# Pick a column that should definitely exist if the network data was merged successfully
-# For example: 'net_total_requests_logged'
-nan_in_network_col = df_merged['net_total_requests_logged'].isnull().sum()
-if nan_in_network_col > 0:
-    print(f"Warning: {nan_in_network_col} behavioral sessions did not have matching network data based on 'session_start_url'.")
+if report.unmatched > 0:
+    print(f"Warning: {report.unmatched} behavioral sessions did not have matching network data.")
     print("These rows will have NaN for network features.")
-    # You can inspect these rows:
-    # print(df_merged[df_merged['net_total_requests_logged'].isnull()])
 else:
     print("All behavioral sessions successfully found matching network data.")
 
 # You can also check the general NaN summary
 print("\nOverall NaN counts per column in merged data:")
-print(df_merged.isnull().sum())
-
-# Verify if session_id_group is still the unique identifier for rows
-if df_merged['session_id_group'].is_unique:
-    print("\n'session_id_group' is still unique in the merged DataFrame.")
-else:
-    print("\nWarning: 'session_id_group' is NOT unique in the merged DataFrame. This might indicate an issue if df_network had multiple entries for the same session_start_url, leading to a one-to-many merge.")
-    # If this happens, you might need to aggregate df_network by 'session_start_url' before merging,
-    # or re-evaluate the uniqueness of your keys.
+print(report.null_counts)
 
-output_filename = "merged_behavior_network_data.csv"
-df_merged.to_csv(output_filename, index=False)
-print(f"\n--- Merged data saved to {output_filename} ---")
\ No newline at end of file
+print(f"\n--- Merged data saved to {feature_store.table_folder('merged')} ({len(written_parts)} part(s)) ---")
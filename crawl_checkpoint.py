@@ -0,0 +1,131 @@
+"""
+Append-only checkpoint journal for resumable crawls.
+
+Each crawl run gets a crawl_checkpoint_<timestamp>.jsonl journal next to its logs.
+It records which behavior/network log files the run writes to, plus one line when
+a site starts and one when it finishes. Each of those lines holds the byte offsets
+the logs had been flushed to at that moment. A resumed run reads the journal,
+skips the finished sites, cleans up rows left behind by sites that were in progress,
+and keeps appending to the same log files.
+"""
+import csv
+import glob
+import io
+import json
+import os
+import threading
+from datetime import datetime
+
+CHECKPOINT_PREFIX = "crawl_checkpoint_"
+
+
+class CrawlCheckpoint:
+
+    def __init__(self, path):
+        self.path = path
+        self.behavior_log = None
+        self.network_log = None
+        self.completed = {} # session_id -> url
+        self.started = {} # session_id -> (behavior_offset, network_offset)
+        self.last_offsets = (0, 0)
+        self._lock = threading.Lock()
+        if os.path.isfile(path):
+            self._load()
+
+    @classmethod
+    def latest(cls, folder, run_suffix=""):
+        """
+        The most recent journal in `folder` whose run name ends in `run_suffix`
+        (e.g. '_shard2of4'), or None. The default only matches unsharded runs.
+        """
+        journals = sorted(
+            path for path in glob.glob(os.path.join(folder, f"{CHECKPOINT_PREFIX}*.jsonl"))
+            # Run names are '<YYYYmmdd_HHMMSS><run_suffix>'
+            if os.path.basename(path)[len(CHECKPOINT_PREFIX) + 15:-len('.jsonl')] == run_suffix
+        )
+        return cls(journals[-1]) if journals else None
+
+    @classmethod
+    def for_run(cls, folder, run_name):
+        return cls(os.path.join(folder, f"{CHECKPOINT_PREFIX}{run_name}.jsonl"))
+
+    def _load(self):
+        with open(self.path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    break # Torn last line from a crash; everything before it is valid
+                kind = record.get('type')
+                if kind == 'run':
+                    self.behavior_log = record['behavior_log']
+                    self.network_log = record['network_log']
+                elif kind == 'site_start':
+                    self.started[record['session_id']] = tuple(record['offsets'])
+                elif kind == 'site_done':
+                    self.completed[record['session_id']] = record['url']
+                    self.started.pop(record['session_id'], None)
+                elif kind == 'resume':
+                    # Unfinished sites were cleaned out of the logs, which may now be shorter
+                    self.started = {}
+                    self.last_offsets = tuple(record['offsets'])
+                    continue
+                if 'offsets' in record:
+                    self.last_offsets = tuple(max(a, b) for a, b in zip(self.last_offsets, record['offsets']))
+
+    def _append(self, record):
+        record['time'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        with self._lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+
+    def start_run(self, behavior_log, network_log):
+        self.behavior_log, self.network_log = behavior_log, network_log
+        self._append({'type': 'run', 'behavior_log': behavior_log, 'network_log': network_log})
+
+    def mark_started(self, session_id, url, offsets):
+        self.started[session_id] = tuple(offsets)
+        self._append({'type': 'site_start', 'session_id': session_id, 'url': url, 'offsets': list(offsets)})
+
+    def mark_done(self, session_id, url, offsets):
+        self.completed[session_id] = url
+        self.started.pop(session_id, None)
+        self._append({'type': 'site_done', 'session_id': session_id, 'url': url, 'offsets': list(offsets)})
+
+    def is_done(self, session_id, url):
+        return self.completed.get(session_id) == url
+
+    def repair_logs(self):
+        """
+        Drops rows written after the last checkpoint and rows of sites that never
+        finished, so the resumed run can re-crawl those sites under the same session ids.
+        Only the tail of each log (from the earliest unfinished site's start offset) is rewritten.
+        """
+        for i, path in enumerate((self.behavior_log, self.network_log)):
+            if self.started:
+                keep_until = min(offsets[i] for offsets in self.started.values())
+            else:
+                keep_until = self.last_offsets[i]
+            _filter_log_tail(path, keep_until, self.last_offsets[i], set(self.completed))
+        self.started = {}
+        self.last_offsets = (os.path.getsize(self.behavior_log), os.path.getsize(self.network_log))
+        self._append({'type': 'resume', 'offsets': list(self.last_offsets)})
+
+
+def _filter_log_tail(path, keep_until, tail_end, completed_session_ids):
+    """Truncates `path` to `keep_until` bytes, then re-appends rows from [keep_until, tail_end) of finished sessions."""
+    with open(path, 'rb+') as f:
+        f.seek(keep_until)
+        tail = f.read(max(0, tail_end - keep_until))
+        f.seek(keep_until)
+        f.truncate()
+
+    kept_rows = [
+        row for row in csv.reader(io.StringIO(tail.decode('utf-8'), newline=''))
+        if row and row[0].isdigit() and int(row[0]) in completed_session_ids
+    ]
+    if kept_rows:
+        with open(path, 'a', newline='', encoding='utf-8') as f:
+            csv.writer(f).writerows(kept_rows)
@@ -0,0 +1,145 @@
+"""
+Cross-validation with a single fit per fold.
+
+sklearn's cross_val_score() refits the model for every scoring metric. Here each fold is
+fitted once, all metrics are computed from that fold's predictions, and the class-1
+probabilities of every fold are gathered into one out-of-fold vector for ROC-AUC and
+PR-AUC. Folds are fitted in a process pool. X and y reach each worker once, through the
+pool initializer, rather than being pickled with every fold.
+
+Also holds append_run_log(), which adds one row to a run-summary CSV such as
+trains_output/training_runs_summary.csv and widens its header when new columns appear.
+"""
+import csv
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from sklearn.base import clone
+from sklearn.metrics import (accuracy_score, average_precision_score, f1_score, precision_score,
+                             recall_score, roc_auc_score)
+
+from scoring_service import predict_with_proba
+
+FOLD_METRICS = {
+    'accuracy': accuracy_score,
+    'precision': lambda y_true, y_pred: precision_score(y_true, y_pred, zero_division=0), # class 1
+    'recall': lambda y_true, y_pred: recall_score(y_true, y_pred, zero_division=0),
+    'f1': lambda y_true, y_pred: f1_score(y_true, y_pred, zero_division=0),
+}
+
+_data = {} # Per-process X, y and extras, set by init_worker()
+
+
+def init_worker(X, y, **extra):
+    """
+    Pool initializer: makes X, y and any `extra` shared data (e.g. precomputed folds)
+    available to the tasks of this process through worker_data().
+    """
+    _data.clear()
+    _data.update(X=X, y=y, **extra)
+
+
+def worker_data():
+    """What init_worker() set up in this process: a dict with 'X', 'y' and the extras."""
+    return _data
+
+
+def _rows(X, index):
+    return X.iloc[index] if hasattr(X, 'iloc') else X[index]
+
+
+def fit_fold(estimator, train_index, test_index):
+    """Fits a clone of `estimator` on one fold. Returns a dict of metrics, timings and test-fold probabilities."""
+    X, y = _data['X'], _data['y']
+    model = clone(estimator)
+    start = time.perf_counter()
+    model.fit(_rows(X, train_index), y[train_index])
+    fit_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    y_pred, proba = predict_with_proba(model, _rows(X, test_index))
+    predict_seconds = time.perf_counter() - start
+
+    result = {name: metric(y[test_index], y_pred) for name, metric in FOLD_METRICS.items()}
+    result.update(fit_seconds=fit_seconds, predict_seconds=predict_seconds, proba=proba)
+    return result
+
+
+class CVResult:
+    """Per-fold results plus the out-of-fold class-1 probabilities."""
+
+    def __init__(self, folds, oof_proba, y, total_seconds):
+        self.folds = folds
+        self.oof_proba = oof_proba
+        self.total_seconds = total_seconds
+        both_classes = len(np.unique(y)) == 2
+        self.roc_auc = roc_auc_score(y, oof_proba) if both_classes else np.nan
+        self.pr_auc = average_precision_score(y, oof_proba) if both_classes else np.nan
+
+    def mean(self, metric):
+        return float(np.mean([fold[metric] for fold in self.folds]))
+
+    @property
+    def fold_seconds(self):
+        """Fit + predict time of each fold."""
+        return [fold['fit_seconds'] + fold['predict_seconds'] for fold in self.folds]
+
+    def summary(self):
+        return '\n'.join([
+            *(f"Mean CV {name}: {self.mean(name):.4f}" for name in FOLD_METRICS),
+            f"Out-of-fold ROC-AUC: {self.roc_auc:.4f}, PR-AUC: {self.pr_auc:.4f}",
+            f"Fold times (s): {', '.join(f'{s:.2f}' for s in self.fold_seconds)} "
+            f"({self.total_seconds:.2f}s wall, {len(self.folds)} fits)",
+        ])
+
+
+def cross_validate(estimator, X, y, cv, workers=None):
+    """
+    Cross-validates `estimator` over the splits of `cv` with one fit per fold, `workers`
+    folds at a time (default: one per core). Returns a CVResult.
+    """
+    y = np.asarray(y)
+    splits = list(cv.split(X, y))
+    workers = min(workers or os.cpu_count() or 1, len(splits))
+    start = time.perf_counter()
+    if workers <= 1:
+        init_worker(X, y)
+        folds = [fit_fold(estimator, train_index, test_index) for train_index, test_index in splits]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(X, y)) as pool:
+            futures = [pool.submit(fit_fold, estimator, train_index, test_index) for train_index, test_index in splits]
+            folds = [future.result() for future in futures]
+    total_seconds = time.perf_counter() - start
+
+    oof_proba = np.full(len(y), np.nan)
+    for fold, (_, test_index) in zip(folds, splits):
+        oof_proba[test_index] = fold['proba']
+    return CVResult(folds, oof_proba, y, total_seconds)
+
+
+def append_run_log(path, row):
+    """
+    Appends `row` (column -> value) to a run-summary CSV. If the row brings columns the file
+    does not have yet, the file is rewritten once with the wider header; older rows keep
+    empty values in the new columns.
+    """
+    header, rows = [], []
+    if os.path.isfile(path):
+        with open(path, newline='') as f:
+            reader = csv.DictReader(f)
+            header = list(reader.fieldnames or [])
+            new_columns = [column for column in row if column not in header]
+            if new_columns:
+                rows = list(reader)
+    else:
+        new_columns = list(row)
+    if new_columns:
+        header += new_columns
+        with open(path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=header)
+            writer.writeheader()
+            writer.writerows(rows)
+    with open(path, 'a', newline='') as f:
+        csv.DictWriter(f, fieldnames=header).writerow(row)
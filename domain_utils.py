@@ -0,0 +1,224 @@
+"""
+Registrable-domain (eTLD+1) resolution shared by the crawler and feature extraction.
+
+Works offline from a set index of public-suffix rules. A compact built-in list covers
+the multi-label suffixes we actually see in crawls (co.uk, com.au, github.io, ...);
+single-label TLDs are handled by the Public Suffix List's default "*" rule. If a full
+copy of the list (https://publicsuffix.org/list/public_suffix_list.dat) is saved as
+PUBLIC_SUFFIX_LIST_FILE next to this module, it is loaded instead.
+
+Usage:
+    python domain_utils.py --benchmark
+"""
+import os
+import sys
+import time
+from functools import lru_cache
+
+PUBLIC_SUFFIX_LIST_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "public_suffix_list.dat")
+
+# Multi-label suffixes in PSL syntax ("*." wildcard, "!" exception)
+BUILTIN_SUFFIX_RULES = """
+co.uk org.uk me.uk ltd.uk plc.uk net.uk ac.uk gov.uk nhs.uk police.uk sch.uk
+com.au net.au org.au edu.au gov.au asn.au id.au
+co.nz net.nz org.nz govt.nz ac.nz
+co.jp ne.jp or.jp ac.jp go.jp gr.jp ad.jp ed.jp lg.jp
+co.kr or.kr ne.kr re.kr go.kr ac.kr
+com.cn net.cn org.cn gov.cn edu.cn
+com.hk net.hk org.hk edu.hk gov.hk
+com.tw net.tw org.tw edu.tw gov.tw
+com.sg net.sg org.sg edu.sg gov.sg
+com.my net.my org.my edu.my gov.my
+com.ph net.ph org.ph edu.ph gov.ph
+co.id or.id ac.id go.id web.id
+co.th in.th ac.th go.th or.th
+com.vn net.vn org.vn edu.vn gov.vn
+co.in net.in org.in firm.in gen.in ind.in ac.in edu.in gov.in
+com.pk net.pk org.pk edu.pk gov.pk
+com.br net.br org.br gov.br edu.br art.br blog.br
+com.ar net.ar org.ar gob.ar edu.ar
+com.mx net.mx org.mx gob.mx edu.mx
+com.co net.co org.co gov.co edu.co
+com.pe net.pe org.pe gob.pe edu.pe
+co.za org.za net.za gov.za ac.za web.za
+com.ng org.ng gov.ng edu.ng
+co.ke or.ke ac.ke go.ke
+com.eg org.eg gov.eg edu.eg
+com.tr net.tr org.tr gov.tr edu.tr gen.tr
+com.ua net.ua org.ua in.ua kiev.ua
+co.il org.il net.il ac.il gov.il
+com.sa net.sa org.sa gov.sa edu.sa
+ac.ae co.ae net.ae org.ae gov.ae
+com.pl net.pl org.pl
+co.at or.at ac.at gv.at
+com.es nom.es org.es gob.es edu.es
+com.pt org.pt gov.pt edu.pt
+com.gr org.gr gov.gr edu.gr
+com.ru net.ru org.ru spb.ru msk.ru
+*.ck !www.ck
+*.bd *.kh *.mm *.np *.er *.fk *.jm *.kw *.pg
+blogspot.com github.io gitlab.io netlify.app vercel.app pages.dev workers.dev
+herokuapp.com appspot.com firebaseapp.com web.app azurewebsites.net cloudapp.net
+azureedge.net trafficmanager.net cloudfront.net elasticbeanstalk.com
+s3.amazonaws.com *.compute.amazonaws.com fastly.net global.ssl.fastly.net
+myshopify.com wordpress.com wixsite.com squarespace.com blogspot.co.uk
+"""
+
+
+def _parse_rules(lines):
+    """Splits PSL-format rules into (exact, wildcard, exception) sets."""
+    exact, wildcard, exception = set(), set(), set()
+    for line in lines:
+        rule = line.strip().split(' ')[0].lower() if not line.lstrip().startswith('//') else ''
+        if not rule:
+            continue
+        if rule.startswith('!'):
+            exception.add(rule[1:])
+        elif rule.startswith('*.'):
+            wildcard.add(rule[2:])
+        else:
+            exact.add(rule)
+    return exact, wildcard, exception
+
+
+def _load_rules():
+    if os.path.isfile(PUBLIC_SUFFIX_LIST_FILE):
+        with open(PUBLIC_SUFFIX_LIST_FILE, encoding='utf-8') as f:
+            # The file is already one rule per line; IDN rules stay as unicode labels
+            return _parse_rules(f)
+    return _parse_rules(BUILTIN_SUFFIX_RULES.split())
+
+
+_EXACT_RULES, _WILDCARD_RULES, _EXCEPTION_RULES = _load_rules()
+
+
+def _public_suffix_label_count(labels):
+    """Number of trailing labels that form the public suffix (longest matching rule wins)."""
+    n = len(labels)
+    for i in range(n): # i == 0 is the longest candidate
+        candidate = '.'.join(labels[i:])
+        if candidate in _EXCEPTION_RULES:
+            return n - i - 1
+        if candidate in _EXACT_RULES:
+            return n - i
+        if i + 1 < n and '.'.join(labels[i + 1:]) in _WILDCARD_RULES:
+            return n - i
+    return 1 # PSL default rule "*": the TLD itself
+
+
+@lru_cache(maxsize=65536)
+def registrable_domain(hostname):
+    """
+    Returns the registrable domain (eTLD+1) for a hostname, e.g.
+    'static.bbc.co.uk' -> 'bbc.co.uk'. IP addresses and hosts that are themselves
+    a public suffix are returned unchanged.
+    """
+    if not hostname:
+        return None
+    hostname = hostname.rstrip('.').lower()
+    if ':' in hostname or hostname.replace('.', '').isdigit(): # IPv6 / IPv4 literal
+        return hostname
+    labels = hostname.split('.')
+    suffix_len = _public_suffix_label_count(labels)
+    if len(labels) <= suffix_len:
+        return hostname
+    return '.'.join(labels[-(suffix_len + 1):])
+
+
+def get_hostname(url_str):
+    """
+    Extracts the lowercase hostname from a URL with plain string slicing (no urlparse).
+    Accepts URLs with a scheme, protocol-relative URLs ('//host/...') and bare hosts.
+    """
+    if not url_str:
+        return None
+    scheme_end = url_str.find('://')
+    if scheme_end != -1:
+        rest = url_str[scheme_end + 3:]
+    elif url_str.startswith('//'):
+        rest = url_str[2:]
+    else:
+        rest = url_str
+    for sep in ('/', '?', '#'):
+        cut = rest.find(sep)
+        if cut != -1:
+            rest = rest[:cut]
+    rest = rest.rpartition('@')[2] # Drop user:password@
+    if rest.startswith('['): # IPv6 literal, e.g. [::1]:8080
+        host = rest[1:rest.find(']')] if ']' in rest else rest[1:]
+    else:
+        host = rest.partition(':')[0]
+    return host.lower() or None
+
+
+def get_main_domain(url_str):
+    """
+    Extracts the registrable domain (e.g. 'example.com', 'example.co.uk') from a URL.
+    Resolution is memoized per hostname, so repeated requests to the same host are a dict hit.
+    """
+    try:
+        return registrable_domain(get_hostname(url_str))
+    except Exception:
+        return None
+
+
+def is_third_party(page_domain, request_domain):
+    """A request is first-party only if it shares the page's registrable domain."""
+    if not page_domain or not request_domain:
+        return True # Assume third-party unless proven otherwise
+    return page_domain != request_domain
+
+
+def _benchmark_corpus(num_urls=200000):
+    """Request URLs shaped like a recipe-site crawl: a few first-party hosts plus many ad/analytics hosts."""
+    import random
+    rng = random.Random(42)
+    hosts = [
+        'www.allrecipes.com', 'imagesvc.meredithcorp.io', 'www.kawalingpinoy.com', 'www.bbcgoodfood.com',
+        'images.immediate.co.uk', 'www.taste.com.au', 'cdn.jsdelivr.net', 'www.google-analytics.com',
+        'securepubads.g.doubleclick.net', 'pagead2.googlesyndication.com', 'connect.facebook.net',
+        'www.facebook.com', 'bat.bing.com', 'static.ads-twitter.com', 'c.amazon-adsystem.com',
+        'ib.adnxs.com', 'sync.search.spotxchange.com', 'pixel.rubiconproject.com', 'ads.pubmatic.com',
+        'cm.g.doubleclick.net', 'b-code.liadm.com', 'tags.crwdcntrl.net', 'match.adsrvr.org',
+        'd1af033869koo7.cloudfront.net', 'foodblog.blogspot.com', 'shop.example.co.jp',
+    ]
+    hosts += [f"s{i}.tracker{i % 97}.com" for i in range(400)]
+    paths = ['/', '/collect?v=1&tid=UA-1&cid=123.456', '/tr?id=1&ev=PageView', '/gampad/ads?iu=/123/x',
+             '/pixel.gif?uid=abc', '/js/app.min.js', '/v1/events', '/sync?partner=42&user_id=xyz']
+    return [f"https://{rng.choice(hosts)}{rng.choice(paths)}" for _ in range(num_urls)]
+
+
+def benchmark(num_urls=200000):
+    """Times domain resolution over a synthetic request-URL corpus, cold vs. memoized."""
+    from urllib.parse import urlparse
+    urls = _benchmark_corpus(num_urls)
+
+    start = time.perf_counter()
+    for url in urls:
+        urlparse(url).hostname
+    urlparse_s = time.perf_counter() - start
+
+    registrable_domain.cache_clear()
+    start = time.perf_counter()
+    for url in urls:
+        get_main_domain(url)
+    resolver_s = time.perf_counter() - start
+    info = registrable_domain.cache_info()
+
+    start = time.perf_counter()
+    for url in urls:
+        get_main_domain(url)
+    warm_s = time.perf_counter() - start
+
+    print(f"{num_urls} request URLs, {info.currsize} distinct hostnames")
+    print(f"urlparse().hostname only:        {urlparse_s:.3f}s ({num_urls / urlparse_s:,.0f} URLs/s)")
+    print(f"get_main_domain (cold cache):    {resolver_s:.3f}s ({num_urls / resolver_s:,.0f} URLs/s)")
+    print(f"get_main_domain (warm cache):    {warm_s:.3f}s ({num_urls / warm_s:,.0f} URLs/s)")
+
+
+if __name__ == "__main__":
+    if '--benchmark' in sys.argv:
+        benchmark()
+    else:
+        for arg in sys.argv[1:]:
+            print(f"{arg} -> {get_main_domain(arg)}")
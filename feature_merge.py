@@ -0,0 +1,365 @@
+"""
+Hash-join merge of per-session behavior and network features.
+
+Sessions are matched in two passes:
+  1. on session_id_group, for network features built from logs with session ids;
+  2. for sessions still unmatched, on a normalized start-URL key, against network
+     features that only have a page URL (older logs).
+
+URLs are normalized (scheme, 'www.', port, tracking query parameters, fragment and
+trailing slash dropped; host lowercased; the remaining query parameters sorted) and interned into compact int32 keys, so the join compares
+integers rather than raw strings. Network rows sharing a key are aggregated
+deterministically before the join (network_aggregations()), so a key never fans out.
+
+The network side is built into one hash index; behavior rows are probed in chunks of
+`chunk_size` and each merged chunk is handed to `write_chunk`, so only one chunk of
+output is in memory at a time. MergeReport accumulates match rates and per-column
+missing-value counts chunk by chunk.
+
+For inputs too large for memory, merge_features_partitioned() streams both sides,
+hash-partitions them to disk and runs the same join one partition at a time.
+"""
+import shutil
+import tempfile
+from urllib.parse import parse_qsl, urlencode
+
+import numpy as np
+import pandas as pd
+
+import feature_store
+from domain_utils import get_hostname
+
+SESSION_KEY = 'session_id_group'
+URL_COLUMN = 'session_start_url'
+DEFAULT_CHUNK_SIZE = 500_000
+
+# Network feature columns that count distinct values; summing them over duplicate rows would overcount
+DISTINCT_COUNT_COLUMNS = ('net_num_unique_third_party_domains', 'net_num_distinct_referers')
+# Query parameters that only tag where a visit came from; the rest can select the page (e.g. ?id=1)
+TRACKING_QUERY_KEYS = frozenset(('gclid', 'gbraid', 'wbraid', 'dclid', 'fbclid', 'msclkid', 'yclid', 'igshid',
+                                 'mc_cid', 'mc_eid', '_ga', '_gl'))
+TRACKING_QUERY_KEY_PREFIXES = ('utm_',)
+
+
+def normalize_url(url):
+    """
+    'HTTPS://www.Example.com:443/recipes/?utm_source=x#top' -> 'example.com/recipes'
+    'shop.com/item?id=2&gclid=abc&color=red' -> 'shop.com/item?color=red&id=2'
+    """
+    if not isinstance(url, str) or not url:
+        return ''
+    host = get_hostname(url) or ''
+    if host.startswith('www.'):
+        host = host[4:]
+    rest, _, query = url.split('://', 1)[-1].split('#', 1)[0].partition('?')
+    slash = rest.find('/')
+    path = rest[slash:].rstrip('/') if slash != -1 else ''
+    params = sorted((key, value) for key, value in parse_qsl(query, keep_blank_values=True)
+                    if key.lower() not in TRACKING_QUERY_KEYS and not key.lower().startswith(TRACKING_QUERY_KEY_PREFIXES))
+    return host + path + ('?' + urlencode(params) if params else '')
+
+
+class UrlKeyInterner:
+    """
+    Maps URLs to small integer keys through their normalized form. The dictionary persists
+    across calls, so chunks (and both sides of a join) get consistent keys.
+    """
+
+    def __init__(self):
+        self.ids = {} # normalized URL -> key
+
+    def __len__(self):
+        return len(self.ids)
+
+    def keys_for(self, urls):
+        """int32 key per URL (-1 for missing URLs). Each distinct URL is normalized once."""
+        codes, uniques = pd.factorize(pd.Series(urls, dtype=object))
+        unique_keys = np.empty(len(uniques), dtype=np.int32)
+        for i, url in enumerate(uniques):
+            unique_keys[i] = self.ids.setdefault(normalize_url(url), len(self.ids))
+        return np.where(codes >= 0, unique_keys[codes.clip(min=0)], -1).astype(np.int32)
+
+
+def network_aggregations(columns):
+    """Column -> aggregation for collapsing network rows that share a key."""
+    aggregations = {}
+    for column in columns:
+        if column in (SESSION_KEY, URL_COLUMN, 'net_ratio_third_party_requests'):
+            continue
+        aggregations[column] = 'max' if column in DISTINCT_COUNT_COLUMNS else 'sum'
+    return aggregations
+
+
+def aggregate_network_rows(df_network, key):
+    """
+    One row per distinct `key`: counts are summed, distinct counts take the max and the
+    third-party ratio is recomputed. Sums and maxima do not depend on row order, so neither
+    does the result. Returns (aggregated frame indexed by key, number of duplicate rows folded).
+    """
+    feature_columns = [c for c in df_network.columns if c not in (SESSION_KEY, URL_COLUMN, key)]
+    codes, uniques = pd.factorize(df_network[key])
+    if len(uniques) == len(df_network): # Nothing to fold
+        return df_network[feature_columns].set_axis(pd.Index(uniques)), 0
+    aggregated = df_network.groupby(codes).agg(network_aggregations(feature_columns))
+    aggregated.index = pd.Index(uniques)[aggregated.index]
+    if 'net_ratio_third_party_requests' in df_network.columns:
+        total = aggregated['net_total_requests_logged'].to_numpy(dtype=float)
+        third = aggregated['net_num_third_party_requests'].to_numpy(dtype=float)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            aggregated['net_ratio_third_party_requests'] = np.where(total > 0, third / total, 0.0)
+    return aggregated[feature_columns], len(df_network) - len(aggregated)
+
+
+class MergeReport:
+    """Match statistics and missing-value counts, accumulated chunk by chunk."""
+
+    def __init__(self):
+        self.behavior_rows = 0
+        self.matched_by_session = 0
+        self.matched_by_url = 0
+        self.network_rows = 0
+        self.network_duplicates_folded = 0
+        self.duplicate_session_ids = 0
+        self.null_counts = None # column -> missing values in the merged output
+
+    @property
+    def unmatched(self):
+        return self.behavior_rows - self.matched_by_session - self.matched_by_url
+
+    def add_chunk(self, merged, by_session, by_url):
+        self.behavior_rows += len(merged)
+        self.matched_by_session += int(by_session.sum())
+        self.matched_by_url += int(by_url.sum())
+        nulls = merged.isna().sum()
+        self.null_counts = nulls if self.null_counts is None else self.null_counts.add(nulls, fill_value=0)
+
+    def rate(self, count):
+        return count / self.behavior_rows if self.behavior_rows else 0.0
+
+    def summary(self):
+        lines = [
+            f"Behavior sessions: {self.behavior_rows}, network rows: {self.network_rows} "
+            f"({self.network_duplicates_folded} duplicate rows aggregated)",
+            f"Matched on {SESSION_KEY}: {self.matched_by_session} ({self.rate(self.matched_by_session):.1%})",
+            f"Matched on normalized URL: {self.matched_by_url} ({self.rate(self.matched_by_url):.1%})",
+            f"Unmatched (NaN network features): {self.unmatched} ({self.rate(self.unmatched):.1%})",
+        ]
+        if self.duplicate_session_ids:
+            lines.append(f"Warning: {self.duplicate_session_ids} duplicate {SESSION_KEY} values in the behavior features")
+        return '\n'.join(lines)
+
+
+class NetworkIndex:
+    """
+    The build side of the join: network rows aggregated per session key and, for rows
+    without one, per interned URL key, with their feature values as float matrices.
+    """
+
+    def __init__(self, df_network, interner, network_columns=None):
+        self.network_columns = network_columns or [c for c in df_network.columns if c not in (SESSION_KEY, URL_COLUMN)]
+        if SESSION_KEY not in df_network.columns:
+            df_network = df_network.assign(**{SESSION_KEY: pd.Series(pd.NA, index=df_network.index, dtype='string')})
+        has_session = df_network[SESSION_KEY].notna().to_numpy()
+        by_session, folded_session = aggregate_network_rows(df_network[has_session], SESSION_KEY)
+        by_url_rows = df_network[~has_session].assign(_url_key=interner.keys_for(df_network.loc[~has_session, URL_COLUMN]))
+        by_url, folded_url = aggregate_network_rows(by_url_rows[by_url_rows['_url_key'] >= 0], '_url_key')
+        self.folded = folded_session + folded_url
+        self.session_index = pd.Index(by_session.index)
+        self.url_index = pd.Index(by_url.index)
+        self.session_values = by_session[self.network_columns].to_numpy(dtype=float)
+        self.url_values = by_url[self.network_columns].to_numpy(dtype=float)
+
+    def probe(self, chunk, interner):
+        """Left-joins one chunk of behavior rows. Returns (merged, matched on session, matched on URL)."""
+        if SESSION_KEY in chunk.columns and len(self.session_index):
+            session_pos = self.session_index.get_indexer(chunk[SESSION_KEY].astype(object))
+        else:
+            session_pos = np.full(len(chunk), -1)
+        if len(self.url_index):
+            url_pos = self.url_index.get_indexer(interner.keys_for(chunk[URL_COLUMN]))
+        else:
+            url_pos = np.full(len(chunk), -1)
+        matched_session = session_pos >= 0
+        matched_url = ~matched_session & (url_pos >= 0)
+
+        values = np.full((len(chunk), len(self.network_columns)), np.nan)
+        values[matched_session] = self.session_values[session_pos[matched_session]]
+        values[matched_url] = self.url_values[url_pos[matched_url]]
+        merged = pd.concat([chunk.reset_index(drop=True),
+                            pd.DataFrame(values, columns=self.network_columns)], axis=1)
+        return merged, matched_session, matched_url
+
+
+def merge_features(df_behavior, df_network, write_chunk=None, chunk_size=DEFAULT_CHUNK_SIZE, interner=None):
+    """
+    Left-joins network features onto behavior features (see module docstring).
+
+    With `write_chunk`, each merged chunk is passed to it and nothing is kept; otherwise the
+    chunks are concatenated and returned. Returns (merged frame or None, MergeReport).
+    """
+    interner = interner or UrlKeyInterner()
+    report = MergeReport()
+    report.network_rows = len(df_network)
+    index = NetworkIndex(df_network, interner)
+    report.network_duplicates_folded = index.folded
+
+    if SESSION_KEY in df_behavior.columns:
+        report.duplicate_session_ids = int(df_behavior[SESSION_KEY].dropna().duplicated().sum())
+
+    chunks = []
+    for start in range(0, len(df_behavior), chunk_size):
+        merged, matched_session, matched_url = index.probe(df_behavior.iloc[start:start + chunk_size], interner)
+        report.add_chunk(merged, matched_session, matched_url)
+        if write_chunk is not None:
+            write_chunk(merged)
+        else:
+            chunks.append(merged)
+
+    if write_chunk is not None:
+        return None, report
+    if not chunks:
+        return pd.DataFrame(columns=list(df_behavior.columns) + index.network_columns), report
+    return pd.concat(chunks, ignore_index=True), report
+
+
+def session_partitions(session_keys, partitions):
+    """Partition number per session key (-1 where the key is missing)."""
+    keys = pd.Series(session_keys, dtype=object)
+    hashes = pd.util.hash_array(keys.fillna('').to_numpy(dtype=object)) % np.uint64(partitions)
+    return np.where(keys.notna().to_numpy(), hashes.astype(np.int64), -1)
+
+
+def url_partitions(urls, partitions):
+    """
+    Partition number per URL (-1 where it is missing). Partitioning on the normalized URL
+    keeps every spelling of one URL in the same partition.
+    """
+    codes, uniques = pd.factorize(pd.Series(urls, dtype=object))
+    normalized = np.array([normalize_url(url) for url in uniques], dtype=object)
+    unique_partitions = (pd.util.hash_array(normalized) % np.uint64(partitions)).astype(np.int64)
+    unique_partitions[normalized == ''] = -1
+    return np.where(codes >= 0, unique_partitions[codes.clip(min=0)], -1)
+
+
+def _spill(df, assignment, name, spill_folder):
+    """Appends the rows of `df` to spill table `name`_<partition>, per their partition number."""
+    for partition in np.unique(assignment[assignment >= 0]):
+        feature_store.append_table(df[assignment == partition], f"{name}_{partition}", spill_folder)
+
+
+def _spill_to_url_partitions(behavior_rows, partitions, spill_folder):
+    # Rows without a URL cannot match on it either; they pass through partition 0 unmatched
+    assignment = np.maximum(url_partitions(behavior_rows[URL_COLUMN], partitions), 0)
+    _spill(behavior_rows, assignment, 'behavior_url', spill_folder)
+
+
+def _spilled_chunks(name, spill_folder, chunk_size):
+    if not feature_store.table_parts(name, spill_folder):
+        return iter(())
+    return feature_store.iter_table(name, chunk_size=chunk_size, folder=spill_folder)
+
+
+def _spilled_table(name, spill_folder, columns):
+    if not feature_store.table_parts(name, spill_folder):
+        return pd.DataFrame(columns=columns)
+    return feature_store.read_table(name, folder=spill_folder)
+
+
+def merge_features_partitioned(behavior_chunks, network_chunks, write_chunk, partitions=16,
+                               chunk_size=DEFAULT_CHUNK_SIZE, spill_folder=None):
+    """
+    Out-of-core version of merge_features() for inputs that do not fit in memory: both sides
+    are read as streams of frames (e.g. feature_store.iter_table()), hash-partitioned to disk,
+    and joined one partition at a time, so memory is bounded by the largest partition rather
+    than by the whole network table.
+
+      1. Network rows with a session key and behavior rows with one are partitioned on the
+         session key; URL-only network rows and behavior rows without a session key are
+         partitioned on the normalized URL.
+      2. Each session partition is joined; behavior rows it does not match are spilled on to
+         their URL partition.
+      3. Each URL partition is joined and every behavior row is written out.
+
+    Matches, aggregation and the MergeReport are the same as merge_features(), but the output
+    comes out grouped by partition rather than in input order. Spill files go to a temporary
+    folder (or `spill_folder`) that is removed afterwards. Returns the MergeReport.
+    """
+    report = MergeReport()
+    pending = [] # Merged rows buffered up to chunk_size, so partitions do not turn into many tiny writes
+
+    def emit(merged, flush=False):
+        if len(merged):
+            pending.append(merged)
+        if pending and (flush or sum(len(df) for df in pending) >= chunk_size):
+            write_chunk(pd.concat(pending, ignore_index=True))
+            pending.clear()
+
+    created_folder = spill_folder is None
+    spill_folder = spill_folder or tempfile.mkdtemp(prefix='merge_spill_')
+    try:
+        # --- 1. Partition both sides to disk ---
+        behavior_columns, network_columns = None, None
+        for chunk in network_chunks:
+            network_columns = network_columns or list(chunk.columns)
+            report.network_rows += len(chunk)
+            if SESSION_KEY in chunk.columns:
+                session_assignment = session_partitions(chunk[SESSION_KEY], partitions)
+            else:
+                session_assignment = np.full(len(chunk), -1)
+            _spill(chunk, session_assignment, 'network_session', spill_folder)
+            url_only = session_assignment < 0
+            _spill(chunk[url_only], url_partitions(chunk.loc[url_only, URL_COLUMN], partitions),
+                   'network_url', spill_folder)
+        for chunk in behavior_chunks:
+            behavior_columns = behavior_columns or list(chunk.columns)
+            if SESSION_KEY in chunk.columns:
+                session_assignment = session_partitions(chunk[SESSION_KEY], partitions)
+            else:
+                session_assignment = np.full(len(chunk), -1)
+            _spill(chunk, session_assignment, 'behavior_session', spill_folder)
+            _spill_to_url_partitions(chunk[session_assignment < 0], partitions, spill_folder)
+        if behavior_columns is None:
+            return report
+        network_columns = network_columns or [SESSION_KEY, URL_COLUMN]
+        feature_columns = [c for c in network_columns if c not in (SESSION_KEY, URL_COLUMN)]
+
+        # --- 2. Join on the session key, partition by partition ---
+        for partition in range(partitions):
+            name = f"behavior_session_{partition}"
+            if not feature_store.table_parts(name, spill_folder):
+                # Nothing to join, but the network duplicates still count towards the report
+                if feature_store.table_parts(f"network_session_{partition}", spill_folder):
+                    report.network_duplicates_folded += int(feature_store.read_table(
+                        f"network_session_{partition}", columns=[SESSION_KEY],
+                        folder=spill_folder)[SESSION_KEY].duplicated().sum())
+                continue
+            interner = UrlKeyInterner()
+            index = NetworkIndex(_spilled_table(f"network_session_{partition}", spill_folder, network_columns),
+                                 interner, feature_columns)
+            report.network_duplicates_folded += index.folded
+            report.duplicate_session_ids += int(feature_store.read_table(
+                name, columns=[SESSION_KEY], folder=spill_folder)[SESSION_KEY].duplicated().sum())
+            for chunk in _spilled_chunks(name, spill_folder, chunk_size):
+                merged, matched_session, _ = index.probe(chunk, interner)
+                if matched_session.any():
+                    report.add_chunk(merged[matched_session], matched_session[matched_session],
+                                     np.zeros(int(matched_session.sum()), dtype=bool))
+                    emit(merged[matched_session])
+                _spill_to_url_partitions(chunk[~matched_session], partitions, spill_folder)
+
+        # --- 3. Join the rest on the normalized URL, partition by partition ---
+        for partition in range(partitions):
+            name = f"behavior_url_{partition}"
+            interner = UrlKeyInterner()
+            index = NetworkIndex(_spilled_table(f"network_url_{partition}", spill_folder, network_columns),
+                                 interner, feature_columns)
+            report.network_duplicates_folded += index.folded
+            for chunk in _spilled_chunks(name, spill_folder, chunk_size):
+                merged, matched_session, matched_url = index.probe(chunk, interner)
+                report.add_chunk(merged, matched_session, matched_url)
+                emit(merged)
+        emit(pd.DataFrame(), flush=True)
+        return report
+    finally:
+        if created_folder:
+            shutil.rmtree(spill_folder, ignore_errors=True)
@@ -0,0 +1,208 @@
+"""
+Incremental feature refresh: folds only new crawl output into the session feature tables.
+
+feature_state.json records, for every crawl run under behavior_data/, how far its behavior
+and network logs have been read (byte offsets) and which of its sessions are already in the
+feature tables. A refresh reads each log from its offset, computes features for sessions
+it has not folded in yet, and appends them as a new part of the feature_store tables, so it
+scales with the size of the new crawl.
+
+Before appending, the part names a refresh is about to write are saved as pending; if it dies
+before saving the new state, the next refresh removes exactly those parts. Other parts are
+never touched, e.g. tables written in full by behavior_features.py / network_features.py:
+without a state file the pipeline refuses to append to non-empty tables, and --rebuild
+deletes their parts (listing each one) and starts over.
+
+Runs that are still being crawled are read only up to the offsets their checkpoint journal
+(crawl_checkpoint_<run>.jsonl) last recorded, and only sessions the journal marks as done
+are folded in. The offset is held back to the start of the earliest unfinished session, so
+its rows are picked up by a later refresh. Runs without a journal are treated as finished.
+
+Usage:
+    python feature_pipeline.py [--logs behavior_data] [--rebuild]
+"""
+import argparse
+import copy
+import io
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+import behavior_features
+import feature_store
+import network_features
+from behavior_features import SESSIONS_PER_RUN, find_logs, log_run_name
+from crawl_checkpoint import CHECKPOINT_PREFIX, CrawlCheckpoint
+
+STATE_FILE = "feature_state.json"
+
+BEHAVIOR, NETWORK = 0, 1 # Index into offset pairs, same order as the checkpoint journal
+
+
+def load_state(path):
+    if os.path.isfile(path):
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    return {'runs': {}, 'table_parts': {}, 'pending_parts': {}}
+
+
+def save_state(state, path):
+    """Writes the state atomically, so a crash leaves either the old or the new file."""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f, indent=1)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def remove_part(path):
+    print(f"Removing feature table part {path}")
+    os.remove(path)
+
+
+def repair_tables(state, tables, store_folder, rebuild=False):
+    """
+    Removes the parts a refresh marked as pending but never recorded: it died before saving
+    the state, and their sessions will be appended again. With `rebuild`, removes every part.
+    """
+    for table in tables:
+        if rebuild:
+            for path in feature_store.table_parts(table, store_folder):
+                remove_part(path)
+            continue
+        pending = state.get('pending_parts', {}).get(table)
+        path = os.path.join(feature_store.table_folder(table, store_folder), pending or '')
+        if pending and pending not in state['table_parts'].get(table, []) and os.path.isfile(path):
+            remove_part(path)
+
+
+def read_log_slice(path, start, end):
+    """The header line plus the rows in bytes [start, end) of a log, as a CSV buffer."""
+    with open(path, 'rb') as f:
+        header = f.readline()
+        start = max(start, len(header))
+        if end <= start:
+            return None
+        f.seek(start)
+        return io.BytesIO(header + f.read(end - start))
+
+
+def new_session_rows(path, kind, run_state, run_index, checkpoint, loader):
+    """
+    Loads the unread part of one log and splits off the rows of sessions ready to be folded in.
+    Returns (rows, next_offset).
+    """
+    offset = run_state['offsets'][kind]
+    end = checkpoint.last_offsets[kind] if checkpoint else os.path.getsize(path)
+    buffer = read_log_slice(path, offset, end)
+    if buffer is None:
+        return None, offset
+    rows = loader(buffer, run_index)
+
+    keys = rows['session_key'].to_numpy()
+    session_ids = np.where(keys >= 0, keys % SESSIONS_PER_RUN, -1)
+    folded = np.isin(session_ids, run_state['folded'])
+    if checkpoint:
+        done = np.isin(session_ids, list(checkpoint.completed))
+    else:
+        done = np.ones(len(rows), dtype=bool)
+    ready = done & ~folded
+
+    # Hold the offset at the start of the earliest unfinished session so its rows are re-read later
+    next_offset = end
+    for session_id in np.unique(session_ids[~done]):
+        started = checkpoint.started.get(int(session_id))
+        next_offset = min(next_offset, started[kind] if started else offset)
+    return rows[ready], max(offset, next_offset)
+
+
+def refresh_features(log_folder=behavior_features.LOG_FOLDER, state_path=STATE_FILE,
+                     store_folder=feature_store.FEATURE_STORE_FOLDER, rebuild=False):
+    """
+    Appends features of newly finished sessions to the feature tables. Returns (behavior rows, network rows) added.
+    Raises ValueError if there is no state file but the tables already have parts (see module docstring).
+    """
+    tables = [behavior_features.FEATURE_TABLE, network_features.FEATURE_TABLE]
+    if rebuild or not os.path.isfile(state_path):
+        # Without a state file there is no telling what the tables already hold; only --rebuild may clear them
+        existing = [path for table in tables for path in feature_store.table_parts(table, store_folder)]
+        if existing and not rebuild:
+            raise ValueError(f"{state_path} not found but the feature tables already have {len(existing)} part(s)")
+        state = {'runs': {}, 'table_parts': {}, 'pending_parts': {}}
+    else:
+        state = load_state(state_path)
+    repair_tables(state, tables, store_folder, rebuild)
+    saved_state = copy.deepcopy(state) # What is on disk; the offsets below move ahead of it
+
+    run_names, new_behavior, new_network, folded_now = [], [], [], {}
+    for behavior_log in find_logs([log_folder], 'behavior_log_'):
+        run_name = log_run_name(behavior_log, 'behavior_log_')
+        network_log = os.path.join(os.path.dirname(behavior_log), f"network_log_{run_name}.csv")
+        journal_path = os.path.join(log_folder, f"{CHECKPOINT_PREFIX}{run_name}.jsonl")
+        checkpoint = CrawlCheckpoint(journal_path) if os.path.isfile(journal_path) else None
+        run_state = state['runs'].setdefault(run_name, {'offsets': [0, 0], 'folded': []})
+        run_index = len(run_names)
+        run_names.append(run_name)
+
+        behavior_rows, run_state['offsets'][BEHAVIOR] = new_session_rows(
+            behavior_log, BEHAVIOR, run_state, run_index, checkpoint, behavior_features.load_behavior_log)
+        if os.path.isfile(network_log):
+            network_rows, run_state['offsets'][NETWORK] = new_session_rows(
+                network_log, NETWORK, run_state, run_index, checkpoint, network_features.load_network_log)
+        else:
+            network_rows = None
+
+        session_ids = set()
+        for rows in (behavior_rows, network_rows):
+            if rows is not None and not rows.empty:
+                keys = rows['session_key'].to_numpy()
+                session_ids.update(int(k) for k in np.unique(keys[keys >= 0] % SESSIONS_PER_RUN))
+        if behavior_rows is not None and not behavior_rows.empty:
+            new_behavior.append(behavior_rows)
+        if network_rows is not None and not network_rows.empty:
+            new_network.append(network_rows)
+        folded_now[run_name] = session_ids
+
+    # Mark the parts about to be written, so a refresh that dies before saving can remove them
+    pending = {table: os.path.basename(feature_store.next_part_path(table, store_folder))
+               for table, new_rows in zip(tables, (new_behavior, new_network)) if new_rows}
+    if pending:
+        saved_state['pending_parts'] = pending
+        save_state(saved_state, state_path)
+
+    added = []
+    for table, new_rows, extract in ((tables[0], new_behavior, behavior_features.extract_behavior_features),
+                                     (tables[1], new_network, network_features.extract_network_features)):
+        if not new_rows:
+            added.append(0)
+            continue
+        features = extract(pd.concat(new_rows, ignore_index=True), run_names)
+        part_path = feature_store.append_table(features, table, store_folder)
+        state['table_parts'].setdefault(table, []).append(os.path.basename(part_path))
+        added.append(len(features))
+
+    for run_name, session_ids in folded_now.items():
+        run_state = state['runs'][run_name]
+        run_state['folded'] = sorted(set(run_state['folded']) | session_ids)
+    state['pending_parts'] = {}
+    save_state(state, state_path)
+    return tuple(added)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Append features of new crawl sessions to the feature tables.")
+    parser.add_argument('--logs', default=behavior_features.LOG_FOLDER, help="Folder with behavior/network logs.")
+    parser.add_argument('--state', default=STATE_FILE)
+    parser.add_argument('--rebuild', action='store_true', help="Ignore the saved state, delete both tables' parts and rebuild them.")
+    args = parser.parse_args()
+
+    try:
+        num_behavior, num_network = refresh_features(args.logs, args.state, rebuild=args.rebuild)
+    except ValueError as e:
+        print(f"Error: {e}. Pass --rebuild to delete them and rebuild both tables from the logs.")
+        exit()
+    print(f"Added {num_behavior} sessions to '{behavior_features.FEATURE_TABLE}' "
+          f"and {num_network} to '{network_features.FEATURE_TABLE}'.")
@@ -0,0 +1,357 @@
+"""
+Typed, columnar storage for the tables the pipeline hands from stage to stage.
+
+Each table is a folder of part files under FEATURE_STORE_FOLDER. Parts are Parquet when
+a Parquet engine (pyarrow or fastparquet) is installed, otherwise CSV. Either way every
+column is read with the dtype declared in SCHEMA, so no stage re-infers types from text.
+Readers pass `columns=` to load only what they use. Writing a table replaces all of its
+parts; append_table() adds one part, which the incremental feature pipeline relies on.
+Analysis and model scripts load with load_features() instead, which downcasts to the
+COMPACT_SCHEMA (smallest integer types, float32, categorical URLs).
+
+Tables:
+    behavior_features  per-session behavior features   (behavior_features.py, feature_pipeline.py)
+    network_features   per-session network features    (network_features.py, feature_pipeline.py)
+    merged             behavior + network features     (combine.py)
+    scored             merged + Isolation Forest score (train.py)
+    scored_online      new sessions + online anomaly score (online_anomaly.py)
+    labeled            scored + manual_label           (imported from the hand-labeled CSV)
+
+Tables that were never written are read from their legacy CSV file (LEGACY_CSV_FILES)
+if it exists, e.g. the hand-labeled labeled_merged_data_with_iforest_scores.csv.
+
+Usage:
+    python feature_store.py info
+    python feature_store.py import <table> <file.csv>
+    python feature_store.py export <table> <file.csv>
+    python feature_store.py --benchmark
+"""
+import glob
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow # noqa: F401
+    PARQUET_ENGINE = 'pyarrow'
+except ImportError:
+    try:
+        import fastparquet # noqa: F401
+        PARQUET_ENGINE = 'fastparquet'
+    except ImportError:
+        PARQUET_ENGINE = None
+
+FEATURE_STORE_FOLDER = "feature_store"
+PART_EXTENSION = '.parquet' if PARQUET_ENGINE else '.csv'
+
+LEGACY_CSV_FILES = {
+    'behavior_features': 'session_behavior_features.csv',
+    'network_features': 'session_network_features.csv',
+    'merged': 'merged_behavior_network_data.csv',
+    'scored': 'merged_data_with_iforest_scores.csv',
+    'labeled': 'labeled_merged_data_with_iforest_scores.csv',
+}
+
+IDENTIFIER_COLUMNS = ['session_id_group', 'session_start_url']
+
+BEHAVIOR_SCHEMA = {
+    'num_total_events': 'int64', 'num_page_visits': 'int64', 'num_clicks': 'int64',
+    'num_mouse_moves': 'int64', 'num_mouse_moves_to_element': 'int64', 'num_errors': 'int64',
+    'session_duration_seconds': 'float64', 'avg_time_between_clicks': 'float64',
+    'total_mouse_dist_approx': 'float64', 'avg_mouse_speed_approx': 'float64',
+    'num_unique_element_tags': 'int64', 'entropy_element_tags': 'float64',
+    'num_a_tags_interacted': 'int64', 'num_button_tags_interacted': 'int64',
+    'num_input_tags_interacted': 'int64', 'num_unique_urls_in_session': 'int64',
+    'navigated_away_from_start_url': 'int64', 'num_error_click_intercepted': 'float64',
+    'num_error_no_clickables_found': 'float64', 'num_error_http_read_timeout': 'float64',
+}
+NETWORK_SCHEMA = {
+    'net_total_requests_logged': 'int64', 'net_num_get_requests': 'int64', 'net_num_post_requests': 'int64',
+    'net_num_put_requests': 'int64', 'net_num_delete_requests': 'int64', 'net_num_options_requests': 'int64',
+    'net_num_head_requests': 'int64', 'net_num_third_party_requests': 'int64',
+    'net_num_first_party_requests': 'int64', 'net_ratio_third_party_requests': 'float64',
+    'net_num_unique_third_party_domains': 'int64', 'net_num_post_to_third_party': 'int64',
+    'net_num_body_to_third_party': 'int64', 'net_num_suspicious_get_beacons_approx': 'int64',
+    'net_num_2xx_responses': 'int64', 'net_num_3xx_responses': 'int64', 'net_num_4xx_responses': 'int64',
+    'net_num_5xx_responses': 'int64', 'net_num_json_responses': 'int64', 'net_num_html_responses': 'int64',
+    'net_num_javascript_responses': 'int64', 'net_num_requests_with_referer': 'int64',
+    'net_num_distinct_referers': 'int64', 'net_num_cross_origin_referer': 'int64',
+}
+SCORE_SCHEMA = {'iforest_suspiciousness_score': 'float64', 'iforest_anomaly_prediction': 'int64'}
+LABEL_SCHEMA = {'manual_label': 'int64'}
+
+SCHEMA = {
+    **{column: 'string' for column in IDENTIFIER_COLUMNS},
+    **BEHAVIOR_SCHEMA, **NETWORK_SCHEMA, **SCORE_SCHEMA, **LABEL_SCHEMA,
+}
+# The 45 model inputs, in the order the models were trained on
+FEATURE_COLUMNS = list(BEHAVIOR_SCHEMA) + list(NETWORK_SCHEMA) + ['iforest_suspiciousness_score']
+
+# In-memory dtypes for analysis and model stages (load_features()). 'unsigned'/'integer' pick the
+# smallest integer type that holds the column's values (float32 if it has missing values).
+# Storage keeps SCHEMA, so downcasting never limits what a later crawl can write.
+COMPACT_SCHEMA = {
+    'session_id_group': 'string', 'session_start_url': 'category',
+    **{column: 'unsigned' if dtype == 'int64' else 'float32'
+       for column, dtype in {**BEHAVIOR_SCHEMA, **NETWORK_SCHEMA}.items()},
+    'iforest_suspiciousness_score': 'float32', 'iforest_anomaly_prediction': 'integer', 'manual_label': 'unsigned',
+}
+
+
+def apply_schema(df):
+    """
+    Casts columns to their SCHEMA dtype. Integer columns holding missing values (e.g. network
+    features of sessions without network rows after the merge) become float64 instead.
+    """
+    dtypes = {}
+    for column in df.columns:
+        dtype = SCHEMA.get(column)
+        if dtype is None or df[column].dtype == dtype:
+            continue
+        if dtype.startswith('int') and df[column].isna().any():
+            dtype = 'float64'
+        dtypes[column] = dtype
+    return df.astype(dtypes) if dtypes else df
+
+
+def compact_dtypes(df):
+    """Casts columns to their COMPACT_SCHEMA dtype (see above); other columns are left alone."""
+    columns = {}
+    for column in df.columns:
+        kind = COMPACT_SCHEMA.get(column)
+        values = df[column]
+        if kind is None or values.dtype == kind:
+            continue
+        if kind in ('unsigned', 'integer'):
+            if values.isna().any():
+                columns[column] = values.astype('float32')
+                continue
+            if kind == 'unsigned' and len(values) and values.min() < 0:
+                kind = 'integer'
+            values = pd.to_numeric(values, downcast=kind)
+            # Columns with fractional values stay float; float32 is enough for them
+            columns[column] = values.astype('float32') if values.dtype.kind == 'f' else values
+        else:
+            columns[column] = values.astype(kind)
+    return df.assign(**columns) if columns else df
+
+
+def feature_matrix(df, columns):
+    """
+    `columns` of `df` as one float32 block. scikit-learn's forests and trees work on float32,
+    so fit()/predict() use this block as is instead of converting (copying) the frame each call.
+    Column names are kept, so feature_names_in_ is recorded as before.
+    """
+    values = np.empty((len(df), len(columns)), dtype=np.float32, order='F')
+    for i, column in enumerate(columns):
+        values[:, i] = df[column].to_numpy(dtype=np.float32, na_value=np.nan)
+    return pd.DataFrame(values, columns=list(columns), index=df.index, copy=False)
+
+
+def table_folder(name, folder=FEATURE_STORE_FOLDER):
+    return os.path.join(folder, name)
+
+
+def table_parts(name, folder=FEATURE_STORE_FOLDER):
+    """Part files of a table, oldest first."""
+    return sorted(glob.glob(os.path.join(table_folder(name, folder), f"part-*{PART_EXTENSION}")))
+
+
+def _write_part(df, path):
+    tmp_path = path + '.tmp'
+    df = apply_schema(df)
+    if PARQUET_ENGINE:
+        df.to_parquet(tmp_path, engine=PARQUET_ENGINE, index=False)
+    else:
+        df.to_csv(tmp_path, index=False)
+    os.replace(tmp_path, path)
+
+
+def _csv_read_args(path, columns):
+    """usecols and dtypes for reading `columns` (all if None) of a CSV part with the declared schema."""
+    header = pd.read_csv(path, nrows=0).columns
+    if columns is not None:
+        missing = [column for column in columns if column not in header]
+        if missing:
+            raise KeyError(f"{path} has no column(s) {missing}")
+    usecols = list(header) if columns is None else [column for column in header if column in set(columns)]
+    # Read as declared; integer columns may hold blanks, so they are parsed as float and fixed up by apply_schema
+    dtypes = {column: ('float64' if SCHEMA[column].startswith('int') else SCHEMA[column])
+              for column in usecols if column in SCHEMA}
+    return usecols, dtypes
+
+
+def _read_csv(path, columns):
+    usecols, dtypes = _csv_read_args(path, columns)
+    return apply_schema(pd.read_csv(path, usecols=usecols, dtype=dtypes))
+
+
+def _read_part(path, columns):
+    if path.endswith('.parquet'):
+        return apply_schema(pd.read_parquet(path, engine=PARQUET_ENGINE, columns=columns))
+    return _read_csv(path, columns)
+
+
+def _iter_part(path, columns, chunk_size):
+    if path.endswith('.parquet'):
+        if PARQUET_ENGINE == 'pyarrow':
+            import pyarrow.parquet as pq
+            for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size, columns=columns):
+                yield apply_schema(batch.to_pandas())
+        else:
+            yield _read_part(path, columns)
+        return
+    usecols, dtypes = _csv_read_args(path, columns)
+    for chunk in pd.read_csv(path, usecols=usecols, dtype=dtypes, chunksize=chunk_size):
+        yield apply_schema(chunk)
+
+
+def _source_parts(name, folder):
+    parts = table_parts(name, folder)
+    if not parts:
+        legacy_csv = LEGACY_CSV_FILES.get(name) if folder == FEATURE_STORE_FOLDER else None
+        if legacy_csv and os.path.isfile(legacy_csv):
+            parts = [legacy_csv]
+        else:
+            raise FileNotFoundError(f"Table '{name}' not found in {table_folder(name, folder)}")
+    return parts
+
+
+def read_table(name, columns=None, folder=FEATURE_STORE_FOLDER):
+    """
+    Loads a table, or only `columns` of it (in that order). Raises FileNotFoundError if
+    the table was never written and has no legacy CSV.
+    """
+    frames = [_read_part(path, columns) for path in _source_parts(name, folder)]
+    df = frames[0] if len(frames) == 1 else apply_schema(pd.concat(frames, ignore_index=True))
+    return df if columns is None else df[list(columns)]
+
+
+def load_features(source, columns=None, folder=FEATURE_STORE_FOLDER):
+    """
+    Shared loader for the analysis and model scripts: reads a table (or a CSV file, if
+    `source` ends in .csv) with compact dtypes, part by part, and prints the memory saved
+    against the declared SCHEMA dtypes.
+    """
+    parts = [source] if source.endswith('.csv') else _source_parts(source, folder)
+    frames, declared_bytes = [], 0
+    for path in parts:
+        part = _read_part(path, columns)
+        declared_bytes += part.memory_usage(deep=True).sum()
+        frames.append(compact_dtypes(part))
+    # Parts downcast to different widths concatenate to a common (possibly wider) type; recompact
+    df = frames[0] if len(frames) == 1 else compact_dtypes(pd.concat(frames, ignore_index=True))
+    if columns is not None:
+        df = df[list(columns)]
+    compact_bytes = df.memory_usage(deep=True).sum()
+    saved = 1 - compact_bytes / declared_bytes if declared_bytes else 0.0
+    print(f"Loaded '{source}': {df.shape[0]} rows x {df.shape[1]} columns, "
+          f"{declared_bytes / 1e6:.2f} MB -> {compact_bytes / 1e6:.2f} MB in memory ({saved:.0%} smaller)")
+    return df
+
+
+def iter_table(name, columns=None, chunk_size=500_000, folder=FEATURE_STORE_FOLDER):
+    """
+    Yields a table (or a CSV file, if `name` ends in .csv) as frames of at most `chunk_size`
+    rows, so it never has to fit in memory at once.
+    """
+    for path in [name] if name.endswith('.csv') else _source_parts(name, folder):
+        for chunk in _iter_part(path, columns, chunk_size):
+            yield chunk if columns is None else chunk[list(columns)]
+
+
+def write_table(df, name, folder=FEATURE_STORE_FOLDER):
+    """Replaces a table with `df`. Returns the written part path."""
+    os.makedirs(table_folder(name, folder), exist_ok=True)
+    path = os.path.join(table_folder(name, folder), f"part-00000{PART_EXTENSION}")
+    old_parts = table_parts(name, folder)
+    _write_part(df, path)
+    for old_path in old_parts:
+        if old_path != path:
+            os.remove(old_path)
+    return path
+
+
+def next_part_path(name, folder=FEATURE_STORE_FOLDER):
+    """The path the next append_table() call on a table will write."""
+    parts = table_parts(name, folder)
+    next_index = int(os.path.basename(parts[-1])[len('part-'):-len(PART_EXTENSION)]) + 1 if parts else 0
+    return os.path.join(table_folder(name, folder), f"part-{next_index:05d}{PART_EXTENSION}")
+
+
+def append_table(df, name, folder=FEATURE_STORE_FOLDER):
+    """Adds `df` to a table as a new part. Returns the part path."""
+    os.makedirs(table_folder(name, folder), exist_ok=True)
+    path = next_part_path(name, folder)
+    _write_part(df, path)
+    return path
+
+
+def import_csv(name, csv_path, folder=FEATURE_STORE_FOLDER):
+    """Loads a CSV (e.g. a hand-labeled export) into the store as table `name`."""
+    return write_table(_read_csv(csv_path, None), name, folder)
+
+
+def export_csv(name, csv_path, folder=FEATURE_STORE_FOLDER):
+    """Writes table `name` out as one CSV, e.g. for manual labeling in a spreadsheet."""
+    read_table(name, folder=folder).to_csv(csv_path, index=False)
+
+
+def benchmark(num_sessions=200_000):
+    """Compares full-CSV hand-off with the store on a synthetic 'scored' table."""
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({column: (rng.random(num_sessions) * 100 if dtype == 'float64'
+                                else rng.integers(0, 50, num_sessions))
+                       for column, dtype in {**BEHAVIOR_SCHEMA, **NETWORK_SCHEMA, **SCORE_SCHEMA}.items()})
+    df.insert(0, 'session_id_group', [f"20250516_003222:{i}" for i in range(num_sessions)])
+    df.insert(1, 'session_start_url', 'https://www.example.com/recipes/')
+    folder = tempfile.mkdtemp(prefix='feature_store_benchmark_')
+    csv_path = os.path.join(folder, 'scored.csv')
+    projection = ['session_id_group', 'iforest_suspiciousness_score'] + list(BEHAVIOR_SCHEMA)[:5]
+
+    start = time.perf_counter()
+    df.to_csv(csv_path, index=False)
+    pd.read_csv(csv_path)
+    csv_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    write_table(df, 'scored', folder)
+    read_table('scored', folder=folder)
+    store_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    read_table('scored', columns=projection, folder=folder)
+    projected_s = time.perf_counter() - start
+
+    store_bytes = sum(os.path.getsize(path) for path in table_parts('scored', folder))
+    print(f"{num_sessions:,} sessions x {df.shape[1]} columns, store format: {PART_EXTENSION[1:]}")
+    print(f"CSV write + full read:           {csv_s:.2f}s, {os.path.getsize(csv_path) / 1e6:.1f} MB")
+    print(f"store write + full read:         {store_s:.2f}s, {store_bytes / 1e6:.1f} MB")
+    print(f"store read of {len(projection)} columns:        {projected_s:.2f}s")
+    shutil.rmtree(folder)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 4 and sys.argv[1] in ('import', 'export'):
+        command, table, csv_file = sys.argv[1:]
+        if command == 'import':
+            print(f"Imported {csv_file} as '{table}': {import_csv(table, csv_file)}")
+        else:
+            export_csv(table, csv_file)
+            print(f"Exported '{table}' to {csv_file}")
+    elif '--benchmark' in sys.argv:
+        benchmark()
+    elif len(sys.argv) == 2 and sys.argv[1] == 'info':
+        print(f"Store folder: {FEATURE_STORE_FOLDER}, part format: {PART_EXTENSION[1:]}")
+        for table in LEGACY_CSV_FILES:
+            parts = table_parts(table)
+            source = f"{len(parts)} part(s)" if parts else (
+                f"legacy {LEGACY_CSV_FILES[table]}" if os.path.isfile(LEGACY_CSV_FILES[table]) else "missing")
+            print(f"  {table}: {source}")
+    else:
+        print(__doc__)
@@ -0,0 +1,237 @@
+"""
+Successive-halving hyperparameter search for the supervised Random Forest and the Isolation Forest.
+
+A random sample of configurations is drawn from the search space. Each rung cross-validates
+every surviving configuration on a stratified subsample of the labeled sessions and keeps
+the best 1/ETA (at least ETA) for the next rung, which uses ETA times as many sessions; the last rung uses
+all of them. Most configurations are thus only ever fitted on small subsamples.
+
+The folds of every rung are drawn once, before the search, and the float32 feature matrix
+and labels reach each worker process once through the pool initializer, so trials only
+carry their parameters. Trials of a rung run in parallel, one per core.
+
+Every trial is appended to trains_output/search_trials.csv with its rung, sample size,
+parameters, CV metrics, fit/predict seconds and forest size (tree nodes, averaged over
+folds). Among the final rung, the smallest forest whose score is within --tolerance of the
+best is selected, so a faster, smaller forest wins whenever it matches the big ones.
+
+The Isolation Forest is fitted without labels (as in train.py, on the features without the
+score it produces) and judged by how well it flags the hand-labeled tracking sessions: F1 of
+its anomaly predictions (which is what contamination moves) or ROC-AUC/PR-AUC of its scores.
+Its tree depth is set through max_samples (depth limit = log2(max_samples)).
+
+Usage:
+    python hyperparameter_search.py rf [--candidates 27] [--metric f1] [--tolerance 0.01]
+    python hyperparameter_search.py iforest [--candidates 27] [--metric f1]
+"""
+import argparse
+import functools
+import itertools
+import json
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import numpy as np
+from sklearn.base import clone
+from sklearn.ensemble import IsolationForest, RandomForestClassifier
+from sklearn.metrics import average_precision_score, f1_score, roc_auc_score
+from sklearn.model_selection import StratifiedKFold, train_test_split
+
+import cv_engine
+import feature_store
+from scoring_service import MODEL_FOLDER, predict_with_proba
+
+TRIALS_LOG_FILE = os.path.join(MODEL_FOLDER, "search_trials.csv")
+ETA = 3 # Keep the best 1/ETA of the configurations at each rung
+N_SPLITS = 5
+METRICS = ('f1', 'roc_auc', 'pr_auc')
+
+SEARCH_SPACES = {
+    'rf': {
+        'n_estimators': [10, 25, 50, 100, 200, 400],
+        'max_depth': [None, 4, 8, 16, 32],
+        'max_features': ['sqrt', 'log2', 0.3, 0.5, 1.0],
+    },
+    'iforest': {
+        'n_estimators': [25, 50, 100, 200, 400],
+        'max_samples': ['auto', 32, 64, 128, 256],
+        'max_features': [0.25, 0.5, 0.75, 1.0],
+        'contamination': ['auto', 0.05, 0.1, 0.2, 0.3],
+    },
+}
+# Settings every trial shares with the production scripts (supervisedTrain.py / train.py)
+BASE_MODELS = {
+    'rf': RandomForestClassifier(random_state=42, class_weight='balanced'),
+    'iforest': IsolationForest(random_state=42),
+}
+
+
+def sample_configurations(space, count, seed=0):
+    """`count` distinct configurations drawn at random from the grid of `space`."""
+    grid = list(itertools.product(*space.values()))
+    rng = np.random.default_rng(seed)
+    chosen = rng.choice(len(grid), size=min(count, len(grid)), replace=False)
+    return [dict(zip(space, grid[i])) for i in chosen]
+
+
+def rung_sizes(num_samples, num_candidates, min_samples):
+    """Sample sizes of the rungs: growing by ETA up to all `num_samples`, none below `min_samples`."""
+    num_rungs = max(1, math.ceil(math.log(max(num_candidates, 1), ETA)) + 1)
+    sizes = [num_samples // ETA ** (num_rungs - 1 - rung) for rung in range(num_rungs)]
+    return [size for size in sizes if size >= min_samples][:-1] + [num_samples]
+
+
+def rung_folds(y, sizes, seed=0):
+    """For each rung, its CV splits as absolute row indices (drawn once and reused by every trial)."""
+    folds = []
+    for size in sizes:
+        if size < len(y):
+            rows, _ = train_test_split(np.arange(len(y)), train_size=size, stratify=y, random_state=seed)
+        else:
+            rows = np.arange(len(y))
+        splitter = StratifiedKFold(n_splits=N_SPLITS, shuffle=True, random_state=seed)
+        folds.append([(rows[train], rows[test]) for train, test in splitter.split(rows, y[rows])])
+    return folds
+
+
+def forest_nodes(model):
+    return int(sum(tree.tree_.node_count for tree in model.estimators_))
+
+
+def run_trial(kind, params, rung):
+    """Cross-validates one configuration on one rung. Uses the X, y and folds set up by cv_engine.init_worker()."""
+    data = cv_engine.worker_data()
+    X, y, folds = data['X'], data['y'], data['folds'][rung]
+    base = clone(BASE_MODELS[kind]).set_params(**params)
+    scores = {metric: [] for metric in METRICS}
+    fit_seconds = predict_seconds = 0.0
+    nodes = []
+    for train_index, test_index in folds:
+        model = clone(base)
+        start = time.perf_counter()
+        if kind == 'rf':
+            model.fit(X.iloc[train_index], y[train_index])
+        else:
+            model.fit(X.iloc[train_index]) # Unsupervised, like train.py
+        fit_seconds += time.perf_counter() - start
+
+        start = time.perf_counter()
+        if kind == 'rf':
+            y_pred, score = predict_with_proba(model, X.iloc[test_index])
+        else:
+            score = -model.score_samples(X.iloc[test_index]) # Higher = more anomalous
+            y_pred = (score > -model.offset_).astype(int) # Same rule as predict() == -1
+        predict_seconds += time.perf_counter() - start
+
+        y_true = y[test_index]
+        scores['f1'].append(f1_score(y_true, y_pred, zero_division=0))
+        both_classes = len(np.unique(y_true)) == 2
+        scores['roc_auc'].append(roc_auc_score(y_true, score) if both_classes else np.nan)
+        scores['pr_auc'].append(average_precision_score(y_true, score) if both_classes else np.nan)
+        nodes.append(forest_nodes(model))
+    result = {f"cv_{metric}": float(np.nanmean(values)) if not np.all(np.isnan(values)) else np.nan
+              for metric, values in scores.items()}
+    result.update(fit_seconds=round(fit_seconds, 4), predict_seconds=round(predict_seconds, 4),
+                  forest_nodes=int(np.mean(nodes)))
+    return result
+
+
+def successive_halving(kind, X, y, num_candidates=27, metric='f1', tolerance=0.01, workers=None, seed=0):
+    """
+    Runs the search (see module docstring) and logs every trial. Returns (selected trial,
+    all trials), where a trial is a dict of its parameters, rung and results.
+    """
+    y = np.asarray(y)
+    search_id = datetime.now().strftime('%Y%m%d_%H%M%S')
+    candidates = sample_configurations(SEARCH_SPACES[kind], num_candidates, seed)
+    min_class = int(np.bincount(y).min())
+    # Each rung needs at least N_SPLITS sessions of the rarer class for stratified folds
+    sizes = rung_sizes(len(y), len(candidates), min_samples=math.ceil(N_SPLITS * len(y) / min_class))
+    folds = rung_folds(y, sizes, seed)
+    workers = workers or os.cpu_count() or 1
+    print(f"Searching {len(candidates)} {kind} configurations over {len(sizes)} rung(s) "
+          f"of {sizes} sessions, optimizing CV {metric}, {workers} worker(s)...")
+
+    trials = []
+    if workers > 1:
+        pool = ProcessPoolExecutor(max_workers=workers, initializer=functools.partial(cv_engine.init_worker, folds=folds),
+                                   initargs=(X, y))
+    else:
+        pool = None
+        cv_engine.init_worker(X, y, folds=folds)
+    try:
+        for rung, size in enumerate(sizes):
+            if pool is not None:
+                results = list(pool.map(run_trial, [kind] * len(candidates), candidates, [rung] * len(candidates)))
+            else:
+                results = [run_trial(kind, params, rung) for params in candidates]
+            rung_trials = []
+            for params, result in zip(candidates, results):
+                trial = {'search_id': search_id, 'model': kind, 'rung': rung, 'num_sessions': size,
+                         'params': json.dumps(params), **result}
+                cv_engine.append_run_log(TRIALS_LOG_FILE, trial)
+                rung_trials.append((params, trial))
+            trials.extend(trial for _, trial in rung_trials)
+
+            # Best first; among equal scores the smaller forest
+            rung_trials.sort(key=lambda pair: (-np.nan_to_num(pair[1][f"cv_{metric}"], nan=-1.0),
+                                               pair[1]['forest_nodes']))
+            best = rung_trials[0][1][f"cv_{metric}"]
+            print(f"  rung {rung}: {len(candidates)} configurations on {size} sessions, best CV {metric} {best:.4f}")
+            if rung < len(sizes) - 1:
+                # Keep at least ETA, so the final rung can still trade a little score for a smaller forest
+                keep = max(min(ETA, len(rung_trials)), math.ceil(len(rung_trials) / ETA))
+                candidates = [params for params, _ in rung_trials[:keep]]
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    # Smallest forest within `tolerance` of the best score on the last rung
+    final = [trial for trial in trials if trial['rung'] == len(sizes) - 1]
+    best_score = max(np.nan_to_num(trial[f"cv_{metric}"], nan=-1.0) for trial in final)
+    close = [trial for trial in final if np.nan_to_num(trial[f"cv_{metric}"], nan=-1.0) >= best_score - tolerance]
+    selected = min(close, key=lambda trial: (trial['forest_nodes'], trial['fit_seconds']))
+    return selected, trials
+
+
+def load_search_data(kind):
+    """Float32 features and labels from the labeled table, with the feature set the model is trained on."""
+    df = feature_store.load_features(
+        'labeled', columns=feature_store.IDENTIFIER_COLUMNS + feature_store.FEATURE_COLUMNS + ['manual_label'])
+    df = df.dropna(subset=['manual_label'])
+    features = feature_store.FEATURE_COLUMNS if kind == 'rf' else [
+        column for column in feature_store.FEATURE_COLUMNS if column != 'iforest_suspiciousness_score']
+    return feature_store.feature_matrix(df, features), df['manual_label'].to_numpy(dtype=np.int64)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Successive-halving search over forest hyperparameters.")
+    parser.add_argument('model', choices=sorted(SEARCH_SPACES))
+    parser.add_argument('--candidates', type=int, default=27, help="Configurations sampled for the first rung.")
+    parser.add_argument('--metric', choices=METRICS, default='f1')
+    parser.add_argument('--tolerance', type=float, default=0.01,
+                        help="Pick the smallest forest within this much of the best final score.")
+    parser.add_argument('--workers', type=int, default=None, help="Parallel trials (default: all cores).")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    try:
+        X, y = load_search_data(args.model)
+    except (FileNotFoundError, KeyError) as e:
+        print(f"Error: could not load the 'labeled' table ({e}).")
+        exit()
+    if len(np.unique(y)) < 2 or np.bincount(y).min() < N_SPLITS:
+        print(f"Error: need at least {N_SPLITS} labeled sessions of each class for {N_SPLITS}-fold CV.")
+        exit()
+
+    os.makedirs(MODEL_FOLDER, exist_ok=True)
+    start = time.perf_counter()
+    selected, all_trials = successive_halving(args.model, X, y, args.candidates, args.metric,
+                                              args.tolerance, args.workers, args.seed)
+    print(f"\n{len(all_trials)} trials in {time.perf_counter() - start:.1f}s, logged to {TRIALS_LOG_FILE}")
+    print(f"Selected {args.model} parameters: {selected['params']}")
+    print(f"  CV f1 {selected['cv_f1']:.4f}, ROC-AUC {selected['cv_roc_auc']:.4f}, PR-AUC {selected['cv_pr_auc']:.4f}, "
+          f"{selected['forest_nodes']} tree nodes per forest, fit {selected['fit_seconds']:.2f}s over {N_SPLITS} folds")
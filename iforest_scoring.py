@@ -0,0 +1,115 @@
+"""
+Scoring of a fitted Isolation Forest for train.py, in one pass over the trees.
+
+IsolationForest.decision_function() and predict() each walk every tree over every
+session; predict() is just decision_function() < 0, i.e. score_samples() < offset_. Here
+score_samples() runs once and both iforest_suspiciousness_score and
+iforest_anomaly_prediction come from it. The most suspicious sessions are picked with
+np.argpartition, so only the top k are sorted instead of the whole table.
+
+Large tables are scored in chunks of rows, in a process pool: the model and the feature
+matrix reach each worker once, through the pool initializer, and tasks only carry row
+ranges.
+
+Usage:
+    python iforest_scoring.py --benchmark [--sessions 1000000]
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+_data = {} # Per-process model and feature matrix, set by _init_worker()
+
+
+def _init_worker(model, X):
+    _data['model'], _data['X'] = model.set_params(n_jobs=1), X # One core per worker
+
+
+def _score_rows(start, end):
+    X = _data['X']
+    return _data['model'].score_samples(X.iloc[start:end] if hasattr(X, 'iloc') else X[start:end])
+
+
+def anomaly_scores(model, X, chunk_size=200_000, workers=None):
+    """
+    Returns (decision_function scores, predict labels) of a fitted IsolationForest from a
+    single score_samples() pass. Tables longer than `chunk_size` rows are scored chunk by
+    chunk in `workers` processes (default: one per core).
+    """
+    workers = min(workers or os.cpu_count() or 1, -(-len(X) // chunk_size))
+    if workers <= 1:
+        raw_scores = model.score_samples(X)
+    else:
+        starts = range(0, len(X), chunk_size)
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(model, X)) as pool:
+            raw_scores = np.concatenate(list(pool.map(_score_rows, starts, [start + chunk_size for start in starts])))
+    # Same as decision_function() and predict(): both compare score_samples() with the fitted offset_
+    scores = raw_scores - model.offset_
+    return scores, np.where(scores < 0, -1, 1)
+
+
+def most_suspicious(scores, k=10):
+    """Positions of the `k` lowest scores, lowest first, without sorting all of them."""
+    k = min(k, len(scores))
+    if k == 0:
+        return np.empty(0, dtype=np.intp)
+    top = np.argpartition(scores, k - 1)[:k]
+    return top[np.argsort(scores[top], kind='stable')]
+
+
+def benchmark(num_sessions=1_000_000, chunk_size=200_000):
+    """
+    Times train.py's scoring step on synthetic sessions: decision_function() + predict() +
+    sorting the frame for the top 10, against one score_samples() pass + argpartition, in
+    process and chunked over all cores. Checks that all give the same results.
+    """
+    from sklearn.ensemble import IsolationForest
+
+    import feature_store
+
+    features = [column for column in feature_store.FEATURE_COLUMNS if column != 'iforest_suspiciousness_score']
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame(rng.poisson(rng.lognormal(1.0, 1.0, len(features)), (num_sessions, len(features))),
+                      columns=features)
+    model_input = feature_store.feature_matrix(df, features)
+    iso_forest = IsolationForest(n_estimators=100, contamination='auto', random_state=42, n_jobs=-1).fit(model_input)
+    print(f"{num_sessions} synthetic sessions, {len(features)} features, {os.cpu_count()} core(s)")
+
+    start = time.perf_counter()
+    old_scores = iso_forest.decision_function(model_input)
+    old_predictions = iso_forest.predict(model_input)
+    old_top = (df.assign(iforest_suspiciousness_score=old_scores)
+               .sort_values(by='iforest_suspiciousness_score').head(10).index.to_numpy())
+    old_seconds = time.perf_counter() - start
+    print(f"  decision_function + predict + sort:    {old_seconds:7.2f}s")
+
+    for label, workers in [('one pass + argpartition:', 1), (f'chunked, {os.cpu_count()} process(es):', None)]:
+        start = time.perf_counter()
+        scores, predictions = anomaly_scores(iso_forest, model_input, chunk_size, workers)
+        top = most_suspicious(scores, 10)
+        seconds = time.perf_counter() - start
+        same = (np.allclose(scores, old_scores) and np.array_equal(predictions, old_predictions)
+                and np.array_equal(scores[top], old_scores[old_top])) # Tied sessions may come in another order
+        print(f"  {label:38}{seconds:7.2f}s ({old_seconds / seconds:.2f}x){'' if same else '  RESULTS DIFFER'}")
+
+    start = time.perf_counter()
+    np.argsort(old_scores, kind='stable')[:10]
+    sort_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    most_suspicious(old_scores, 10)
+    print(f"  top 10 alone: full sort {sort_seconds * 1e3:.1f} ms, argpartition {(time.perf_counter() - start) * 1e3:.1f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark single-pass Isolation Forest scoring.")
+    parser.add_argument('--benchmark', action='store_true')
+    parser.add_argument('--sessions', type=int, default=1_000_000)
+    parser.add_argument('--chunk-size', type=int, default=200_000)
+    args = parser.parse_args()
+    if not args.benchmark:
+        parser.error("nothing to do; use --benchmark (train.py uses this module for its scoring)")
+    benchmark(args.sessions, args.chunk_size)
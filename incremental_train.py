@@ -0,0 +1,234 @@
+"""
+Incremental retraining of the supervised Random Forest.
+
+Instead of refitting every tree on all labeled sessions, the newest rf_model_*.joblib is
+loaded and grown with warm_start: --trees new trees are fitted on the delta only, i.e.
+sessions that are new or whose manual_label changed since that model was trained, plus a
+stratified replay sample of already-known sessions (--replay per delta session) so each
+new tree still sees both classes. Delta sessions get --delta-weight as sample weight. The
+cost of an update therefore follows the size of the delta, not of the labeled table.
+
+With --max-trees the forest is a sliding window: once it holds more trees than that, the
+oldest trees (fitted on the oldest data) are retired. The model counts the trees it has
+ever grown (trees_grown_), and each update seeds its trees from that count, so retiring
+trees never makes later updates repeat earlier bootstrap and feature samples.
+
+Which sessions (and labels) a model was trained on is kept next to it in
+rf_model_<run>.sessions.json, written by supervisedTrain.py and by this script. A model
+without that file is treated as having seen none of the current sessions.
+
+Usage:
+    python incremental_train.py [--model trains_output/rf_model_<run>.joblib] [--trees 20]
+                                [--replay 1.0] [--delta-weight 2.0] [--max-trees 300]
+    python incremental_train.py --benchmark
+"""
+import argparse
+import json
+import os
+import time
+from datetime import datetime
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.metrics import accuracy_score, f1_score
+from sklearn.utils.class_weight import compute_class_weight
+
+import cv_engine
+import feature_store
+from scoring_service import MODEL_FOLDER, latest_model, model_features
+
+RESULTS_CSV_FILE = os.path.join(MODEL_FOLDER, "training_runs_summary.csv")
+SESSION_KEY = 'session_id_group'
+TARGET_COLUMN = 'manual_label'
+
+
+def session_manifest_path(model_path):
+    return model_path[:-len('.joblib')] + '.sessions.json'
+
+
+def save_session_manifest(model_path, sessions, labels):
+    """Records the sessions (and their labels) a model was trained on."""
+    manifest = {str(session): int(label) for session, label in zip(sessions, labels)}
+    with open(session_manifest_path(model_path), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f)
+
+
+def load_session_manifest(model_path):
+    """session -> label the model was trained on, or None if it was never recorded."""
+    path = session_manifest_path(model_path)
+    if not os.path.isfile(path):
+        return None
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def delta_mask(sessions, labels, manifest):
+    """True for sessions that are new to the model or whose label changed since it was trained."""
+    known = pd.Series(manifest or {}, dtype='float64')
+    previous = known.reindex(pd.Index(sessions, dtype=object).astype(str)).to_numpy()
+    return np.isnan(previous) | (previous != np.asarray(labels))
+
+
+def retire_oldest_trees(model, max_trees):
+    """Drops the oldest trees so at most `max_trees` remain. Returns how many were retired."""
+    retired = max(0, len(model.estimators_) - max_trees)
+    if retired:
+        model.estimators_ = model.estimators_[retired:]
+        model.n_estimators = len(model.estimators_)
+    return retired
+
+
+def warm_start_update(model, X, y, is_delta, trees=20, replay=1.0, delta_weight=2.0, max_trees=0, seed=0):
+    """
+    Adds `trees` trees fitted on the delta rows plus a stratified replay sample of the other
+    rows (see module docstring), then applies the sliding window. Returns a dict describing
+    the update. Raises ValueError if the rows to fit on lack one of the model's classes.
+    """
+    y = np.asarray(y)
+    rng = np.random.default_rng(seed)
+    delta_rows = np.flatnonzero(is_delta)
+    known_rows = np.flatnonzero(~is_delta)
+    replay_rows = []
+    num_replay = int(round(replay * len(delta_rows)))
+    for label in model.classes_: # Stratified, with at least one row per class when there is one
+        rows = known_rows[y[known_rows] == label]
+        share = max(1, int(round(num_replay * len(rows) / max(len(known_rows), 1)))) if len(rows) else 0
+        replay_rows.append(rng.choice(rows, size=min(share, len(rows)), replace=False))
+    rows = np.concatenate([delta_rows, *replay_rows])
+    if not set(model.classes_) <= set(y[rows]):
+        raise ValueError(f"the update has no sessions of class(es) {sorted(set(model.classes_) - set(y[rows]))}")
+    weights = np.where(np.isin(rows, delta_rows), delta_weight, 1.0)
+
+    class_weight = model.class_weight
+    if class_weight == 'balanced': # Balance by the class frequencies of all rows, not of this update's sample
+        balanced = compute_class_weight('balanced', classes=model.classes_, y=y)
+        model.set_params(class_weight=dict(zip(model.classes_, balanced)))
+
+    # warm_start skips one seed per existing tree, so once the window is full every update would
+    # reuse the previous update's seeds. Reseed from the number of trees ever grown instead.
+    trees_grown = getattr(model, 'trees_grown_', len(model.estimators_))
+    base_seed = getattr(model, 'base_random_state_', model.random_state)
+    if isinstance(base_seed, (int, np.integer)):
+        model.set_params(random_state=int(base_seed) + trees_grown)
+
+    start = time.perf_counter()
+    model.set_params(warm_start=True, n_estimators=len(model.estimators_) + trees)
+    model.fit(X.iloc[rows] if hasattr(X, 'iloc') else X[rows], y[rows], sample_weight=weights)
+    fit_seconds = time.perf_counter() - start
+    model.set_params(class_weight=class_weight)
+    model.trees_grown_, model.base_random_state_ = trees_grown + trees, base_seed
+    retired = retire_oldest_trees(model, max_trees) if max_trees else 0
+    return {'delta_sessions': len(delta_rows), 'replayed_sessions': len(rows) - len(delta_rows),
+            'trees_added': trees, 'trees_retired': retired, 'rf_n_estimators': len(model.estimators_),
+            'fit_seconds': fit_seconds}
+
+
+def benchmark(num_sessions=20_000, initial=5_000, updates=10, trees=20, max_trees=200):
+    """
+    Labeled sessions arrive in `updates` equal batches after an initial set. After each batch,
+    compares retraining a 100-tree forest from scratch with a warm-start update, on wall time
+    and on accuracy/F1 over a fixed holdout.
+    """
+    from sklearn.datasets import make_classification
+
+    X, y = make_classification(num_sessions + 5_000, len(feature_store.FEATURE_COLUMNS), n_informative=12,
+                               weights=[0.75], flip_y=0.02, random_state=0)
+    X = X.astype(np.float32)
+    X_holdout, y_holdout = X[num_sessions:], y[num_sessions:]
+    batch = (num_sessions - initial) // updates
+
+    def new_forest():
+        return RandomForestClassifier(n_estimators=100, random_state=42, class_weight='balanced', n_jobs=-1)
+
+    incremental = new_forest().fit(X[:initial], y[:initial])
+    print(f"{initial} initial sessions, then {updates} batches of {batch}; holdout {len(y_holdout)}; "
+          f"+{trees} trees per update, window {max_trees}")
+    print(f"{'sessions':>8} {'full s':>7} {'incr s':>7} {'full acc':>8} {'incr acc':>8} {'full f1':>7} {'incr f1':>7} {'trees':>5}")
+    totals = [0.0, 0.0]
+    for update in range(1, updates + 1):
+        seen = initial + update * batch
+        start = time.perf_counter()
+        full = new_forest().fit(X[:seen], y[:seen])
+        full_seconds = time.perf_counter() - start
+
+        is_delta = np.zeros(seen, dtype=bool)
+        is_delta[seen - batch:] = True
+        info = warm_start_update(incremental, X[:seen], y[:seen], is_delta, trees=trees, max_trees=max_trees, seed=update)
+        totals[0] += full_seconds
+        totals[1] += info['fit_seconds']
+
+        full_pred, incremental_pred = full.predict(X_holdout), incremental.predict(X_holdout)
+        print(f"{seen:>8} {full_seconds:>7.2f} {info['fit_seconds']:>7.2f} "
+              f"{accuracy_score(y_holdout, full_pred):>8.4f} {accuracy_score(y_holdout, incremental_pred):>8.4f} "
+              f"{f1_score(y_holdout, full_pred):>7.4f} {f1_score(y_holdout, incremental_pred):>7.4f} {info['rf_n_estimators']:>5}")
+    print(f"Total fit time: full retrains {totals[0]:.2f}s, incremental {totals[1]:.2f}s "
+          f"({totals[0] / totals[1] if totals[1] else 0:.1f}x)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Grow the latest Random Forest with trees fitted on new labels.")
+    parser.add_argument('--model', default=None, help=f"Base model (default: newest rf_model_*.joblib in {MODEL_FOLDER}/).")
+    parser.add_argument('--trees', type=int, default=20, help="Trees added per update.")
+    parser.add_argument('--replay', type=float, default=1.0, help="Known sessions replayed per delta session.")
+    parser.add_argument('--delta-weight', type=float, default=2.0, help="Sample weight of delta sessions.")
+    parser.add_argument('--max-trees', type=int, default=0, help="Sliding window: retire the oldest trees beyond this (0 = keep all).")
+    parser.add_argument('--benchmark', action='store_true', help="Compare with full retrains on synthetic data.")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        benchmark(trees=args.trees, max_trees=args.max_trees or 200)
+        exit()
+
+    base_path = args.model or latest_model()
+    if base_path is None or not os.path.isfile(base_path):
+        print("Error: no base model found. Run supervisedTrain.py first.")
+        exit()
+    try:
+        df = feature_store.load_features(
+            'labeled', columns=feature_store.IDENTIFIER_COLUMNS + feature_store.FEATURE_COLUMNS + [TARGET_COLUMN])
+    except (FileNotFoundError, KeyError) as e:
+        print(f"Error: could not load the 'labeled' table ({e}).")
+        exit()
+    df = df.dropna(subset=[TARGET_COLUMN])
+    y = df[TARGET_COLUMN].to_numpy(dtype=np.int64)
+
+    model = joblib.load(base_path)
+    manifest = load_session_manifest(base_path)
+    if manifest is None:
+        print(f"Warning: {session_manifest_path(base_path)} not found; treating all {len(df)} labeled sessions as new.")
+    is_delta = delta_mask(df[SESSION_KEY], y, manifest)
+    if not is_delta.any():
+        print(f"No new or relabeled sessions since {base_path}; nothing to do.")
+        exit()
+
+    X = feature_store.feature_matrix(df, model_features(model))
+    print(f"Updating {base_path} ({len(model.estimators_)} trees) with {int(is_delta.sum())} new/relabeled sessions...")
+    try:
+        info = warm_start_update(model, X, y, is_delta, args.trees, args.replay, args.delta_weight, args.max_trees)
+    except ValueError as e:
+        print(f"Error: cannot update the model: {e}")
+        exit()
+    print(f"Added {info['trees_added']} trees in {info['fit_seconds']:.2f}s "
+          f"({info['replayed_sessions']} known sessions replayed), retired {info['trees_retired']}; "
+          f"the forest now has {info['rf_n_estimators']} trees.")
+
+    run_timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    model_filename = os.path.join(MODEL_FOLDER, f"rf_model_{run_timestamp}.joblib")
+    model.set_params(warm_start=False) # Plain fit() on the saved model retrains from scratch again
+    joblib.dump(model, model_filename)
+    save_session_manifest(model_filename, df[SESSION_KEY], y)
+    print(f"Updated model saved to: {model_filename}")
+
+    train_accuracy = accuracy_score(y, model.predict(X))
+    cv_engine.append_run_log(RESULTS_CSV_FILE, {
+        'run_timestamp': run_timestamp, 'model_filename': model_filename,
+        'num_training_samples': len(df), 'num_features': X.shape[1],
+        'class_0_count': int((y == 0).sum()), 'class_1_count': int((y == 1).sum()),
+        'train_accuracy_full_set': train_accuracy,
+        'rf_n_estimators': info['rf_n_estimators'], 'rf_class_weight': str(model.get_params()['class_weight']),
+        'training_mode': 'incremental', 'base_model': base_path,
+        'delta_sessions': info['delta_sessions'], 'fit_seconds': round(info['fit_seconds'], 3),
+    })
+    print(f"Accuracy on all {len(df)} labeled sessions: {train_accuracy:.4f}. Run logged to {RESULTS_CSV_FILE}")
@@ -0,0 +1,134 @@
+import csv
+import os
+import queue
+import threading
+import time
+
+_CLOSE = object() # Sentinel telling the writer thread to flush and exit
+
+
+class _FlushRequest:
+    """Queued by flush(); the writer thread fills in the offset and sets `done`."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.offset = None
+
+
+class BufferedCsvWriter:
+    """
+    Appends CSV rows to disk from a background thread.
+
+    Rows are handed over through a bounded queue, so a slow disk makes callers wait
+    instead of growing memory without limit. The thread writes a batch whenever
+    `batch_size` rows are pending or `flush_interval` seconds have passed since the
+    last write, and close() flushes whatever is left.
+    """
+
+    def __init__(self, path, header, batch_size=500, flush_interval=5.0, max_pending=10000):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.rows_written = 0
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._error = None
+
+        # Append so a file that already has rows (e.g. a resumed crawl) is continued, not truncated
+        write_header = not os.path.isfile(path) or os.path.getsize(path) == 0
+        self._file = open(path, 'a', newline='', encoding='utf-8')
+        self._writer = csv.writer(self._file)
+        if write_header:
+            self._writer.writerow(header)
+            self._file.flush()
+
+        self._thread = threading.Thread(target=self._run, name=f"csv-writer-{os.path.basename(path)}", daemon=True)
+        self._thread.start()
+
+    def write(self, row):
+        """Queues one row. Blocks if `max_pending` rows are already waiting."""
+        if self._error:
+            raise self._error
+        self._queue.put(row)
+
+    def writerows(self, rows):
+        for row in rows:
+            self.write(row)
+
+    def flush(self):
+        """
+        Blocks until every row queued so far is written and fsynced.
+        Returns the file size in bytes, i.e. an offset that ends on a row boundary.
+        """
+        if self._error:
+            raise self._error
+        if not self._thread.is_alive():
+            return os.path.getsize(self.path)
+        request = _FlushRequest()
+        self._queue.put(request)
+        request.done.wait()
+        if self._error:
+            raise self._error
+        return request.offset
+
+    def close(self):
+        """Flushes all pending rows and closes the file."""
+        if self._thread.is_alive():
+            self._queue.put(_CLOSE)
+            self._thread.join()
+        if not self._file.closed:
+            self._file.close()
+        if self._error:
+            raise self._error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _flush(self, batch):
+        if batch:
+            self._writer.writerows(batch)
+            self._file.flush()
+            self.rows_written += len(batch)
+            batch.clear()
+
+    def _run(self):
+        batch = []
+        row = None
+        last_flush = time.monotonic()
+        try:
+            while True:
+                timeout = max(0.0, self.flush_interval - (time.monotonic() - last_flush))
+                try:
+                    row = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    row = None
+
+                if row is _CLOSE:
+                    self._flush(batch)
+                    return
+                if isinstance(row, _FlushRequest):
+                    self._flush(batch)
+                    os.fsync(self._file.fileno())
+                    row.offset = self._file.tell()
+                    row.done.set()
+                    last_flush = time.monotonic()
+                    continue
+                if row is not None:
+                    batch.append(row)
+
+                if len(batch) >= self.batch_size or time.monotonic() - last_flush >= self.flush_interval:
+                    self._flush(batch)
+                    last_flush = time.monotonic()
+        except Exception as e:
+            self._error = e
+            if isinstance(row, _FlushRequest):
+                row.done.set()
+            # Keep draining so producers blocked on a full queue (or waiting on flush) are released
+            while True:
+                row = self._queue.get()
+                if isinstance(row, _FlushRequest):
+                    row.done.set()
+                elif row is _CLOSE:
+                    return
@@ -0,0 +1,335 @@
+"""
+Evaluation of saved Random Forests on labeled test sets.
+
+Comparison (default): every model is scored on every test set and the results land in one
+table (trains_output/evaluation_<timestamp>.csv) with per-pair timings. Each test set is
+loaded once and its feature matrix is built once per feature list and shared by all models;
+the model/dataset pairs run in a process pool.
+
+Streaming (--stream), for test sets too large to load: the test data (a CSV file, or a
+feature_store table name) is read in chunks of `chunk_size` rows. Each chunk is scored by
+a pool of worker threads (tree prediction releases the GIL), and its predictions are
+appended to the output CSV in input order as soon as they are ready. The confusion matrix, and with it accuracy/precision/recall/F1
+for class 1, is accumulated chunk by chunk. At most `2 * workers` chunks are in flight,
+so memory stays flat however large the input is.
+
+The output holds the identifiers, true label, predicted label and class-1 probability
+per session; the feature values are already in the input file.
+
+Usage:
+    python model_evaluation.py --data <test.csv or table> [...] [--model <model.joblib or folder> ...]
+                               [--workers N] [--save-predictions]
+    python model_evaluation.py --stream --data <test.csv or table> [--model <model.joblib>]
+                               [--output predictions.csv] [--chunk-size 100000] [--workers 2]
+"""
+import argparse
+import glob
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.metrics import average_precision_score, roc_auc_score
+
+import feature_store
+from scoring_service import MODEL_FOLDER, latest_model, model_features, predict_with_proba
+
+TARGET_COLUMN = 'manual_label'
+DEFAULT_CHUNK_SIZE = 100_000
+DEFAULT_WORKERS = 2
+CLASS_NAMES = ['Class 0 (Legit)', 'Class 1 (Tracking)']
+RESULT_COLUMNS = ['model', 'dataset', 'samples', 'accuracy', 'precision', 'recall', 'f1', 'roc_auc', 'pr_auc',
+                  'tn', 'fp', 'fn', 'tp', 'model_load_seconds', 'predict_seconds', 'error']
+
+
+class StreamingMetrics:
+    """Binary confusion matrix (rows: true 0/1, columns: predicted 0/1), accumulated chunk by chunk."""
+
+    def __init__(self):
+        self.confusion = np.zeros((2, 2), dtype=np.int64)
+        self.dropped_unlabeled = 0
+
+    def add(self, y_true, y_pred):
+        codes = np.asarray(y_true, dtype=np.int64) * 2 + np.asarray(y_pred, dtype=np.int64)
+        self.confusion += np.bincount(codes, minlength=4).reshape(2, 2)
+
+    def merge(self, other):
+        self.confusion += other.confusion
+        self.dropped_unlabeled += other.dropped_unlabeled
+
+    @property
+    def rows(self):
+        return int(self.confusion.sum())
+
+    @staticmethod
+    def _ratio(numerator, denominator):
+        return numerator / denominator if denominator else 0.0 # zero_division=0, as in sklearn.metrics
+
+    @property
+    def accuracy(self):
+        return self._ratio(np.trace(self.confusion), self.rows)
+
+    @property
+    def precision(self):
+        return self._ratio(self.confusion[1, 1], self.confusion[:, 1].sum())
+
+    @property
+    def recall(self):
+        return self._ratio(self.confusion[1, 1], self.confusion[1].sum())
+
+    @property
+    def f1(self):
+        return self._ratio(2 * self.precision * self.recall, self.precision + self.recall)
+
+    def summary(self):
+        (tn, fp), (fn, tp) = self.confusion
+        lines = [
+            f"Samples:   {self.rows}" + (f" ({self.dropped_unlabeled} without a label skipped)" if self.dropped_unlabeled else ""),
+            f"Accuracy:  {self.accuracy:.4f}",
+            f"Precision: {self.precision:.4f} (class 1)",
+            f"Recall:    {self.recall:.4f} (class 1)",
+            f"F1-score:  {self.f1:.4f} (class 1)",
+            "Confusion Matrix (Rows: True, Cols: Predicted):",
+            str(self.confusion),
+            f"  TN: {tn}  FP: {fp}",
+            f"  FN: {fn}  TP: {tp}",
+        ]
+        return '\n'.join(lines)
+
+
+def iter_test_chunks(source, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Chunks of a test CSV file or feature_store table, with compact dtypes."""
+    if source.endswith('.csv'):
+        chunks = pd.read_csv(source, chunksize=chunk_size)
+    else:
+        chunks = feature_store.iter_table(source, chunk_size=chunk_size)
+    for chunk in chunks:
+        yield feature_store.compact_dtypes(feature_store.apply_schema(chunk))
+
+
+def score_chunk(model, chunk, features):
+    """
+    Predictions for one chunk of labeled sessions. Returns (prediction frame, StreamingMetrics
+    of the chunk). Raises KeyError if the chunk lacks a model feature or the label column.
+    """
+    metrics = StreamingMetrics()
+    labeled = chunk[TARGET_COLUMN].notna().to_numpy()
+    metrics.dropped_unlabeled = int((~labeled).sum())
+    chunk = chunk[labeled]
+    y_true = chunk[TARGET_COLUMN].to_numpy(dtype=np.int64)
+    if len(chunk):
+        y_pred, proba = predict_with_proba(model, feature_store.feature_matrix(chunk, features))
+    else:
+        y_pred, proba = np.empty(0, dtype=np.int64), np.empty(0)
+    metrics.add(y_true, y_pred)
+
+    predictions = pd.DataFrame({'true_label': y_true, 'predicted_label': y_pred, 'predicted_proba_class1': proba})
+    for position, column in enumerate(feature_store.IDENTIFIER_COLUMNS):
+        if column in chunk.columns:
+            predictions.insert(position, column, chunk[column].to_numpy())
+    return predictions, metrics
+
+
+def stream_predict(model, source, output_path=None, chunk_size=DEFAULT_CHUNK_SIZE, workers=DEFAULT_WORKERS):
+    """
+    Scores `source` chunk by chunk (see module docstring), appending predictions to
+    `output_path` if given. Returns the StreamingMetrics over all chunks.
+    """
+    features = model_features(model)
+    metrics = StreamingMetrics()
+    output = open(output_path, 'w', newline='', encoding='utf-8') if output_path else None
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            pending = deque()
+
+            def finish_oldest():
+                predictions, chunk_metrics = pending.popleft().result()
+                metrics.merge(chunk_metrics)
+                if output is not None:
+                    predictions.to_csv(output, header=output.tell() == 0, index=False)
+
+            for chunk in iter_test_chunks(source, chunk_size):
+                pending.append(pool.submit(score_chunk, model, chunk, features))
+                if len(pending) >= 2 * workers: # Bound the chunks held in memory
+                    finish_oldest()
+            while pending:
+                finish_oldest()
+    finally:
+        if output is not None:
+            output.close()
+    return metrics
+
+
+def find_models(inputs):
+    """Model files from a list of .joblib paths and/or folders (all rf_model_*.joblib in them)."""
+    paths = []
+    for item in inputs:
+        if os.path.isdir(item):
+            paths.extend(sorted(glob.glob(os.path.join(item, "rf_model_*.joblib"))))
+        else:
+            paths.append(item)
+    return paths
+
+
+def load_test_set(source):
+    """A labeled test set with compact dtypes, without its unlabeled rows. Returns (frame, rows dropped)."""
+    df = feature_store.load_features(source)
+    if TARGET_COLUMN not in df.columns:
+        raise KeyError(f"'{source}' has no '{TARGET_COLUMN}' column")
+    labeled = df[TARGET_COLUMN].notna()
+    return df[labeled].reset_index(drop=True), int((~labeled).sum())
+
+
+# Per-process state of evaluate_models(): test sets, feature matrices and models, each built once
+_test_sets = {}
+_matrices = {} # (dataset, feature tuple) -> float32 feature block
+_models = {}
+
+
+def _init_worker(test_sets, matrices):
+    _test_sets.clear()
+    _test_sets.update(test_sets)
+    _matrices.clear()
+    _matrices.update(matrices)
+    _models.clear()
+
+
+def _feature_block(dataset, features):
+    key = (dataset, tuple(features))
+    if key not in _matrices:
+        _matrices[key] = feature_store.feature_matrix(_test_sets[dataset], features)
+    return _matrices[key]
+
+
+def evaluate_pair(model_path, dataset, predictions_folder=None):
+    """Scores one model on one loaded test set. Returns a RESULT_COLUMNS dict (failures go in 'error')."""
+    result = {'model': os.path.basename(model_path), 'dataset': dataset, 'error': ''}
+    try:
+        start = time.perf_counter()
+        if model_path not in _models:
+            _models[model_path] = joblib.load(model_path)
+        model = _models[model_path]
+        result['model_load_seconds'] = round(time.perf_counter() - start, 3)
+
+        start = time.perf_counter()
+        X = _feature_block(dataset, model_features(model))
+        y_pred, proba = predict_with_proba(model, X)
+        result['predict_seconds'] = round(time.perf_counter() - start, 3)
+    except (OSError, KeyError, ValueError) as e:
+        result['error'] = f"{type(e).__name__}: {e}"
+        return result
+
+    y_true = _test_sets[dataset][TARGET_COLUMN].to_numpy(dtype=np.int64)
+    metrics = StreamingMetrics()
+    metrics.add(y_true, y_pred)
+    (tn, fp), (fn, tp) = metrics.confusion
+    both_classes = len(np.unique(y_true)) == 2
+    result.update(samples=metrics.rows, accuracy=metrics.accuracy, precision=metrics.precision,
+                  recall=metrics.recall, f1=metrics.f1, tn=tn, fp=fp, fn=fn, tp=tp,
+                  roc_auc=roc_auc_score(y_true, proba) if both_classes else np.nan,
+                  pr_auc=average_precision_score(y_true, proba) if both_classes else np.nan)
+
+    if predictions_folder:
+        df = _test_sets[dataset]
+        predictions = df[[c for c in feature_store.IDENTIFIER_COLUMNS if c in df.columns]].assign(
+            true_label=y_true, predicted_label=y_pred, predicted_proba_class1=proba)
+        dataset_name = os.path.splitext(os.path.basename(dataset))[0]
+        predictions.to_csv(os.path.join(predictions_folder, f"test_predictions_for_"
+                                        f"{result['model'].replace('.joblib', '')}_{dataset_name}.csv"), index=False)
+    return result
+
+
+def evaluate_models(model_paths, sources, workers=None, predictions_folder=None):
+    """
+    Scores every model on every test set (see module docstring). Test sets that cannot be
+    loaded are reported and skipped. Returns the comparison table, one row per pair.
+    """
+    test_sets, matrices = {}, {}
+    for source in sources:
+        try:
+            test_sets[source], dropped = load_test_set(source)
+        except (FileNotFoundError, KeyError) as e:
+            print(f"Error: could not load test set '{source}' ({e}). Skipping it.")
+            continue
+        if dropped:
+            print(f"Warning: {dropped} rows of '{source}' have no {TARGET_COLUMN} and are excluded.")
+        # Models trained by supervisedTrain.py use these columns; build their block once, before the pool forks
+        if all(column in test_sets[source].columns for column in feature_store.FEATURE_COLUMNS):
+            key = (source, tuple(feature_store.FEATURE_COLUMNS))
+            matrices[key] = feature_store.feature_matrix(test_sets[source], feature_store.FEATURE_COLUMNS)
+
+    pairs = [(model_path, source) for model_path in model_paths for source in test_sets]
+    workers = min(workers or os.cpu_count() or 1, len(pairs)) if pairs else 1
+    if workers <= 1:
+        _init_worker(test_sets, matrices)
+        results = [evaluate_pair(model_path, source, predictions_folder) for model_path, source in pairs]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(test_sets, matrices)) as pool:
+            futures = [pool.submit(evaluate_pair, model_path, source, predictions_folder)
+                       for model_path, source in pairs]
+            results = [future.result() for future in futures]
+    return pd.DataFrame(results, columns=RESULT_COLUMNS)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Evaluate saved Random Forests on labeled test sets.")
+    parser.add_argument('--data', nargs='+', required=True, help="Test CSV files (with manual_label) or feature_store table names.")
+    parser.add_argument('--model', nargs='*', default=None,
+                        help=f"Model files or folders of them (default: newest rf_model_*.joblib in {MODEL_FOLDER}/).")
+    parser.add_argument('--workers', type=int, default=None, help="Processes (threads with --stream). Default: all cores.")
+    parser.add_argument('--save-predictions', action='store_true', help="Write a predictions CSV per model/test set pair.")
+    parser.add_argument('--stream', action='store_true', help="Score chunk by chunk, for test sets too large to load.")
+    parser.add_argument('--output', default=None, help="--stream: predictions CSV (default: test_predictions_for_<model>.csv).")
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help="--stream: rows per chunk.")
+    args = parser.parse_args()
+
+    model_paths = find_models(args.model) if args.model else [latest_model()]
+    missing = [path for path in model_paths if path is None or not os.path.isfile(path)]
+    if missing or not model_paths:
+        print(f"Error: model file(s) not found: {missing or args.model}")
+        exit()
+
+    if args.stream:
+        if len(model_paths) != 1 or len(args.data) != 1:
+            print("Error: --stream scores one model on one test set.")
+            exit()
+        model_path, source = model_paths[0], args.data[0]
+        loaded_model = joblib.load(model_path)
+        output_path = args.output or f"test_predictions_for_model_{os.path.basename(model_path).replace('.joblib', '')}.csv"
+        workers = args.workers or DEFAULT_WORKERS
+
+        print(f"Scoring '{source}' with {model_path} in chunks of {args.chunk_size} rows ({workers} workers)...")
+        start = time.perf_counter()
+        try:
+            result = stream_predict(loaded_model, source, output_path, args.chunk_size, workers)
+        except FileNotFoundError as e:
+            print(f"Error: Test data not found ({e}).")
+            exit()
+        except KeyError as e:
+            print(f"Error: Test data is missing a model feature or the '{TARGET_COLUMN}' column: {e}")
+            exit()
+        elapsed = time.perf_counter() - start
+
+        print("\n--- Test Set Performance ---")
+        print(result.summary())
+        print(f"\nScored {result.rows} samples in {elapsed:.2f}s ({result.rows / elapsed if elapsed else 0:,.0f} rows/s).")
+        print(f"Predictions saved to: {output_path}")
+    else:
+        print(f"Evaluating {len(model_paths)} model(s) on {len(args.data)} test set(s)...")
+        start = time.perf_counter()
+        table = evaluate_models(model_paths, args.data, args.workers, '.' if args.save_predictions else None)
+        elapsed = time.perf_counter() - start
+
+        with pd.option_context('display.width', 200, 'display.max_columns', None):
+            print(table.drop(columns='error').round(4).to_string(index=False))
+        for row in table[table['error'] != ''].itertuples():
+            print(f"Error: {row.model} on {row.dataset}: {row.error}")
+        os.makedirs(MODEL_FOLDER, exist_ok=True)
+        table_path = os.path.join(MODEL_FOLDER, f"evaluation_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv")
+        table.to_csv(table_path, index=False)
+        print(f"\n{len(table)} pair(s) evaluated in {elapsed:.2f}s. Comparison table saved to: {table_path}")
@@ -0,0 +1,245 @@
+"""
+Builds the per-session network feature table (feature_store 'network_features') from raw
+network_log_*.csv files.
+
+All features come from one grouped pass over the request table. Method, status class,
+content type, page and request URLs are categoricals, so every string operation
+(domain resolution, content-type matching, beacon checks) runs once per distinct
+value and is mapped back to the rows through category codes. Domains are resolved per
+distinct hostname with domain_utils' memoized registrable_domain.
+
+Rows are grouped by crawl session when the log has a session_id column; the key is the
+same session_id_group that behavior_features.py produces. Older logs without it are
+grouped by page_url, as before, and their session_id_group is left empty.
+
+Usage:
+    python network_features.py [network_log.csv | folder ...] [-o features.csv]
+    python network_features.py --benchmark [num_rows]
+"""
+import argparse
+import re
+import time
+
+import numpy as np
+import pandas as pd
+
+import feature_store
+from behavior_features import LOG_FOLDER, find_logs, log_run_name, session_group_labels, session_keys_for
+from domain_utils import get_hostname, registrable_domain
+from request_classifier import RequestClassifier
+
+FEATURE_TABLE = "network_features" # feature_store table
+
+NETWORK_FEATURE_COLUMNS = [
+    'session_id_group', 'session_start_url', 'net_total_requests_logged', 'net_num_get_requests',
+    'net_num_post_requests', 'net_num_put_requests', 'net_num_delete_requests', 'net_num_options_requests',
+    'net_num_head_requests', 'net_num_third_party_requests', 'net_num_first_party_requests',
+    'net_ratio_third_party_requests', 'net_num_unique_third_party_domains', 'net_num_post_to_third_party',
+    'net_num_body_to_third_party', 'net_num_suspicious_get_beacons_approx', 'net_num_2xx_responses',
+    'net_num_3xx_responses', 'net_num_4xx_responses', 'net_num_5xx_responses', 'net_num_json_responses',
+    'net_num_html_responses', 'net_num_javascript_responses', 'net_num_requests_with_referer',
+    'net_num_distinct_referers', 'net_num_cross_origin_referer'
+]
+HTTP_METHODS = ['GET', 'POST', 'PUT', 'DELETE', 'OPTIONS', 'HEAD']
+STATUS_CLASSES = ['1xx', '2xx', '3xx', '4xx', '5xx']
+CONTENT_KINDS = ['json', 'html', 'javascript'] # Substrings of response_content_type
+MISSING_REFERER = 'N/A' # What the crawler logs for requests without a Referer header
+
+LOG_DTYPES = {
+    'page_url': 'category', 'associated_action': 'category', 'request_method': 'category',
+    'request_url': 'category', 'response_reason': 'category', 'request_referer': 'category',
+    'response_content_type': 'category', 'request_body_snippet': str,
+}
+
+
+def category_domains(series):
+    """Registrable domain of each category of a categorical URL series, aligned with its codes."""
+    hostnames = pd.Series([get_hostname(url) for url in series.cat.categories], dtype=object)
+    return np.asarray([registrable_domain(host) if host else None for host in hostnames], dtype=object)
+
+
+def beacon_url_pattern(classifier):
+    """The classifier's tracker-parameter and keyword checks as one regex over lowercased URLs."""
+    keys = [re.escape(key) + '=' for key in sorted(classifier.tracker_query_keys)]
+    keys += [re.escape(prefix) for prefix in classifier.tracker_query_key_prefixes]
+    parts = [r'[?&](?:' + '|'.join(keys) + ')'] if keys else []
+    if classifier.tracker_url_keyword_re is not None:
+        parts.append(classifier.tracker_url_keyword_re.pattern)
+    return '|'.join(parts) or r'(?!)'
+
+
+def load_network_log(path, run_index=0):
+    """Reads one network log and adds an integer 'session_key' column (see extract_network_features)."""
+    # Only empty fields are missing: the crawler writes a literal "N/A" for absent bodies and referers.
+    # The body features (and the models trained on them) count it as a value; the referer features
+    # treat it as missing (see extract_network_features)
+    df = pd.read_csv(path, dtype=LOG_DTYPES, na_values=[''], keep_default_na=False)
+    if 'session_id' in df.columns:
+        session_ids = pd.to_numeric(df['session_id'], errors='coerce')
+        df = df[session_ids.notna().to_numpy()]
+        df['session_key'] = session_keys_for(run_index, session_ids.dropna().to_numpy())
+    else:
+        df['session_key'] = -1 # Keyed by page_url in extract_network_features
+    return df
+
+
+def _codes_to_unique_counts(g, codes, n):
+    """Number of distinct non-missing codes per session."""
+    valid = codes >= 0
+    width = int(codes.max()) + 1 if valid.any() else 1
+    pairs = pd.unique(g[valid].astype(np.int64) * width + codes[valid])
+    return np.bincount(pairs // width, minlength=n)
+
+
+def extract_network_features(requests, run_names, classifier=None):
+    """
+    Computes one row of NETWORK_FEATURE_COLUMNS per session from a network request table:
+    the NETWORK_LOG_HEADER columns plus session_key. session_key is a key from
+    behavior_features.session_keys_for (`run_names[i]` being run_index i's run), or -1 for
+    rows from logs without session ids, which are grouped by page_url.
+    """
+    classifier = classifier or RequestClassifier()
+    requests = requests.reset_index(drop=True)
+    for column in ('page_url', 'request_url', 'request_referer', 'request_method', 'response_content_type'):
+        if not isinstance(requests[column].dtype, pd.CategoricalDtype):
+            requests[column] = requests[column].astype('category')
+
+    page = requests['page_url']
+    page_codes = page.cat.codes.to_numpy()
+    session_key = requests['session_key'].to_numpy(dtype=np.int64)
+    # Legacy rows get negative keys per page_url so they never collide with session ids
+    session_key = np.where(session_key >= 0, session_key, -2 - page_codes.astype(np.int64))
+    # The first captured row of each session gives its start URL
+    session_keys, first_row, g = np.unique(session_key, return_index=True, return_inverse=True)
+    n = len(session_keys)
+
+    def count(mask):
+        return np.bincount(g, weights=mask, minlength=n).astype(np.int64)
+
+    has_session = session_keys >= 0
+    session_id_group = np.full(n, None, dtype=object)
+    session_id_group[has_session] = session_group_labels(session_keys[has_session], run_names)
+    features = pd.DataFrame({'session_id_group': session_id_group})
+    features['session_start_url'] = page.to_numpy()[first_row]
+    features['net_total_requests_logged'] = np.bincount(g, minlength=n)
+
+    method = requests['request_method']
+    method_map = pd.Index(HTTP_METHODS).get_indexer(method.cat.categories.str.upper())
+    method_codes = np.append(method_map, -1)[method.cat.codes.to_numpy()]
+    for i, name in enumerate(HTTP_METHODS):
+        features[f'net_num_{name.lower()}_requests'] = count(method_codes == i)
+
+    # Party is decided on registrable domains, resolved once per distinct URL / hostname
+    page_domains = category_domains(page)[page_codes]
+    url_domain_codes, url_domain_names = pd.factorize(category_domains(requests['request_url']))
+    request_domain_codes = url_domain_codes[requests['request_url'].cat.codes.to_numpy()]
+    request_domains = np.append(np.asarray(url_domain_names, dtype=object), None)[request_domain_codes]
+    third_party = (page_domains == None) | (request_domains == None) | (page_domains != request_domains) # noqa: E711
+    features['net_num_third_party_requests'] = count(third_party)
+    features['net_num_first_party_requests'] = count(~third_party)
+    features['net_ratio_third_party_requests'] = features['net_num_third_party_requests'] / features['net_total_requests_logged']
+    features['net_num_unique_third_party_domains'] = _codes_to_unique_counts(g, np.where(third_party, request_domain_codes, -1), n)
+    features['net_num_post_to_third_party'] = count(third_party & (method_codes == HTTP_METHODS.index('POST')))
+    has_body = (requests['request_body_snippet'].fillna('') != '').to_numpy()
+    features['net_num_body_to_third_party'] = count(third_party & has_body)
+
+    status = pd.to_numeric(requests['response_status'], errors='coerce')
+    status_class = pd.Categorical.from_codes(
+        np.where(status.between(100, 599), (status.fillna(0) // 100) - 1, -1).astype(np.int8), STATUS_CLASSES)
+    status_codes = np.asarray(status_class.codes)
+
+    # Same beacon heuristics as RequestClassifier, evaluated once per distinct URL
+    urls = requests['request_url'].cat.categories.to_series()
+    beacon_url = (urls.str.contains('?', regex=False) & (urls.str.len() > classifier.long_url_threshold)) | \
+        urls.str.lower().str.contains(beacon_url_pattern(classifier), regex=True)
+    is_beacon = beacon_url.to_numpy()[requests['request_url'].cat.codes.to_numpy()] | (status.to_numpy() == 204)
+    features['net_num_suspicious_get_beacons_approx'] = count(is_beacon & (method_codes == HTTP_METHODS.index('GET')))
+    for i, name in enumerate(STATUS_CLASSES[1:], start=1):
+        features[f'net_num_{name}_responses'] = count(status_codes == i)
+
+    content_type = requests['response_content_type']
+    content_codes = content_type.cat.codes.to_numpy()
+    lowered = content_type.cat.categories.str.lower()
+    for kind in CONTENT_KINDS:
+        matches = np.append(lowered.str.contains(kind, regex=False), False) # code -1 (missing) -> False
+        features[f'net_num_{kind}_responses'] = count(matches[content_codes])
+
+    referer = requests['request_referer']
+    referer_codes = referer.cat.codes.to_numpy()
+    # The crawler's "N/A" placeholder means the request had no referer
+    placeholder = referer.cat.categories.get_indexer([MISSING_REFERER])[0]
+    if placeholder >= 0:
+        referer_codes = np.where(referer_codes == placeholder, -1, referer_codes)
+    features['net_num_requests_with_referer'] = count(referer_codes >= 0)
+    features['net_num_distinct_referers'] = _codes_to_unique_counts(g, referer_codes, n)
+    referer_domains = np.append(category_domains(referer), None)[referer_codes]
+    features['net_num_cross_origin_referer'] = count((referer_codes >= 0) & (referer_domains != page_domains))
+
+    return features[NETWORK_FEATURE_COLUMNS]
+
+
+def build_network_features(paths, classifier=None):
+    """Loads the given network logs and returns their session features."""
+    run_names = [log_run_name(path, 'network_log_') for path in paths]
+    logs = [load_network_log(path, run_index) for run_index, path in enumerate(paths)]
+    logs = [df for df in logs if not df.empty]
+    if not logs:
+        return pd.DataFrame(columns=NETWORK_FEATURE_COLUMNS)
+    # Categoricals with different categories concatenate to plain strings; extract_network_features re-encodes them
+    return extract_network_features(pd.concat(logs, ignore_index=True), run_names, classifier)
+
+
+def synthetic_network_log(num_rows, requests_per_session=60, seed=0):
+    """A network request table shaped like load_network_log() output, for benchmarking."""
+    rng = np.random.default_rng(seed)
+    num_sessions = max(1, num_rows // requests_per_session)
+    session = np.sort(rng.integers(1, num_sessions + 1, num_rows))
+    sites = [f'https://www.recipes{i}.com/' for i in range(2000)]
+    hosts = [f'https://s{i}.tracker{i % 300}.com' for i in range(3000)] + \
+            [f'https://cdn.recipes{i}.com' for i in range(2000)]
+    paths = ['/collect?v=1&cid=1.2', '/tr?id=1&ev=PageView', '/pixel?uid=abc', '/js/app.js', '/beacon/v2',
+             '/api/v1/data?' + 'x' * 160, '/sync?partner=42', '/gampad/ads?iu=/123/x']
+    request_urls = [host + path for host in hosts for path in paths]
+    return pd.DataFrame({
+        'session_key': session_keys_for(0, session),
+        'page_url': pd.Categorical.from_codes(session % len(sites), sites),
+        'request_method': pd.Categorical.from_codes(rng.choice(6, num_rows, p=[0.8, 0.12, 0.02, 0.01, 0.04, 0.01]), HTTP_METHODS),
+        'request_url': pd.Categorical.from_codes(rng.integers(0, len(request_urls), num_rows), request_urls),
+        'response_status': rng.choice([200, 204, 302, 404, 500], num_rows, p=[0.7, 0.1, 0.1, 0.07, 0.03]),
+        'request_referer': pd.Categorical.from_codes(np.where(rng.random(num_rows) < 0.8, session % len(sites), -1), sites),
+        'response_content_type': pd.Categorical.from_codes(rng.integers(-1, 4, num_rows),
+                                                           ['application/json', 'text/html', 'application/javascript', 'image/gif']),
+        'request_body_snippet': np.where(rng.random(num_rows) < 0.1, '{"event":"pageview"}', None),
+    })
+
+
+def benchmark(num_rows=10_000_000):
+    """Times extract_network_features on synthetic requests (cold domain cache)."""
+    requests = synthetic_network_log(num_rows)
+    registrable_domain.cache_clear()
+    start = time.perf_counter()
+    features = extract_network_features(requests, ['20250516_000000'])
+    elapsed = time.perf_counter() - start
+    print(f"{num_rows:,} requests -> {len(features):,} sessions in {elapsed:.2f}s "
+          f"({num_rows / elapsed:,.0f} requests/s)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build per-session network features from network logs.")
+    parser.add_argument('inputs', nargs='*', default=[LOG_FOLDER], help="Network log files or folders.")
+    parser.add_argument('-o', '--output', help="Write a CSV file instead of the feature store table.")
+    parser.add_argument('--benchmark', nargs='?', type=int, const=10_000_000, metavar='NUM_ROWS',
+                        help="Time the extractor on synthetic requests instead.")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        benchmark(args.benchmark)
+    else:
+        log_paths = find_logs(args.inputs, 'network_log_')
+        df_features = build_network_features(log_paths)
+        if args.output:
+            df_features.to_csv(args.output, index=False)
+        else:
+            feature_store.write_table(df_features, FEATURE_TABLE)
+        print(f"Built features for {len(df_features)} sessions from {len(log_paths)} log files.")
+        print(f"Network features saved to: {args.output or feature_store.table_folder(FEATURE_TABLE)}")
@@ -0,0 +1,304 @@
+"""
+Online anomaly scoring with Half-Space Trees (Tan, Ting & Liu, 2011), as a streaming
+alternative to refitting the Isolation Forest of train.py on the whole merged table.
+
+Each tree splits a randomly perturbed copy of the feature space in half, depth levels deep,
+and counts how many sessions of the current window fall in each leaf. A session is scored
+against the counts of the previous (reference) window: landing in leaves that few sessions
+reached means anomalous. It is then counted in the current window; every window_size
+sessions the current window becomes the reference. Memory is fixed by n_trees, depth and
+window_size, whatever the number of sessions, and each session is scored as it arrives
+(while the first window fills up, against the sessions seen so far, itself included).
+
+The trees' split points come from the range of the first window. Its sessions are kept
+until it is full and the trees are redrawn each time their number doubles, so a detector
+fed one session at a time ends up with the same trees as one fed whole windows.
+
+Scores follow iforest_suspiciousness_score (IsolationForest.decision_function): lower means
+more suspicious, and negative means flagged (iforest_anomaly_prediction = -1). With
+contamination='auto' the threshold is fixed, like the Isolation Forest's; with a rate, it
+is re-estimated at every window switch as that quantile of the last window's scores.
+Counts are heavy-tailed, so features are log-scaled (sign(x) * log(1 + |x|)) first.
+
+The detector is kept between runs in trains_output/hst_model.joblib. Each run streams
+new sessions (a feature_store table or a CSV) through it and appends them, with their
+scores, to the 'scored_online' table. Feed every session once.
+
+Usage:
+    python online_anomaly.py <table or file.csv> [--reset] [--window-size 1000]
+    python online_anomaly.py --benchmark [--sessions 200000]
+"""
+import argparse
+import os
+import time
+
+import joblib
+import numpy as np
+import pandas as pd
+
+import feature_store
+from scoring_service import MODEL_FOLDER
+
+STATE_FILE = os.path.join(MODEL_FOLDER, "hst_model.joblib")
+OUTPUT_TABLE = 'scored_online'
+# Same inputs as the Isolation Forest in train.py
+FEATURES = [column for column in feature_store.FEATURE_COLUMNS if column != 'iforest_suspiciousness_score']
+
+
+class HalfSpaceTrees:
+    """
+    Streaming anomaly detector (see module docstring). score_update(X) scores rows and then
+    learns from them; decision_function(X) only scores. Both return decision_function-style
+    scores (negative = anomalous).
+    """
+
+    def __init__(self, n_trees=25, depth=10, window_size=1000, contamination='auto', seed=42):
+        self.n_trees = n_trees
+        self.depth = depth
+        self.window_size = window_size
+        self.contamination = contamination
+        self.seed = seed
+        self.offset_ = -0.5 # Same as IsolationForest with contamination='auto'
+        self.split_dims_ = None
+        self.first_window_ = None
+        self.rows_seen_ = 0
+
+    def _transform(self, X):
+        X = np.asarray(X, dtype=np.float64)
+        return np.nan_to_num(np.sign(X) * np.log1p(np.abs(X)))
+
+    def _build(self, X):
+        """Draws the trees, with work ranges around the range of the rows `X`."""
+        rng = np.random.default_rng(self.seed)
+        num_features = X.shape[1]
+        low, high = X.min(axis=0), X.max(axis=0)
+        internal = 2 ** self.depth - 1
+        self.split_dims_ = np.empty((self.n_trees, internal), dtype=np.intp)
+        self.split_values_ = np.empty((self.n_trees, internal))
+        for tree in range(self.n_trees):
+            center = rng.uniform(low, high)
+            radius = 2 * np.maximum(center - low, high - center)
+            radius[radius == 0] = 1.0
+            ranges = {0: (center - radius, center + radius)}
+            for node in range(internal): # Breadth first: children of node are 2*node+1 and 2*node+2
+                mins, maxs = ranges.pop(node)
+                dim = rng.integers(num_features)
+                value = (mins[dim] + maxs[dim]) / 2
+                self.split_dims_[tree, node], self.split_values_[tree, node] = dim, value
+                left_maxs, right_mins = maxs.copy(), mins.copy()
+                left_maxs[dim] = right_mins[dim] = value
+                if 2 * node + 1 < internal:
+                    ranges[2 * node + 1] = (mins, left_maxs)
+                    ranges[2 * node + 2] = (right_mins, maxs)
+        self.built_on_ = len(X)
+
+    def _start(self, num_features):
+        self.reference_mass_ = np.zeros((self.n_trees, 2 ** self.depth), dtype=np.int64)
+        self.latest_mass_ = np.zeros((self.n_trees, 2 ** self.depth), dtype=np.int64)
+        self.reference_count_ = self.latest_count_ = 0
+        self.window_scores_ = np.empty(self.window_size)
+        self.first_window_ = np.empty((self.window_size, num_features))
+
+    def _count(self, leaves):
+        for tree in range(self.n_trees):
+            self.latest_mass_[tree] += np.bincount(leaves[tree], minlength=self.latest_mass_.shape[1])
+
+    def _leaves(self, X):
+        """Leaf index (0 .. 2**depth - 1) every row reaches in every tree: shape (n_trees, rows)."""
+        rows = np.arange(len(X))
+        leaves = np.empty((self.n_trees, len(X)), dtype=np.intp)
+        for tree in range(self.n_trees):
+            node = np.zeros(len(X), dtype=np.intp)
+            dims, values = self.split_dims_[tree], self.split_values_[tree]
+            for _ in range(self.depth):
+                node = 2 * node + 1 + (X[rows, dims[node]] >= values[node])
+            leaves[tree] = node - (2 ** self.depth - 1)
+        return leaves
+
+    def _score_leaves(self, leaves):
+        """IsolationForest.score_samples-style scores (-1 = most anomalous) from the leaf each row reaches."""
+        if self.reference_count_:
+            mass, count = self.reference_mass_, self.reference_count_
+        else:
+            mass, count = self.latest_mass_, self.latest_count_
+        if count == 0:
+            return np.full(leaves.shape[1], self.offset_) # Nothing seen yet (decision_function() only)
+        leaf_mass = np.zeros(leaves.shape[1])
+        for tree in range(self.n_trees):
+            leaf_mass += np.log2(1 + mass[tree][leaves[tree]] * 2.0 ** self.depth)
+        # Log of the leaf mass scaled to the whole space, over what it would be if the window's sessions
+        # were spread evenly: about 1 for typical sessions, 0 for a leaf nobody reached. Plays the role
+        # of the Isolation Forest's path length over its average, c(n).
+        relative_mass = leaf_mass / (self.n_trees * np.log2(1 + count))
+        return -2.0 ** -relative_mass
+
+    def decision_function(self, X):
+        """Scores rows without learning from them."""
+        X = self._transform(X)
+        if self.split_dims_ is None:
+            return np.zeros(len(X))
+        return self._score_leaves(self._leaves(X)) - self.offset_
+
+    def score_update(self, X):
+        """Scores each row against what came before it, then adds it to the current window."""
+        X = self._transform(X)
+        if self.split_dims_ is None:
+            self._start(X.shape[1])
+        scores = np.empty(len(X))
+        start = 0
+        while start < len(X): # Segments never cross a window switch
+            end = min(len(X), start + self.window_size - self.latest_count_)
+            if self.first_window_ is not None:
+                segment_scores = self._update_first_window(X[start:end])
+            else:
+                leaves = self._leaves(X[start:end])
+                segment_scores = self._score_leaves(leaves)
+                self._count(leaves)
+                self.latest_count_ += end - start
+            scores[start:end] = segment_scores - self.offset_
+            self.window_scores_[self.latest_count_ - (end - start):self.latest_count_] = segment_scores
+            if self.latest_count_ == self.window_size:
+                self._switch_window()
+            start = end
+        self.rows_seen_ += len(X)
+        return scores
+
+    def _update_first_window(self, X):
+        """
+        Adds rows of the first window and scores them against it, themselves included. The rows
+        are kept until the window is full, and the trees are redrawn around their range each time
+        it doubles, so they do not stay fitted to the range of a first batch of a single session.
+        """
+        rows = self.first_window_[:self.latest_count_ + len(X)]
+        rows[self.latest_count_:] = X
+        self.latest_count_ = len(rows)
+        if self.split_dims_ is None or len(rows) >= 2 * self.built_on_ or len(rows) == self.window_size:
+            self._build(rows)
+            self.latest_mass_[:] = 0
+            self._count(self._leaves(rows))
+            leaves = self._leaves(X)
+        else:
+            leaves = self._leaves(X)
+            self._count(leaves)
+        return self._score_leaves(leaves)
+
+    def _switch_window(self):
+        if self.contamination != 'auto':
+            self.offset_ = float(np.quantile(self.window_scores_, self.contamination))
+        self.reference_mass_, self.latest_mass_ = self.latest_mass_, self.reference_mass_
+        self.latest_mass_[:] = 0
+        self.reference_count_, self.latest_count_ = self.latest_count_, 0
+        self.first_window_ = None # The trees are final from here on
+
+    def memory_bytes(self):
+        return sum(array.nbytes for array in (self.split_dims_, self.split_values_, self.reference_mass_,
+                                              self.latest_mass_, self.window_scores_, self.first_window_)
+                   if array is not None)
+
+
+def score_stream(detector, chunks):
+    """Yields each chunk with iforest_suspiciousness_score / iforest_anomaly_prediction columns from `detector`."""
+    for chunk in chunks:
+        scores = detector.score_update(feature_store.feature_matrix(chunk, FEATURES).to_numpy())
+        yield chunk.assign(iforest_suspiciousness_score=scores,
+                           iforest_anomaly_prediction=np.where(scores < 0, -1, 1))
+
+
+def synthetic_sessions(num_sessions, anomaly_rate=0.02, seed=0):
+    """Count-like features (Poisson around per-feature lognormal means) with a share of planted anomalies."""
+    rng = np.random.default_rng(seed)
+    means = rng.lognormal(1.0, 1.0, len(FEATURES))
+    X = rng.poisson(means * rng.lognormal(0.0, 0.5, (num_sessions, 1)), (num_sessions, len(FEATURES))).astype(np.float64)
+    is_anomaly = rng.random(num_sessions) < anomaly_rate
+    boosted = rng.random((num_sessions, len(FEATURES))) < 0.2 # Anomalies spike a random fifth of their features
+    X[is_anomaly] += (boosted[is_anomaly] * rng.poisson(means * 8, (is_anomaly.sum(), len(FEATURES))))
+    return pd.DataFrame(X, columns=FEATURES), is_anomaly
+
+
+def benchmark(num_sessions=200_000, chunk_size=1_000, window_size=1_000):
+    """
+    Streams synthetic sessions through the online detector, `chunk_size` at a time, and
+    compares it with train.py's batch Isolation Forest fitted on all of them: rank agreement
+    of the scores (Spearman, overlap of the top 1%), how well each finds the planted
+    anomalies (ROC-AUC), and throughput.
+    """
+    from scipy.stats import spearmanr
+    from sklearn.ensemble import IsolationForest
+    from sklearn.metrics import roc_auc_score
+
+    df, is_anomaly = synthetic_sessions(num_sessions)
+    X = df.to_numpy(dtype=np.float32)
+
+    start = time.perf_counter()
+    iso_forest = IsolationForest(n_estimators=100, contamination='auto', random_state=42, n_jobs=-1).fit(X)
+    batch_scores = iso_forest.decision_function(X)
+    batch_seconds = time.perf_counter() - start
+
+    detector = HalfSpaceTrees(window_size=window_size)
+    online_scores = np.empty(num_sessions)
+    start = time.perf_counter()
+    for begin in range(0, num_sessions, chunk_size):
+        online_scores[begin:begin + chunk_size] = detector.score_update(X[begin:begin + chunk_size])
+    online_seconds = time.perf_counter() - start
+
+    # The online detector knows nothing for its first window; compare from the second one on
+    warm = slice(window_size, None)
+    top = max(1, int(0.01 * (num_sessions - window_size)))
+    top_batch = set(np.argsort(batch_scores[warm])[:top])
+    top_online = set(np.argsort(online_scores[warm])[:top])
+    print(f"{num_sessions} synthetic sessions ({is_anomaly.mean():.1%} planted anomalies), "
+          f"online chunks of {chunk_size}, window {window_size}")
+    print(f"{'':24}{'batch IF':>12}{'online HST':>12}")
+    print(f"{'sessions/s':24}{num_sessions / batch_seconds:>12,.0f}{num_sessions / online_seconds:>12,.0f}")
+    print(f"{'ROC-AUC (planted)':24}{roc_auc_score(is_anomaly[warm], -batch_scores[warm]):>12.4f}"
+          f"{roc_auc_score(is_anomaly[warm], -online_scores[warm]):>12.4f}")
+    print(f"{'flagged (score < 0)':24}{(batch_scores < 0).mean():>12.2%}{(online_scores < 0).mean():>12.2%}")
+    print(f"{'model memory (MB)':24}{'':>12}{detector.memory_bytes() / 1e6:>12.2f}")
+    print(f"Rank agreement: Spearman {spearmanr(batch_scores[warm], online_scores[warm]).statistic:.4f}, "
+          f"top 1% overlap {len(top_batch & top_online) / top:.1%}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Score new sessions with the online Half-Space Trees detector.")
+    parser.add_argument('source', nargs='?', help="feature_store table or CSV with the new sessions' features.")
+    parser.add_argument('--state', default=STATE_FILE, help="Where the detector is kept between runs.")
+    parser.add_argument('--reset', action='store_true', help="Start from a new detector.")
+    parser.add_argument('--window-size', type=int, default=1000, help="Sessions per window (new detector only).")
+    parser.add_argument('--contamination', default='auto', help="'auto' or the expected share of anomalies (new detector only).")
+    parser.add_argument('--chunk-size', type=int, default=10_000)
+    parser.add_argument('--benchmark', action='store_true', help="Compare with the batch Isolation Forest.")
+    parser.add_argument('--sessions', type=int, default=200_000, help="Synthetic sessions for --benchmark.")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        benchmark(args.sessions)
+        exit()
+    if args.source is None:
+        parser.error("give a table or CSV to score, or --benchmark")
+
+    if os.path.isfile(args.state) and not args.reset:
+        detector = joblib.load(args.state)
+        print(f"Loaded detector from {args.state} ({detector.rows_seen_} sessions seen).")
+    else:
+        contamination = args.contamination if args.contamination == 'auto' else float(args.contamination)
+        detector = HalfSpaceTrees(window_size=args.window_size, contamination=contamination)
+        print(f"New detector: {detector.n_trees} trees of depth {detector.depth}, window {detector.window_size}.")
+
+    num_rows = num_flagged = 0
+    start = time.perf_counter()
+    try:
+        for scored in score_stream(detector, feature_store.iter_table(
+                args.source, columns=feature_store.IDENTIFIER_COLUMNS + FEATURES, chunk_size=args.chunk_size)):
+            feature_store.append_table(scored, OUTPUT_TABLE)
+            num_rows += len(scored)
+            num_flagged += int((scored['iforest_anomaly_prediction'] == -1).sum())
+    except (FileNotFoundError, KeyError) as e:
+        print(f"Error: could not read '{args.source}' ({e}).")
+        exit()
+    seconds = time.perf_counter() - start
+
+    os.makedirs(os.path.dirname(args.state) or '.', exist_ok=True)
+    joblib.dump(detector, args.state)
+    print(f"Scored {num_rows} sessions in {seconds:.2f}s; {num_flagged} flagged as anomalous "
+          f"(prediction = -1). Appended to the '{OUTPUT_TABLE}' table.")
+    print(f"Detector ({detector.memory_bytes() / 1e6:.2f} MB, {detector.rows_seen_} sessions seen) saved to {args.state}")
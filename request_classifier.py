@@ -0,0 +1,256 @@
+"""
+Single-pass classifier deciding which captured requests the crawler logs.
+
+All patterns are built once when the classifier is created: static-asset extensions
+and content types become tuples for one str.endswith/startswith call, tracker
+parameters become a set of query keys, and URL keywords become one compiled regex.
+The beacon heuristics live in a rule table (BEACON_RULES) that can be swapped or
+extended without touching the classifier.
+
+The same object works offline on an existing network log:
+    python request_classifier.py reclassify behavior_data/network_log_<ts>.csv [out.csv]
+    python request_classifier.py --benchmark
+"""
+import csv
+import re
+import sys
+import time
+
+from domain_utils import get_main_domain, is_third_party
+
+# Define patterns for static assets and common benign requests
+IGNORE_CONTENT_TYPES_START = (
+    'image/', 'font/', 'text/css', 'video/', 'audio/'
+)
+# Extensions to ignore (case-insensitive)
+IGNORE_EXTENSIONS = (
+    '.css', '.jpg', '.jpeg', '.png', '.gif', '.webp', '.svg', '.ico',
+    '.woff', '.woff2', '.ttf', '.otf', '.eot',
+    '.mp4', '.webm', '.ogg', '.mp3', '.wav'
+)
+# Query parameters that commonly carry identifiers (matched on the parsed key)
+TRACKER_QUERY_KEYS = ('gclid', 'client_id', 'user_id', 'uid', 'event')
+TRACKER_QUERY_KEY_PREFIXES = ('utm_',)
+# Keywords matched anywhere in the URL
+TRACKER_URL_KEYWORDS = ('beacon',)
+DATA_SENDING_METHODS = ('POST', 'PUT', 'DELETE')
+LONG_URL_THRESHOLD = 150 # Arbitrary length, adjust
+
+# Classification labels
+STATIC_ASSET = 'static_asset'
+FIRST_PARTY = 'first_party'
+DATA_SENDING = 'data_sending'
+NOT_SUSPICIOUS = 'not_suspicious'
+
+
+class ClassifiedRequest:
+    """The fields rules look at. Query keys are parsed lazily, at most once."""
+    __slots__ = ('url', 'url_lower', 'method', 'status_code', 'content_type', 'response_body', '_query_keys')
+
+    def __init__(self, url, url_lower, method, status_code, content_type, response_body):
+        self.url = url
+        self.url_lower = url_lower
+        self.method = method
+        self.status_code = status_code
+        self.content_type = content_type
+        self.response_body = response_body
+        self._query_keys = None
+
+    @property
+    def query_keys(self):
+        if self._query_keys is None:
+            query = self.url_lower.partition('?')[2].partition('#')[0]
+            self._query_keys = {pair.partition('=')[0] for pair in query.split('&') if pair}
+        return self._query_keys
+
+
+# Heuristics for tracking beacons on third-party GETs, checked in order:
+# (label, rule(classifier, request) -> bool)
+BEACON_RULES = [
+    # URL is very long (often due to encoded data)
+    ('beacon_long_url', lambda clf, req: '?' in req.url and len(req.url) > clf.long_url_threshold),
+    # URL contains common tracking parameters (e.g., 'utm_', 'gclid', 'uid')
+    ('beacon_tracker_param', lambda clf, req: clf.has_tracker_param(req)),
+    # Response is often tiny (e.g., 204 No Content)
+    ('beacon_no_content', lambda clf, req: req.status_code == 204),
+    # ...or a 1x1 pixel image
+    ('beacon_small_image', lambda clf, req: req.content_type.startswith('image/')
+                                            and req.response_body is not None and 0 < len(req.response_body) < 500),
+]
+
+
+class RequestClassifier:
+    """
+    Decides in one pass whether a captured request is worth logging.
+
+    classify() returns (log_this_request, label), where label names the stage or rule
+    that decided: STATIC_ASSET, FIRST_PARTY, DATA_SENDING, a BEACON_RULES label, or
+    NOT_SUSPICIOUS.
+    """
+
+    def __init__(self, ignore_extensions=IGNORE_EXTENSIONS, ignore_content_types=IGNORE_CONTENT_TYPES_START,
+                 tracker_query_keys=TRACKER_QUERY_KEYS, tracker_query_key_prefixes=TRACKER_QUERY_KEY_PREFIXES,
+                 tracker_url_keywords=TRACKER_URL_KEYWORDS, long_url_threshold=LONG_URL_THRESHOLD,
+                 rules=None):
+        self.ignore_extensions = tuple(ext.lower() for ext in ignore_extensions)
+        self.ignore_content_types = tuple(ct.lower() for ct in ignore_content_types)
+        self.tracker_query_keys = frozenset(key.lower() for key in tracker_query_keys)
+        self.tracker_query_key_prefixes = tuple(prefix.lower() for prefix in tracker_query_key_prefixes)
+        self.tracker_url_keyword_re = re.compile('|'.join(re.escape(k.lower()) for k in tracker_url_keywords)) \
+            if tracker_url_keywords else None
+        self.long_url_threshold = long_url_threshold
+        self.rules = list(BEACON_RULES if rules is None else rules)
+
+    def add_rule(self, label, rule, index=None):
+        """Registers an extra beacon rule, appended or inserted at `index`."""
+        self.rules.insert(len(self.rules) if index is None else index, (label, rule))
+
+    def is_static_asset(self, url_lower, content_type):
+        return url_lower.endswith(self.ignore_extensions) or content_type.startswith(self.ignore_content_types)
+
+    def capture_scope(self):
+        """
+        A selenium-wire scope regex matching every URL that does *not* end in an ignored
+        extension, so the proxy never captures (or stores bodies of) those assets.
+        """
+        extensions = '|'.join(re.escape(ext.lstrip('.')) for ext in self.ignore_extensions)
+        return rf"(?i)^(?!.*\.(?:{extensions})$)"
+
+    def has_tracker_param(self, req):
+        if self.tracker_url_keyword_re is not None and self.tracker_url_keyword_re.search(req.url_lower):
+            return True
+        if '?' not in req.url_lower:
+            return False
+        keys = req.query_keys
+        if not self.tracker_query_keys.isdisjoint(keys):
+            return True
+        return bool(self.tracker_query_key_prefixes) and any(key.startswith(self.tracker_query_key_prefixes) for key in keys)
+
+    def classify(self, url, method, status_code, content_type, page_domain, response_body=None):
+        """
+        `content_type` is the response Content-Type, `page_domain` the registrable domain
+        of the page being crawled and `response_body` the raw bytes if available.
+        """
+        url_lower = url.lower()
+        content_type = (content_type or '').lower()
+
+        # --- STAGE 1: Basic Asset Filtering ---
+        if self.is_static_asset(url_lower, content_type):
+            return False, STATIC_ASSET
+
+        # --- STAGE 2/3: Only third-party requests are logged ---
+        if not is_third_party(page_domain, get_main_domain(url)):
+            return False, FIRST_PARTY
+
+        # --- STAGE 4: Criteria for "suspicious" ---
+        # 1. It's a POST/PUT/DELETE request (more likely to send data)
+        if method in DATA_SENDING_METHODS:
+            return True, DATA_SENDING
+        # 2. It's a GET request to a third-party that looks like a tracking pixel/beacon
+        if method == 'GET':
+            req = ClassifiedRequest(url, url_lower, method, status_code, content_type, response_body)
+            for label, rule in self.rules:
+                if rule(self, req):
+                    return True, label
+        return False, NOT_SUSPICIOUS
+
+
+def reclassify_network_log(input_path, output_path, classifier=None):
+    """
+    Re-runs the classifier over an existing network log and writes it back out with
+    'log_decision' and 'classification' columns appended. Returns label counts.
+    """
+    classifier = classifier or RequestClassifier()
+    counts = {}
+    with open(input_path, newline='', encoding='utf-8') as f_in, \
+         open(output_path, 'w', newline='', encoding='utf-8') as f_out:
+        reader = csv.DictReader(f_in)
+        writer = csv.DictWriter(f_out, fieldnames=list(reader.fieldnames) + ['log_decision', 'classification'])
+        writer.writeheader()
+        for row in reader:
+            try:
+                status_code = int(row['response_status'])
+            except (TypeError, ValueError):
+                status_code = None
+            log_decision, label = classifier.classify(
+                row['request_url'], row['request_method'], status_code,
+                row['response_content_type'], get_main_domain(row['page_url'])
+            )
+            row['log_decision'] = int(log_decision)
+            row['classification'] = label
+            counts[label] = counts.get(label, 0) + 1
+            writer.writerow(row)
+    return counts
+
+
+def _legacy_classify(url, method, status_code, content_type, page_domain):
+    """The original per-call stage logic from log_network_requests, for benchmarking only."""
+    ignore_content_types_start = ('image/', 'font/', 'text/css', 'video/', 'audio/')
+    ignore_extensions = ('.css', '.jpg', '.jpeg', '.png', '.gif', '.webp', '.svg', '.ico',
+                         '.woff', '.woff2', '.ttf', '.otf', '.eot', '.mp4', '.webm', '.ogg', '.mp3', '.wav')
+    url_lower = url.lower()
+    if any(url_lower.endswith(ext) for ext in ignore_extensions):
+        return False
+    if any(content_type.startswith(ct) for ct in ignore_content_types_start):
+        return False
+    if not is_third_party(page_domain, get_main_domain(url)):
+        return False
+    if method in ('POST', 'PUT', 'DELETE'):
+        return True
+    if method == 'GET':
+        if '?' in url and len(url) > 150:
+            return True
+        if any(p in url_lower for p in ['utm_', 'gclid=', 'client_id=', 'user_id=', 'uid=', 'event=', 'beacon']):
+            return True
+        if status_code == 204:
+            return True
+    return False
+
+
+def _synthetic_requests(num_requests=100000):
+    import random
+    rng = random.Random(7)
+    hosts = ['www.allrecipes.com', 'www.google-analytics.com', 'securepubads.g.doubleclick.net',
+             'connect.facebook.net', 'bat.bing.com', 'ib.adnxs.com', 'cdn.jsdelivr.net',
+             'pixel.rubiconproject.com', 'images.immediate.co.uk', 'www.bbcgoodfood.com']
+    paths = ['/', '/img/hero.jpg', '/css/site.css', '/fonts/a.woff2', '/js/app.js', '/collect?v=1&cid=1.2&t=pageview',
+             '/tr?id=1&ev=PageView&dl=https%3A%2F%2Fwww.allrecipes.com%2F', '/beacon/v2', '/sync?uid=abc',
+             '/ads?utm_source=x&utm_medium=y', '/api/v1/data?' + 'x' * 160]
+    methods = ['GET'] * 8 + ['POST', 'OPTIONS']
+    content_types = ['text/html', 'application/javascript', 'application/json', 'image/gif', 'text/css', '']
+    statuses = [200, 200, 200, 204, 302, 404]
+    return [(f"https://{rng.choice(hosts)}{rng.choice(paths)}", rng.choice(methods), rng.choice(statuses),
+             rng.choice(content_types), rng.choice(['allrecipes.com', 'bbcgoodfood.com']))
+            for _ in range(num_requests)]
+
+
+def benchmark(num_requests=100000):
+    """Compares the precompiled classifier with the original staged checks on synthetic requests."""
+    requests = _synthetic_requests(num_requests)
+    classifier = RequestClassifier()
+
+    start = time.perf_counter()
+    legacy_logged = sum(_legacy_classify(*r) for r in requests)
+    legacy_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    logged = sum(classifier.classify(*r)[0] for r in requests)
+    classifier_s = time.perf_counter() - start
+
+    print(f"{num_requests} synthetic requests")
+    print(f"original staged checks: {legacy_s:.3f}s ({num_requests / legacy_s:,.0f} req/s), {legacy_logged} logged")
+    print(f"RequestClassifier:      {classifier_s:.3f}s ({num_requests / classifier_s:,.0f} req/s), {logged} logged")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 3 and sys.argv[1] == 'reclassify':
+        input_path = sys.argv[2]
+        output_path = sys.argv[3] if len(sys.argv) > 3 else input_path.replace('.csv', '_reclassified.csv')
+        label_counts = reclassify_network_log(input_path, output_path)
+        print(f"Reclassified log saved to: {output_path}")
+        for label, count in sorted(label_counts.items(), key=lambda kv: -kv[1]):
+            print(f"  {label}: {count}")
+    elif '--benchmark' in sys.argv:
+        benchmark()
+    else:
+        print(__doc__)
@@ -0,0 +1,214 @@
+"""
+Long-lived local scoring service for a saved Random Forest.
+
+The model is loaded once at start-up; clients then POST batches of session feature rows
+and get back a label and a class-1 probability per row. Both come from one predict_proba
+pass: the label is the class with the highest probability, exactly what predict() would
+return, without walking the trees a second time.
+
+Endpoints (localhost only):
+    POST /score   {"rows": [{"<feature>": value, ...}, ...]}
+                  -> {"predicted_label": [...], "predicted_proba_class1": [...], "latency_ms": ...}
+    GET  /stats   batches/rows scored, throughput and latency percentiles
+    GET  /health  model path and number of features
+
+Usage:
+    python scoring_service.py [--model trains_output/rf_model_<run>.joblib] [--port 8765]
+    python scoring_service.py --benchmark [--batch-size 500]
+"""
+import argparse
+import glob
+import json
+import os
+import threading
+import time
+import urllib.request
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import joblib
+import numpy as np
+import pandas as pd
+
+import feature_store
+
+MODEL_FOLDER = "trains_output"
+DEFAULT_PORT = 8765
+LATENCY_WINDOW = 10_000 # Batches kept for the latency percentiles
+
+
+def latest_model(folder=MODEL_FOLDER):
+    """Most recent rf_model_<timestamp>.joblib in `folder`, or None."""
+    models = sorted(glob.glob(os.path.join(folder, "rf_model_*.joblib")))
+    return models[-1] if models else None
+
+
+def model_features(model):
+    """Feature columns the model was trained on, in training order."""
+    if hasattr(model, 'feature_names_in_'):
+        return list(model.feature_names_in_)
+    return list(feature_store.FEATURE_COLUMNS)
+
+
+def predict_with_proba(model, X):
+    """
+    (labels, class-1 probabilities) from a single predict_proba pass. The label is the
+    argmax class, the same rule RandomForestClassifier.predict() applies to the same
+    probabilities, so the result is identical to calling predict() separately.
+    """
+    proba = model.predict_proba(X)
+    labels = model.classes_.take(np.argmax(proba, axis=1))
+    positive = list(model.classes_).index(1) if 1 in model.classes_ else proba.shape[1] - 1
+    return labels, proba[:, positive]
+
+
+class ScoringStats:
+    """Batch counts, throughput and a window of per-batch latencies. Thread-safe."""
+
+    def __init__(self):
+        self.started = time.time()
+        self.batches = 0
+        self.rows = 0
+        self.busy_seconds = 0.0
+        self.latencies_ms = deque(maxlen=LATENCY_WINDOW)
+        self._lock = threading.Lock()
+
+    def add(self, rows, seconds):
+        with self._lock:
+            self.batches += 1
+            self.rows += rows
+            self.busy_seconds += seconds
+            self.latencies_ms.append(seconds * 1000)
+
+    def summary(self):
+        with self._lock:
+            latencies = np.array(self.latencies_ms)
+            summary = {
+                'batches': self.batches,
+                'rows': self.rows,
+                'uptime_seconds': round(time.time() - self.started, 1),
+                'rows_per_second': round(self.rows / self.busy_seconds, 1) if self.busy_seconds else 0.0,
+            }
+        if len(latencies):
+            for percentile in (50, 90, 99):
+                summary[f"latency_ms_p{percentile}"] = round(float(np.percentile(latencies, percentile)), 2)
+            summary['latency_ms_max'] = round(float(latencies.max()), 2)
+        return summary
+
+
+class ScoringService:
+    """The loaded model plus its statistics; score() is safe to call from several threads."""
+
+    def __init__(self, model_path):
+        self.model_path = model_path
+        self.model = joblib.load(model_path)
+        self.features = model_features(self.model)
+        self.stats = ScoringStats()
+
+    def score(self, rows):
+        """Scores a list of feature dicts. Raises KeyError if a feature the model needs is missing."""
+        start = time.perf_counter()
+        X = feature_store.feature_matrix(pd.DataFrame(rows), self.features)
+        labels, proba = predict_with_proba(self.model, X)
+        seconds = time.perf_counter() - start
+        self.stats.add(len(rows), seconds)
+        return {'predicted_label': labels.tolist(), 'predicted_proba_class1': proba.tolist(),
+                'latency_ms': round(seconds * 1000, 2)}
+
+
+class ScoringRequestHandler(BaseHTTPRequestHandler):
+    service = None # Set by make_server()
+
+    def _reply(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == '/stats':
+            self._reply(200, self.service.stats.summary())
+        elif self.path == '/health':
+            self._reply(200, {'model': self.service.model_path, 'num_features': len(self.service.features)})
+        else:
+            self._reply(404, {'error': f"Unknown path {self.path}"})
+
+    def do_POST(self):
+        if self.path != '/score':
+            self._reply(404, {'error': f"Unknown path {self.path}"})
+            return
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            rows = json.loads(self.rfile.read(length))['rows']
+            self._reply(200, self.service.score(rows))
+        except KeyError as e:
+            self._reply(400, {'error': f"Missing field or feature: {e}"})
+        except (ValueError, TypeError) as e:
+            self._reply(400, {'error': f"Bad request: {e}"})
+
+    def log_message(self, format, *args):
+        pass # One line per batch would drown the console; see /stats instead
+
+
+def make_server(service, port=DEFAULT_PORT):
+    """An HTTP server on localhost that answers with `service` (one thread per connection)."""
+    handler = type('BoundScoringRequestHandler', (ScoringRequestHandler,), {'service': service})
+    return ThreadingHTTPServer(('127.0.0.1', port), handler)
+
+
+def score_batch(rows, url=f"http://127.0.0.1:{DEFAULT_PORT}"):
+    """Client side: sends one batch of feature dicts to a running service and returns its reply."""
+    request = urllib.request.Request(f"{url}/score", data=json.dumps({'rows': rows}).encode('utf-8'),
+                                     headers={'Content-Type': 'application/json'})
+    with urllib.request.urlopen(request) as response:
+        return json.loads(response.read())
+
+
+def benchmark(model_path, batch_size=500, num_batches=40):
+    """Serves the model on a free port and scores synthetic batches against it through HTTP."""
+    service = ScoringService(model_path)
+    server = make_server(service, port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    rng = np.random.default_rng(0)
+    rows = pd.DataFrame(rng.integers(0, 50, (batch_size, len(service.features))).astype(float),
+                        columns=service.features).to_dict('records')
+    start = time.perf_counter()
+    for _ in range(num_batches):
+        score_batch(rows, url)
+    elapsed = time.perf_counter() - start
+    server.shutdown()
+
+    print(f"{num_batches} batches of {batch_size} rows over HTTP: {num_batches * batch_size / elapsed:,.0f} rows/s end to end")
+    print(f"Model time per batch: {json.dumps(service.stats.summary())}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve a saved Random Forest for batch scoring on localhost.")
+    parser.add_argument('--model', default=None, help=f"Model file (default: newest rf_model_*.joblib in {MODEL_FOLDER}/).")
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--benchmark', action='store_true', help="Score synthetic batches against a temporary server.")
+    parser.add_argument('--batch-size', type=int, default=500)
+    args = parser.parse_args()
+
+    model_path = args.model or latest_model()
+    if model_path is None or not os.path.isfile(model_path):
+        print(f"Error: no model file found (looked for {args.model or os.path.join(MODEL_FOLDER, 'rf_model_*.joblib')}).")
+        exit()
+
+    if args.benchmark:
+        benchmark(model_path, args.batch_size)
+    else:
+        service = ScoringService(model_path)
+        server = make_server(service, args.port)
+        print(f"Scoring service for {model_path} ({len(service.features)} features) on http://127.0.0.1:{args.port}")
+        print("POST /score with {\"rows\": [...]}, GET /stats for throughput and latency. Ctrl+C to stop.")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        server.server_close()
+        print(f"Stopped. {json.dumps(service.stats.summary())}")
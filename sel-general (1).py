@@ -1,27 +1,66 @@
 from seleniumwire import webdriver # <-- Import from seleniumwire
 from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.common.by import By
 from selenium.webdriver.common.action_chains import ActionChains
 from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from urllib.parse import urlparse
 import time
 import random
-import csv
 from datetime import datetime
 import os
 import json 
+import argparse
+import queue
+import threading
+from log_writer import BufferedCsvWriter
+from crawl_checkpoint import CrawlCheckpoint
+from domain_utils import get_main_domain
+from request_classifier import RequestClassifier, DATA_SENDING
 
-# Configuration
+# Configuration (defaults; see --help for the command-line overrides)
 OUTPUT_FOLDER = "behavior_data"
-os.makedirs(OUTPUT_FOLDER, exist_ok=True)
 TIMESTAMP_NOW = datetime.now().strftime('%Y%m%d_%H%M%S')
-BEHAVIOR_LOG_FILE = os.path.join(OUTPUT_FOLDER, f"behavior_log_{TIMESTAMP_NOW}.csv")
-NETWORK_LOG_FILE = os.path.join(OUTPUT_FOLDER, f"network_log_{TIMESTAMP_NOW}.csv") 
 
-service = Service('C:/Users/anore/Downloads/chromedriver-win64/chromedriver.exe') 
-driver = webdriver.Chrome(service=service) # Basic selenium-wire initialization
-action = ActionChains(driver)
+CHROMEDRIVER_PATH = None # None lets Selenium Manager locate chromedriver, or e.g. 'C:/.../chromedriver.exe'
+HEADLESS = False
+BLOCK_ASSETS = False # Don't load images/fonts in the browser (they are never logged anyway)
+# Font URLs blocked through the DevTools protocol when BLOCK_ASSETS is on (images use a Chrome pref)
+BLOCKED_ASSET_URL_PATTERNS = ['*.woff', '*.woff2', '*.ttf', '*.otf', '*.eot']
+# Requests the selenium-wire proxy aborts when BLOCK_ASSETS is on, by the browser's Sec-Fetch-Dest header
+BLOCKED_FETCH_DESTINATIONS = ('image', 'font', 'video', 'audio')
+# ...and whose bodies it empties by Content-Type. Stylesheets are not blocked: the page still needs them to render
+BLOCKED_CONTENT_TYPES = ('image/', 'font/', 'video/', 'audio/')
+# Filter in the proxy: asset URLs are kept out of selenium-wire's capture scope entirely
+FILTER_IN_PROXY = True
+REQUEST_STORAGE_MAX_SIZE = 5000 # Captured requests kept in memory between log_network_requests calls
+NUM_BROWSERS = 4 # Parallel browser instances, each pulling sites from a shared queue
+LOG_FLUSH_BATCH_SIZE = 500 # Rows buffered before the log writer hits the disk
+LOG_FLUSH_INTERVAL = 5.0 # ...or seconds since the last write, whichever comes first
+
+# Decides which captured requests get logged; patterns are compiled once, not per call
+REQUEST_CLASSIFIER = RequestClassifier()
+
+# Waiting strategy
+# "adaptive": wait for document.readyState and for selenium-wire to stop capturing new requests
+# "fixed":    the original random sleeps after every load and click
+WAIT_MODE = "adaptive"
+PAGE_READY_TIMEOUT = 15 # Max seconds to wait for document.readyState == 'complete'
+NETWORK_IDLE_TIME = 1.0 # Seconds without a new captured request that count as idle
+NETWORK_IDLE_TIMEOUT = 8 # Max seconds to wait for network idle
+COOKIE_BANNER_TIMEOUT = 3 # Total seconds to probe for a cookie banner (all selectors at once)
+# Extra randomized human-like dwell (min, max seconds) in adaptive mode, used for the
+# post-load pause, hover pauses and mouse collection windows. None = no dwell.
+# Fixed mode always uses the original per-step ranges.
+DWELL_TIME_RANGE = None
+
+CLICKABLE_SELECTOR = "a, button, input[type='submit'], [role='button']"
+
+# Attempt to handle cookie banners (very basic example)
+COOKIE_BANNER_SELECTORS = [
+    "button[id*='consent']", "button[class*='consent']",
+    "button[id*='cookie']", "button[class*='cookie']",
+    "div[aria-label*='cookie'] button",
+    "button:contains('Accept')", "button:contains('Agree')", # May need jQuery for :contains (skipped if the browser rejects it)
+    "//button[contains(text(),'Accept') or contains(text(),'Agree') or contains(text(),'Got it')]" # XPath
+]
 
 # Recipe websites to visit
 RECIPE_SITES = [
@@ -680,154 +719,182 @@ RECIPE_SITES = [
     "https://www.kawalingpinoy.com/category/eggs-and-dairy/",
 ]
 
-# Data collection structure
-behavior_data = []
-network_data = [] # <-- New list for network events
+BEHAVIOR_LOG_HEADER = [
+    "session_id", "timestamp", "url", "event_type",
+    "pos_x", "pos_y", "element_tag",
+    "element_text", "details"
+]
+NETWORK_LOG_HEADER = [
+    "session_id", "capture_timestamp", "page_url", "associated_action",
+    "request_method", "request_url", "response_status", "response_reason",
+    "request_referer", "response_content_type", "request_body_snippet" # Changed headers
+]
+
+def abort_asset_request(request):
+    """selenium-wire request interceptor: asset downloads are aborted before they leave the proxy."""
+    if request.headers.get('Sec-Fetch-Dest') in BLOCKED_FETCH_DESTINATIONS:
+        request.abort()
+
+
+def drop_asset_response(request, response):
+    """selenium-wire response interceptor: empties blocked asset bodies that were only recognizable by content type."""
+    if (response.headers.get('Content-Type') or '').lower().startswith(BLOCKED_CONTENT_TYPES):
+        response.body = b''
+
+
+def create_driver(headless=HEADLESS, block_assets=BLOCK_ASSETS, chromedriver_path=CHROMEDRIVER_PATH,
+                  filter_in_proxy=FILTER_IN_PROXY):
+    """Starts a new selenium-wire Chrome instance."""
+    options = webdriver.ChromeOptions()
+    if headless:
+        options.add_argument('--headless=new')
+        options.add_argument('--no-sandbox') # Needed on most Linux crawl boxes / containers
+        options.add_argument('--disable-dev-shm-usage')
+        options.add_argument('--window-size=1366,900') # Clickables need a real viewport to be "visible"
+    if block_assets:
+        options.add_experimental_option('prefs', {'profile.managed_default_content_settings.images': 2})
 
-def get_main_domain(url_str):
+    seleniumwire_options = {}
+    if filter_in_proxy:
+        # Captured requests are dropped after every log_network_requests call, so memory is enough
+        seleniumwire_options = {'request_storage': 'memory', 'request_storage_max_size': REQUEST_STORAGE_MAX_SIZE}
+
+    service = Service(chromedriver_path) if chromedriver_path else Service()
+    driver = webdriver.Chrome(service=service, options=options, seleniumwire_options=seleniumwire_options)
+    if filter_in_proxy:
+        driver.scopes = [REQUEST_CLASSIFIER.capture_scope()]
+        if block_assets:
+            driver.request_interceptor = abort_asset_request
+            driver.response_interceptor = drop_asset_response
+    if block_assets:
+        driver.execute_cdp_cmd('Network.enable', {})
+        driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': BLOCKED_ASSET_URL_PATTERNS})
+    return driver
+
+
+def benchmark_proxy_filtering(url, headless=HEADLESS, chromedriver_path=CHROMEDRIVER_PATH, settle_seconds=8):
     """
-    Extracts the main domain (e.g., 'example.com') from a full URL.
-    Handles cases with and without schemes, and common subdomains like 'www'.
+    Loads `url` once per proxy configuration and reports how much selenium-wire captured:
+    request count, stored response body bytes and page load time.
     """
-    if not url_str:
-        return None
-    try:
-        # Ensure the URL has a scheme for urlparse
-        if not url_str.startswith(('http://', 'https://', '//')):
-            # If scheme is missing and it's not a protocol-relative URL, prepend http
-            if not url_str.startswith('//'):
-                 url_str = 'http://' + url_str
-            else: # For protocol-relative URLs like //example.com/path
-                url_str = 'http:' + url_str
-
-
-        parsed_url = urlparse(url_str)
-        hostname = parsed_url.hostname
-        if not hostname:
-            return None
-
-        parts = hostname.split('.')
-        if len(parts) > 1:
-            # Handle cases like 'www.example.com' -> 'example.com'
-            # Handle 'example.co.uk' -> 'example.co.uk'
-            # This is a simplification; for true eTLD+1, 'tldextract' library is more robust
-            if parts[0] == 'www' and len(parts) > 2:
-                return ".".join(parts[-2:]) if len(parts[-2:]) > 1 else ".".join(parts[-3:]) if len(parts) >2 else hostname # handles .co.uk etc.
-            elif len(parts) >=2 :
-                 return ".".join(parts[-2:]) if len(parts[-2:]) > 1 else ".".join(parts[-3:]) if len(parts) >2 else hostname # handles .co.uk etc.
-        return hostname
-    except Exception:
-        return None
-    
-def log_interaction(event_type, element=None, pos_x=None, pos_y=None, details=None):
-    """Logs user interaction data"""
-    timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
-    current_url = "N/A"
-    try:
-        current_url = driver.current_url
-    except Exception:
-        pass # Driver might be closed or in an invalid state
+    configurations = [
+        ("capture everything", {'filter_in_proxy': False, 'block_assets': False}),
+        ("filter in proxy", {'filter_in_proxy': True, 'block_assets': False}),
+        ("filter + block assets", {'filter_in_proxy': True, 'block_assets': True}),
+    ]
+    print(f"Proxy capture benchmark on {url}")
+    for label, driver_kwargs in configurations:
+        driver = create_driver(headless=headless, chromedriver_path=chromedriver_path, **driver_kwargs)
+        try:
+            start = time.perf_counter()
+            driver.get(url)
+            load_s = time.perf_counter() - start
+            time.sleep(settle_seconds) # Same fixed window for every configuration
+            captured = driver.requests
+            body_bytes = sum(len(r.response.body or b'') for r in captured if r.response)
+            print(f"  {label:<22} load {load_s:6.2f}s  captured {len(captured):5d} requests  "
+                  f"stored bodies {body_bytes / 1024:10.1f} KiB")
+        finally:
+            driver.quit()
 
-    element_text_val = "N/A"
-    element_tag_val = "N/A"
 
-    if element:
-        try:
-            element_text_val = element.text.replace('\n', ' ').strip()[:100] if element.text else "N/A"
-            element_tag_val = element.tag_name
-        except Exception: # Catch StaleElementReferenceException or others
-            element_text_val = "Error retrieving text"
-            element_tag_val = "Error retrieving tag"
-
-    behavior_data.append([
-        timestamp,
-        current_url,
-        event_type,
-        pos_x if pos_x else "N/A",
-        pos_y if pos_y else "N/A",
-        element_tag_val,
-        element_text_val,
-        details if details else "N/A"
-    ])
-
-def log_network_requests(page_url, associated_action="page_load"):
+def load_site_list(path):
+    """Reads one URL per line, skipping blank lines and '#' comments."""
+    with open(path, encoding='utf-8') as f:
+        return [line.strip() for line in f if line.strip() and not line.lstrip().startswith('#')]
+
+
+class CrawlWorker:
     """
-    Logs network requests, focusing on potential third-party tracking
-    and excluding common static assets.
+    One browser in the crawl pool. Pulls (session_id, url) pairs from the shared
+    site queue and tags every behavior/network row it collects with that session id.
+    Rows go straight to the shared log writers, so nothing accumulates in memory.
+    Site start/finish is recorded in the checkpoint journal together with the flushed log offsets.
     """
-    timestamp_capture = datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
-    current_site_main_domain = get_main_domain(page_url)
-
-    # Define patterns for static assets and common benign requests
-    # More specific content types to ignore.
-    IGNORE_CONTENT_TYPES_START = (
-        'image/', 'font/', 'text/css', 'video/', 'audio/'
-    )
-    # Extensions to ignore (case-insensitive)
-    IGNORE_EXTENSIONS = (
-        '.css', '.jpg', '.jpeg', '.png', '.gif', '.webp', '.svg', '.ico',
-        '.woff', '.woff2', '.ttf', '.otf', '.eot',
-        '.mp4', '.webm', '.ogg', '.mp3', '.wav'
-    )
-    # Known CDNs or utility domains you might consider "less suspicious" or want to exclude
-    # This list needs careful curation and depends on your definition of "unauthorized"
-    KNOWN_BENIGN_DOMAINS_SUFFIXES = (
-        # Content Delivery Networks (CDNs) often host JS/CSS for many sites
-        # 'bootstrapcdn.com', 'cloudflare.com', 'jsdelivr.net', 'unpkg.com',
-        # 'googleapis.com', # Can be for fonts, APIs, but also analytics
-        # 'gstatic.com',    # Often for fonts or static Google content
-    )
-
-
-    new_network_events = []
-
-    for request in driver.requests:
-        if not request.response:  # Skip requests without responses
-            continue
-
-        request_url_lower = request.url.lower()
-        response_content_type = request.response.headers.get('Content-Type', '').lower()
-        request_main_domain = get_main_domain(request.url)
-
-        # --- STAGE 1: Basic Asset Filtering ---
-        # Filter by common static file extensions
-        if any(request_url_lower.endswith(ext) for ext in IGNORE_EXTENSIONS):
-            continue
-        # Filter by common static content types in response
-        if any(response_content_type.startswith(ct_start) for ct_start in IGNORE_CONTENT_TYPES_START):
-            continue
-
-        # --- STAGE 2: Third-Party Identification ---
-        is_third_party = True # Assume third-party unless proven otherwise
-        if current_site_main_domain and request_main_domain:
-            if current_site_main_domain == request_main_domain:
-                is_third_party = False
-            # Handle subdomains of the current site as first-party
-            elif request_main_domain.endswith("." + current_site_main_domain):
-                 is_third_party = False
-
-
-        # --- STAGE 3: Filtering out "known benign" or focusing only on third-party ---
-        # If you only want third-party tracking requests:
-        if not is_third_party:
-            # You *might* want to log first-party POST requests if they send a lot of data
-            # or if you suspect first-party overreach. For now, we skip all first-party.
-            continue
-
-        # Optional: Filter out requests to known benign third-party utility domains (CDNs, etc.)
-        # This is tricky as these can also be used for tracking indirectly
-        # if any(request_main_domain.endswith(suffix) for suffix in KNOWN_BENIGN_DOMAINS_SUFFIXES):
-        #     continue
-
-        # --- STAGE 4: Selective Body/Header Logging (Criteria for "suspicious") ---
-        req_body_short = "N/A"
-        log_this_request = False
-
-        # Criteria for logging a request:
-        # 1. It's a POST/PUT/DELETE request (more likely to send data)
-        if request.method in ('POST', 'PUT', 'DELETE'):
-            log_this_request = True
-            if request.body: # Only get body if method suggests data sending
+
+    def __init__(self, worker_id, site_queue, stop_event, behavior_log, network_log, checkpoint, driver_options):
+        self.worker_id = worker_id
+        self.site_queue = site_queue
+        self.stop_event = stop_event
+        self.behavior_log = behavior_log
+        self.network_log = network_log
+        self.checkpoint = checkpoint
+        self.driver_options = driver_options
+        self.driver = None
+        self.action = None
+        self.session_id = None
+
+    def log_interaction(self, event_type, element=None, pos_x=None, pos_y=None, details=None, timestamp=None, url=None,
+                        element_info=None):
+        """
+        Logs user interaction data. `timestamp` and `url` can be passed in when they
+        are already known (e.g. batched mouse events) to skip the current_url round trip.
+        `element_info` is a find_clickables() entry; its tag/text are used instead of
+        asking the browser for element.text / element.tag_name.
+        """
+        if timestamp is None:
+            timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
+        current_url = url if url is not None else "N/A"
+        if url is None:
+            try:
+                current_url = self.driver.current_url
+            except Exception:
+                pass # Driver might be closed or in an invalid state
+
+        element_text_val = "N/A"
+        element_tag_val = "N/A"
+
+        if element_info:
+            element_text_val = element_info['text'] or "N/A"
+            element_tag_val = element_info['tag']
+        elif element:
+            try:
+                element_text_val = element.text.replace('\n', ' ').strip()[:100] if element.text else "N/A"
+                element_tag_val = element.tag_name
+            except Exception: # Catch StaleElementReferenceException or others
+                element_text_val = "Error retrieving text"
+                element_tag_val = "Error retrieving tag"
+
+        self.behavior_log.write([
+            self.session_id,
+            timestamp,
+            current_url,
+            event_type,
+            pos_x if pos_x else "N/A",
+            pos_y if pos_y else "N/A",
+            element_tag_val,
+            element_text_val,
+            details if details else "N/A"
+        ])
+
+    def log_network_requests(self, page_url, associated_action="page_load"):
+        """
+        Logs network requests, focusing on potential third-party tracking
+        and excluding common static assets.
+        """
+        driver = self.driver
+        timestamp_capture = datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
+        current_site_main_domain = get_main_domain(page_url)
+
+        new_network_events = []
+
+        for request in driver.requests:
+            if not request.response:  # Skip requests without responses
+                continue
+
+            response_content_type = request.response.headers.get('Content-Type', '').lower()
+
+            # --- STAGES 1-4: asset filtering, third-party check and tracking heuristics in one pass ---
+            log_this_request, classification = REQUEST_CLASSIFIER.classify(
+                request.url, request.method, request.response.status_code,
+                response_content_type, current_site_main_domain, request.response.body
+            )
+            if not log_this_request:
+                continue
+
+            # Only requests that send data get their body captured
+            req_body_short = "N/A"
+            if classification == DATA_SENDING and request.body:
                  try:
                      # Check if body looks like JSON or form data (often used for tracking payloads)
                      req_content_type_lower = request.headers.get('Content-Type', '').lower()
@@ -838,25 +905,9 @@ def log_network_requests(page_url, associated_action="page_load"):
                  except Exception:
                      req_body_short = f"[Binary or Undecodable Body - Size: {len(request.body)} bytes]"
 
-        # 2. It's a GET request to a third-party that looks like a tracking pixel/beacon
-        #    (often small, might have query params with PII or identifiers)
-        elif request.method == 'GET' and is_third_party:
-            # Heuristics for tracking beacons:
-            # - URL contains common tracking parameters (e.g., 'utm_', 'gclid', 'uid', 'idfa')
-            # - URL is very long (often due to encoded data)
-            # - Response is often tiny (e.g., 1x1 pixel image, or 204 No Content)
-            if '?' in request.url and len(request.url) > 150: # Arbitrary length, adjust
-                log_this_request = True
-            elif any(tracker_param in request_url_lower for tracker_param in ['utm_','gclid=','client_id=','user_id=','uid=','event=','beacon']):
-                log_this_request = True
-            elif request.response.status_code == 204 or \
-                 (response_content_type.startswith('image/') and request.response.body and len(request.response.body) < 500): # Small image
-                log_this_request = True
-
-
-        # --- STAGE 5: Log if it meets criteria ---
-        if log_this_request:
+            # --- STAGE 5: Log it ---
             new_network_events.append([
+                self.session_id,
                 timestamp_capture,
                 page_url,
                 associated_action,
@@ -869,108 +920,185 @@ def log_network_requests(page_url, associated_action="page_load"):
                 req_body_short, # Only populated if criteria met
             ])
 
-    if new_network_events:
-        network_data.extend(new_network_events)
-    del driver.requests
+        if new_network_events:
+            self.network_log.writerows(new_network_events)
+        del driver.requests
 
-def collect_mouse_movements(duration=10):
-    start_time = time.time()
-    last_x, last_y = None, None
-    try:
-        while time.time() - start_time < duration:
-            current_x = driver.execute_script("return window.mouseX")
-            current_y = driver.execute_script("return window.mouseY")
-
-            if (current_x is not None and current_y is not None) and \
-               (current_x != last_x or current_y != last_y):
-                log_interaction("mouse_move", pos_x=current_x, pos_y=current_y)
-                last_x, last_y = current_x, current_y
+    def collect_mouse_movements(self, duration=10):
+        """
+        Lets the page run for `duration` seconds, then drains every mouse event the page
+        buffered in the meantime (see setup_mouse_tracking) with a single script call.
+        """
+        time.sleep(duration)
+        self.drain_mouse_events()
+
+    def drain_mouse_events(self):
+        """Fetches and clears the in-page mouse event buffer, logging each event with its own timestamp."""
+        try:
+            page_url, events = self.driver.execute_script("""
+            var events = window.__mouseEvents || [];
+            window.__mouseEvents = [];
+            return [window.location.href, events];
+            """)
+        except Exception as e:
+            print(f"Error during mouse movement collection: {e}")
+            self.log_interaction("error", details=f"Mouse movement collection: {str(e)}")
+            return
+
+        for pos_x, pos_y, event_ms in events:
+            event_time = datetime.fromtimestamp(event_ms / 1000).strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
+            self.log_interaction("mouse_move", pos_x=pos_x, pos_y=pos_y, timestamp=event_time, url=page_url)
+
+
+    def setup_mouse_tracking(self):
+        self.driver.execute_script("""
+        if (window.__mouseEvents) { return; } // Listener already installed on this document
+        window.__mouseEvents = [];
+        document.addEventListener('mousemove', function(e) {
+            // Buffer every move with its own timestamp; capped so an undrained page can't grow forever
+            if (window.__mouseEvents.length < 10000) {
+                window.__mouseEvents.push([e.clientX, e.clientY, Date.now()]);
+            }
+        }, true); // Use capture phase
+        """)
+
+    def dwell_time(self, low, high):
+        """Seconds to spend on a human-like pause that the original crawler drew from uniform(low, high)."""
+        if WAIT_MODE == "fixed":
+            return random.uniform(low, high)
+        if DWELL_TIME_RANGE:
+            return random.uniform(*DWELL_TIME_RANGE)
+        return 0
+
+    def wait_for_network_idle(self, idle_time=NETWORK_IDLE_TIME, timeout=NETWORK_IDLE_TIMEOUT):
+        """
+        Waits until selenium-wire has captured no new request for `idle_time` seconds and
+        the latest one has its response. Only the last request is loaded on each poll.
+        """
+        deadline = time.monotonic() + timeout
+        last_id, last_change = None, time.monotonic()
+        while time.monotonic() < deadline:
+            try:
+                last_request = self.driver.last_request
+            except Exception:
+                return # Driver in a bad state, nothing to wait for
+            current_id = last_request.id if last_request else None
+            now = time.monotonic()
+            if current_id != last_id:
+                last_id, last_change = current_id, now
+            elif now - last_change >= idle_time and (last_request is None or last_request.response is not None):
+                return
             time.sleep(0.1)
-    except Exception as e:
-        print(f"Error during mouse movement collection: {e}")
-        log_interaction("error", details=f"Mouse movement collection: {str(e)}")
-
-
-def setup_mouse_tracking():
-    driver.execute_script("""
-    window.mouseX = null; // Initialize to null
-    window.mouseY = null;
-    document.addEventListener('mousemove', function(e) {
-        window.mouseX = e.clientX;
-        window.mouseY = e.clientY;
-    }, true); // Use capture phase
-    """)
-
-try:
-    # Create CSV files and write headers
-    with open(BEHAVIOR_LOG_FILE, 'w', newline='', encoding='utf-8') as f_behavior:
-        writer_behavior = csv.writer(f_behavior)
-        writer_behavior.writerow([
-            "timestamp", "url", "event_type",
-            "pos_x", "pos_y", "element_tag",
-            "element_text", "details"
-        ])
 
-    with open(NETWORK_LOG_FILE, 'w', newline='', encoding='utf-8') as f_network:
-        writer_network = csv.writer(f_network)
-        writer_network.writerow([
-            "capture_timestamp", "page_url", "associated_action",
-            "request_method", "request_url", "response_status", "response_reason",
-            "request_referer", "response_content_type", "request_body_snippet" # Changed headers
-        ])
+    def wait_until_settled(self, fixed_range):
+        """Waits for the page to finish loading and the network to go quiet (fixed mode: sleeps uniform(*fixed_range))."""
+        if WAIT_MODE == "fixed":
+            time.sleep(random.uniform(*fixed_range))
+            return
+        try:
+            WebDriverWait(self.driver, PAGE_READY_TIMEOUT, poll_frequency=0.1).until(
+                lambda d: d.execute_script("return document.readyState") == "complete"
+            )
+        except Exception:
+            pass # Log whatever has loaded so far
+        self.wait_for_network_idle()
 
-    for site_url in RECIPE_SITES:
-        print(f"Processing site: {site_url}")
+    def find_cookie_banner_button(self, timeout=COOKIE_BANNER_TIMEOUT):
+        """
+        Probes every selector in COOKIE_BANNER_SELECTORS with one script call, retrying
+        until `timeout`. Returns the first visible, enabled match in selector order, or None.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            banner_button = self.driver.execute_script("""
+            var selectors = arguments[0];
+            function usable(el) {
+                if (!el || el.disabled) { return false; }
+                var rect = el.getBoundingClientRect();
+                var style = window.getComputedStyle(el);
+                return rect.width > 0 && rect.height > 0 && style.visibility !== 'hidden' && style.display !== 'none';
+            }
+            for (var i = 0; i < selectors.length; i++) {
+                var matches = [];
+                try {
+                    if (selectors[i].indexOf('//') !== -1) { // XPath
+                        var snapshot = document.evaluate(selectors[i], document, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+                        for (var j = 0; j < snapshot.snapshotLength; j++) { matches.push(snapshot.snapshotItem(j)); }
+                    } else { // CSS Selector
+                        matches = document.querySelectorAll(selectors[i]);
+                    }
+                } catch (e) {
+                    continue; // Invalid selector in this browser
+                }
+                for (var k = 0; k < matches.length; k++) {
+                    if (usable(matches[k])) { return matches[k]; }
+                }
+            }
+            return null;
+            """, COOKIE_BANNER_SELECTORS)
+            if banner_button is not None or time.monotonic() >= deadline:
+                return banner_button
+            time.sleep(0.25)
+
+    def find_clickables(self):
+        """
+        Returns the visible, enabled clickables on the page from a single script call.
+        Each entry is a dict with the element handle plus its tag, text and bounding rect,
+        so callers don't need per-element is_displayed()/is_enabled()/text round trips.
+        """
+        return self.driver.execute_script("""
+        var found = [];
+        var elements = document.querySelectorAll(arguments[0]);
+        for (var i = 0; i < elements.length; i++) {
+            var el = elements[i];
+            if (el.disabled) { continue; }
+            var rect = el.getBoundingClientRect();
+            if (rect.width <= 0 || rect.height <= 0) { continue; }
+            var style = window.getComputedStyle(el);
+            if (style.visibility === 'hidden' || style.display === 'none') { continue; }
+            found.push({
+                element: el,
+                tag: el.tagName.toLowerCase(),
+                text: (el.innerText || el.value || '').replace(/\n/g, ' ').trim().substring(0, 100),
+                x: rect.left, y: rect.top, width: rect.width, height: rect.height
+            });
+        }
+        return found;
+        """, CLICKABLE_SELECTOR) or []
+
+    def process_site(self, site_url):
+        driver = self.driver
         try:
             del driver.requests
 
             driver.get(site_url)
-    
-            setup_mouse_tracking() # Setup mouse tracking for each new page
-
-            log_interaction("page_visit", details=f"Navigated to {site_url}")
-            time.sleep(random.uniform(2, 4)) # Allow page to load, initial scripts to run
-            log_network_requests(driver.current_url, "initial_page_load") # <-- Log network activity
-
-            collect_mouse_movements(random.uniform(3, 6))
-
-            # Attempt to handle cookie banners (very basic example)
-            cookie_banners_selectors = [
-                "button[id*='consent']", "button[class*='consent']",
-                "button[id*='cookie']", "button[class*='cookie']",
-                "div[aria-label*='cookie'] button",
-                "button:contains('Accept')", "button:contains('Agree')", # May need jQuery for :contains
-                "//button[contains(text(),'Accept') or contains(text(),'Agree') or contains(text(),'Got it')]" # XPath
-            ]
-            for selector in cookie_banners_selectors:
-                try:
-                    # Using a short timeout for cookie banners
-                    if "//" in selector: # XPath
-                         banner_button = WebDriverWait(driver, 3).until(
-                            EC.element_to_be_clickable((By.XPATH, selector))
-                        )
-                    else: # CSS Selector
-                        banner_button = WebDriverWait(driver, 3).until(
-                            EC.element_to_be_clickable((By.CSS_SELECTOR, selector))
-                        )
-                    if banner_button.is_displayed():
-                        log_interaction("attempt_cookie_banner_dismiss", banner_button)
-                        banner_button.click()
-                        log_interaction("cookie_banner_dismissed", banner_button)
-                        time.sleep(random.uniform(1, 2))
-                        log_network_requests(driver.current_url, "after_cookie_dismiss") # Log network after this
-                        break # Stop after first successful dismissal
-                except Exception:
-                    continue # Banner not found or not clickable with this selector
+
+            self.setup_mouse_tracking() # Setup mouse tracking for each new page
+
+            self.log_interaction("page_visit", details=f"Navigated to {site_url}")
+            self.wait_until_settled((2, 4)) # Allow page to load, initial scripts to run
+            time.sleep(self.dwell_time(0, 0)) # Optional post-load dwell (adaptive mode only; fixed mode already slept)
+            self.log_network_requests(driver.current_url, "initial_page_load") # <-- Log network activity
+
+            self.collect_mouse_movements(self.dwell_time(3, 6))
+
+            try:
+                banner_button = self.find_cookie_banner_button()
+                if banner_button is not None:
+                    self.log_interaction("attempt_cookie_banner_dismiss", banner_button)
+                    banner_button.click()
+                    self.log_interaction("cookie_banner_dismissed", banner_button)
+                    self.wait_until_settled((1, 2))
+                    self.log_network_requests(driver.current_url, "after_cookie_dismiss") # Log network after this
+            except Exception:
+                pass # Banner vanished or was not clickable
 
             clickables = []
             try:
-                clickables = WebDriverWait(driver, 10).until(
-                    EC.presence_of_all_elements_located((By.CSS_SELECTOR, "a, button, input[type='submit'], [role='button']"))
-                )
-                clickables = [el for el in clickables if el.is_displayed() and el.is_enabled()] # Filter for visible & enabled
+                # Visible & enabled only, filtered in the page
+                clickables = WebDriverWait(driver, 10, poll_frequency=0.25).until(lambda d: self.find_clickables())
             except Exception as e:
-                log_interaction("error", details=f"Could not find clickables on {driver.current_url}: {str(e)}")
+                self.log_interaction("error", details=f"Could not find clickables on {driver.current_url}: {str(e)}")
                 print(f"Warning: No clickable elements found on {driver.current_url} or error: {e}")
 
 
@@ -978,68 +1106,205 @@ try:
                 if not clickables:
                     break
                 try:
-                    element_to_click = random.choice(clickables)
-                    if not element_to_click.is_displayed() or not element_to_click.is_enabled():
-                        log_interaction("skip_interaction", element_to_click, details="Element not visible/enabled")
-                        clickables.remove(element_to_click) # Avoid re-selecting stale/hidden element
-                        continue
-
-                    action.move_to_element(element_to_click).perform()
-                    location = element_to_click.location_once_scrolled_into_view # Ensure it's in view
-                    size = element_to_click.size
-                    center_x = location['x'] + size['width']/2
-                    center_y = location['y'] + size['height']/2
-                    log_interaction("mouse_move_to_element", element_to_click, center_x, center_y)
-                    time.sleep(random.uniform(0.5, 1.0))
+                    clickable = random.choice(clickables)
+                    element_to_click = clickable['element']
+
+                    self.action.move_to_element(element_to_click).perform() # Also scrolls it into view
+                    center_x, center_y = driver.execute_script(
+                        "var r = arguments[0].getBoundingClientRect(); return [r.left + r.width / 2, r.top + r.height / 2];",
+                        element_to_click
+                    )
+                    self.log_interaction("mouse_move_to_element", pos_x=center_x, pos_y=center_y, element_info=clickable)
+                    time.sleep(self.dwell_time(0.5, 1.0))
 
                     # Clear requests before a click to isolate network activity for that click
                     del driver.requests
                     current_url_before_click = driver.current_url
                     element_to_click.click()
-                    log_interaction("click", element_to_click, center_x, center_y)
-                    time.sleep(random.uniform(2, 4)) # Wait for page to potentially reload or AJAX
-                    
+                    self.log_interaction("click", pos_x=center_x, pos_y=center_y, element_info=clickable)
+                    self.wait_until_settled((2, 4)) # Wait for page to potentially reload or AJAX
+
                     # Log network requests triggered by the click
                     # If URL changed, log with new URL, otherwise old one
                     page_after_click = driver.current_url if driver.current_url != current_url_before_click else current_url_before_click
-                    log_network_requests(page_after_click, f"after_click_{i+1}")
+                    self.log_network_requests(page_after_click, f"after_click_{i+1}")
 
-                    collect_mouse_movements(random.uniform(2, 4))
+                    self.collect_mouse_movements(self.dwell_time(2, 4))
 
                     # Update clickable elements list as page might have changed
-                    clickables = driver.find_elements(By.CSS_SELECTOR, "a, button, input[type='submit'], [role='button']")
-                    clickables = [el for el in clickables if el.is_displayed() and el.is_enabled()]
+                    clickables = self.find_clickables()
                 except Exception as e:
-                    log_interaction("error", details=f"Interaction failed: {str(e)}")
+                    self.log_interaction("error", details=f"Interaction failed: {str(e)}")
                     print(f"Interaction failed: {e}")
                     # If an error occurs, try to refresh the clickables list
                     try:
-                        clickables = driver.find_elements(By.CSS_SELECTOR, "a, button, input[type='submit'], [role='button']")
-                        clickables = [el for el in clickables if el.is_displayed() and el.is_enabled()]
+                        clickables = self.find_clickables()
                     except:
                         clickables = [] # Reset if page is too broken
                     continue
         except Exception as e:
             print(f"Major error processing site {site_url}: {e}")
-            log_interaction("error", details=f"Major error on site {site_url}: {str(e)}")
+            self.log_interaction("error", details=f"Major error on site {site_url}: {str(e)}")
             # Ensure driver.requests is cleared even on major site error
             try:
                 del driver.requests
             except:
                 pass # driver might already be dead
 
-finally:
-    # Save all collected data
-    with open(BEHAVIOR_LOG_FILE, 'a', newline='', encoding='utf-8') as f_behavior:
-        writer_behavior = csv.writer(f_behavior)
-        writer_behavior.writerows(behavior_data)
-
-    with open(NETWORK_LOG_FILE, 'a', newline='', encoding='utf-8') as f_network:
-        writer_network = csv.writer(f_network)
-        writer_network.writerows(network_data)
-
-    if driver:
-        driver.quit()
-    print(f"Data collection complete.")
-    print(f"Behavior log saved to: {BEHAVIOR_LOG_FILE} ({len(behavior_data)} records)")
-    print(f"Network log saved to: {NETWORK_LOG_FILE} ({len(network_data)} records)")
\ No newline at end of file
+    def flushed_offsets(self):
+        """Flushes both logs to disk and returns their sizes in bytes."""
+        return self.behavior_log.flush(), self.network_log.flush()
+
+    def run(self):
+        """Worker loop: drain the site queue, starting the browser only once there is a site for it."""
+        try:
+            while not self.stop_event.is_set():
+                try:
+                    self.session_id, site_url = self.site_queue.get_nowait()
+                except queue.Empty:
+                    break
+                if self.driver is None:
+                    try:
+                        self.driver = create_driver(**self.driver_options)
+                        self.action = ActionChains(self.driver)
+                    except Exception as e:
+                        print(f"[worker {self.worker_id}] Could not start browser: {e}")
+                        self.site_queue.put((self.session_id, site_url)) # Leave it for another worker
+                        return
+                print(f"[worker {self.worker_id}] Processing site {self.session_id}: {site_url}")
+                self.checkpoint.mark_started(self.session_id, site_url, self.flushed_offsets())
+                self.process_site(site_url)
+                self.checkpoint.mark_done(self.session_id, site_url, self.flushed_offsets())
+        finally:
+            if self.driver is not None:
+                try:
+                    self.driver.quit()
+                except Exception:
+                    pass # driver might already be dead
+
+
+def open_checkpoint(resume, output_folder, run_suffix):
+    """
+    With `resume`, reopens the latest checkpoint journal and cleans its logs up for
+    continuing; otherwise (or if there is nothing to resume) starts a new journal and log pair.
+    """
+    if resume:
+        checkpoint = CrawlCheckpoint.latest(output_folder, run_suffix)
+        if checkpoint is not None and checkpoint.behavior_log and os.path.isfile(checkpoint.behavior_log) \
+                and os.path.isfile(checkpoint.network_log):
+            checkpoint.repair_logs()
+            print(f"Resuming crawl from {checkpoint.path} ({len(checkpoint.completed)} sites already done)")
+            return checkpoint
+        print("Warning: No resumable checkpoint found, starting a new crawl.")
+
+    run_name = f"{TIMESTAMP_NOW}{run_suffix}"
+    checkpoint = CrawlCheckpoint.for_run(output_folder, run_name)
+    checkpoint.start_run(os.path.join(output_folder, f"behavior_log_{run_name}.csv"),
+                         os.path.join(output_folder, f"network_log_{run_name}.csv"))
+    return checkpoint
+
+
+def run_crawl(sites, num_browsers=NUM_BROWSERS, resume=False, output_folder=OUTPUT_FOLDER,
+              shard_index=0, shard_count=1, headless=HEADLESS, block_assets=BLOCK_ASSETS,
+              chromedriver_path=CHROMEDRIVER_PATH):
+    """
+    Crawls `sites` with a pool of `num_browsers` browsers sharing one site queue.
+    With shard_count > 1 only every shard_count-th site (starting at shard_index) is
+    crawled; session ids stay the positions in the full list, so shards never collide.
+    """
+    os.makedirs(output_folder, exist_ok=True)
+    run_suffix = f"_shard{shard_index}of{shard_count}" if shard_count > 1 else ""
+    checkpoint = open_checkpoint(resume, output_folder, run_suffix)
+    behavior_log_file, network_log_file = checkpoint.behavior_log, checkpoint.network_log
+
+    # Session ids are positions in the site list, so a resumed run must use the same list
+    site_queue = queue.Queue()
+    shard_sites = [(session_id, site_url) for session_id, site_url in enumerate(sites, start=1)
+                   if (session_id - 1) % shard_count == shard_index]
+    num_pending = 0
+    for session_id, site_url in shard_sites:
+        if not checkpoint.is_done(session_id, site_url):
+            site_queue.put((session_id, site_url))
+            num_pending += 1
+    if num_pending < len(shard_sites):
+        print(f"Skipping {len(shard_sites) - num_pending} completed sites, {num_pending} left.")
+
+    # One writer per log file, shared by all workers; rows carry their session id
+    behavior_log = BufferedCsvWriter(behavior_log_file, BEHAVIOR_LOG_HEADER, LOG_FLUSH_BATCH_SIZE, LOG_FLUSH_INTERVAL)
+    network_log = BufferedCsvWriter(network_log_file, NETWORK_LOG_HEADER, LOG_FLUSH_BATCH_SIZE, LOG_FLUSH_INTERVAL)
+
+    stop_event = threading.Event()
+    driver_options = {'headless': headless, 'block_assets': block_assets, 'chromedriver_path': chromedriver_path}
+    workers = [
+        CrawlWorker(i + 1, site_queue, stop_event, behavior_log, network_log, checkpoint, driver_options)
+        for i in range(max(1, min(num_browsers, num_pending)))
+    ]
+    threads = [threading.Thread(target=w.run, name=f"crawl-worker-{w.worker_id}", daemon=True) for w in workers]
+
+    try:
+        for t in threads:
+            t.start()
+        for t in threads:
+            # join with a timeout so Ctrl+C is still delivered to the main thread
+            while t.is_alive():
+                t.join(timeout=1.0)
+    except KeyboardInterrupt:
+        print("Interrupted, letting workers finish their current site (Ctrl+C again to abort)...")
+        stop_event.set()
+        try:
+            for t in threads:
+                while t.is_alive():
+                    t.join(timeout=1.0)
+        except KeyboardInterrupt:
+            pass # Unfinished sites are re-crawled by --resume
+    finally:
+        # Flush whatever is still buffered
+        behavior_log.close()
+        network_log.close()
+        print(f"Data collection complete.")
+        print(f"Behavior log saved to: {behavior_log_file} ({behavior_log.rows_written} records this run)")
+        print(f"Network log saved to: {network_log_file} ({network_log.rows_written} records this run)")
+
+
+def main(argv=None):
+    global WAIT_MODE, DWELL_TIME_RANGE
+    parser = argparse.ArgumentParser(description="Crawl recipe sites and log behavior/network events.")
+    parser.add_argument('--sites', metavar='FILE',
+                        help="Site list, one URL per line ('#' comments allowed). Defaults to RECIPE_SITES.")
+    parser.add_argument('--shard-index', type=int, default=0, help="Which shard of the site list to crawl (0-based).")
+    parser.add_argument('--shard-count', type=int, default=1, help="Number of shards the site list is split into.")
+    parser.add_argument('--browsers', type=int, default=NUM_BROWSERS, help="Parallel browser instances.")
+    parser.add_argument('--output-dir', default=OUTPUT_FOLDER, help="Folder for logs and checkpoints.")
+    parser.add_argument('--headless', action='store_true', default=HEADLESS, help="Run Chrome headless.")
+    parser.add_argument('--block-assets', action='store_true', default=BLOCK_ASSETS,
+                        help="Don't load images and fonts.")
+    parser.add_argument('--chromedriver', default=CHROMEDRIVER_PATH,
+                        help="Path to chromedriver (default: let Selenium Manager find it).")
+    parser.add_argument('--wait-mode', choices=['adaptive', 'fixed'], default=WAIT_MODE,
+                        help="Readiness-based waits or the original random sleeps.")
+    parser.add_argument('--dwell', nargs=2, type=float, metavar=('MIN', 'MAX'), default=DWELL_TIME_RANGE,
+                        help="Extra randomized dwell in seconds (adaptive mode).")
+    parser.add_argument('--resume', action='store_true',
+                        help="Continue the latest crawl for this output dir/shard, skipping sites it already finished.")
+    parser.add_argument('--benchmark-proxy', metavar='URL',
+                        help="Compare selenium-wire capture with and without proxy-side filtering on one page, then exit.")
+    args = parser.parse_args(argv)
+
+    if args.benchmark_proxy:
+        benchmark_proxy_filtering(args.benchmark_proxy, headless=args.headless, chromedriver_path=args.chromedriver)
+        return
+
+    if not 0 <= args.shard_index < args.shard_count:
+        parser.error("--shard-index must be between 0 and --shard-count - 1")
+
+    WAIT_MODE = args.wait_mode
+    DWELL_TIME_RANGE = tuple(args.dwell) if args.dwell else None
+    sites = load_site_list(args.sites) if args.sites else RECIPE_SITES
+
+    run_crawl(sites, args.browsers, resume=args.resume, output_folder=args.output_dir,
+              shard_index=args.shard_index, shard_count=args.shard_count, headless=args.headless,
+              block_assets=args.block_assets, chromedriver_path=args.chromedriver)
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
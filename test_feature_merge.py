@@ -0,0 +1,22 @@
+import pandas as pd
+
+from feature_merge import UrlKeyInterner, normalize_url
+
+
+def test_query_parameters_that_select_the_page_are_kept():
+    assert normalize_url('https://shop.com/item?id=1') != normalize_url('https://shop.com/item?id=2')
+    assert normalize_url('HTTPS://www.Shop.com:443/item/?id=2&color=red#reviews') == 'shop.com/item?color=red&id=2'
+
+
+def test_tracking_parameters_are_dropped():
+    assert normalize_url('https://www.example.com/recipes/?utm_source=x&UTM_Medium=y#top') == 'example.com/recipes'
+    assert normalize_url('https://shop.com/item?gclid=abc&id=2&fbclid=def') == 'shop.com/item?id=2'
+
+
+def test_items_of_one_shop_get_distinct_keys():
+    urls = pd.Series(['https://shop.com/item?id=1', 'https://shop.com/item?id=2',
+                      'https://www.shop.com/item?utm_campaign=sale&id=1', None])
+    keys = UrlKeyInterner().keys_for(urls)
+    assert keys[0] != keys[1]
+    assert keys[2] == keys[0]
+    assert keys[3] == -1
@@ -0,0 +1,19 @@
+import io
+
+from network_features import extract_network_features, load_network_log
+
+LOG = """session_id,capture_timestamp,page_url,associated_action,request_method,request_url,response_status,response_reason,request_referer,response_content_type,request_body_snippet
+0,2025-05-16T00:00:01,https://a.com/,load,GET,https://t.com/p,200,OK,N/A,text/html,N/A
+0,2025-05-16T00:00:02,https://a.com/,load,GET,https://t.com/q,200,OK,,text/html,
+0,2025-05-16T00:00:03,https://a.com/,load,POST,https://t.com/r,204,No Content,https://a.com/,,id=1
+0,2025-05-16T00:00:04,https://a.com/,load,GET,https://a.com/s,200,OK,https://x.com/,text/html,
+"""
+
+
+def test_na_referer_counts_as_missing():
+    features = extract_network_features(load_network_log(io.StringIO(LOG)), ['20250516_000000']).iloc[0]
+    assert features['net_num_requests_with_referer'] == 2
+    assert features['net_num_distinct_referers'] == 2
+    assert features['net_num_cross_origin_referer'] == 1
+    # Bodies keep counting the placeholder as a value
+    assert features['net_num_body_to_third_party'] == 2
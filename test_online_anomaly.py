@@ -0,0 +1,36 @@
+import numpy as np
+from sklearn.metrics import roc_auc_score
+
+from online_anomaly import HalfSpaceTrees, synthetic_sessions
+
+
+def stream(detector, X, first_batch, chunk_size=1000):
+    scores = [detector.score_update(X[:first_batch])]
+    scores += [detector.score_update(X[start:start + chunk_size]) for start in range(first_batch, len(X), chunk_size)]
+    return np.concatenate(scores)
+
+
+def test_small_first_batch_builds_the_same_trees():
+    # The crawler may hand over a single session first; the trees must not stay fitted to its range
+    df, is_anomaly = synthetic_sessions(20_000)
+    X = df.to_numpy()
+    whole_windows, one_session_first = HalfSpaceTrees(), HalfSpaceTrees()
+    expected = stream(whole_windows, X, first_batch=1000)
+    scores = stream(one_session_first, X, first_batch=1)
+
+    assert np.array_equal(one_session_first.split_values_, whole_windows.split_values_)
+    # From the second window on both score against the same reference counts
+    assert np.allclose(scores[1000:], expected[1000:])
+    assert roc_auc_score(is_anomaly[1000:], -scores[1000:]) > 0.95
+
+
+def test_memory_is_fixed_after_the_first_window():
+    df, _ = synthetic_sessions(5_000)
+    X = df.to_numpy()
+    detector = HalfSpaceTrees(window_size=500)
+    stream(detector, X[:500], first_batch=1, chunk_size=7)
+    assert detector.first_window_ is None
+    size = detector.memory_bytes()
+    stream(detector, X[500:], first_batch=3, chunk_size=250)
+    assert detector.memory_bytes() == size
+    assert detector.rows_seen_ == len(X)